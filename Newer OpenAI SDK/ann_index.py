@@ -0,0 +1,283 @@
+#------------------------------------#
+# Import Libraries
+#------------------------------------#
+import numpy as np
+from embedding_store import normalize_rows, top_k_from_scores
+from instrumentation import metrics
+
+#------------------------------------#
+# K-means on normalized vectors
+#------------------------------------#
+
+def assign_to_centroids(vectors, centroids, block_size=65536):
+    """
+    Returns the index of the most similar centroid (dot product) for each row.
+    Works in row blocks so the score matrix stays small.
+    """
+    assignments = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), block_size):
+        block = vectors[start:start + block_size]
+        assignments[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return assignments
+
+def spherical_kmeans(vectors, n_clusters, n_iter=20, seed=0):
+    """
+    K-means for L2-normalized vectors (centroids are re-normalized every step,
+    so cosine similarity is a dot product).
+
+    Parameters
+    ----------
+    vectors : numpy.ndarray of shape (n, dim)
+    n_clusters : int
+    n_iter : int, default=20
+    seed : int, default=0
+
+    Returns
+    -------
+    centroids : numpy.ndarray of shape (n_clusters, dim)
+    """
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), size=n_clusters, replace=False)].copy()
+
+    for _ in range(n_iter):
+        assignments = assign_to_centroids(vectors, centroids)
+        counts = np.bincount(assignments, minlength=n_clusters)
+
+        # Per-cluster sums with one sort + reduceat (much faster than np.add.at)
+        order = np.argsort(assignments, kind='stable')
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        non_empty = counts > 0
+        sums = np.zeros_like(centroids)
+        sums[non_empty] = np.add.reduceat(vectors[order], starts[non_empty], axis=0)
+
+        # Re-seed empty clusters with random points
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            sums[empty] = vectors[rng.choice(len(vectors), size=len(empty), replace=False)]
+
+        centroids = normalize_rows(sums)
+
+    return centroids
+
+#------------------------------------#
+# IVF Index
+#------------------------------------#
+
+class IVFIndex:
+    """
+    Inverted-file approximate nearest-neighbour index.
+
+    Vectors are clustered with k-means into `n_lists` lists. A query is only
+    scored against the vectors of the `n_probe` lists whose centroids are
+    closest to it, so a search touches roughly n_probe / n_lists of the corpus.
+
+    Parameters
+    ----------
+    n_lists : int
+        Number of k-means clusters. Around 4 * sqrt(n_rows) is a good start.
+    n_probe : int, default=8
+        Lists scanned per query. Higher means better recall and slower queries.
+    n_iter : int, default=20
+        K-means iterations used by `train`.
+    seed : int, default=0
+
+    Example
+    -------
+    >>> index = build_ivf_index(store, n_probe=16)
+    >>> indices, scores = index.search(query_embeddings, k=3)
+    >>> recall_at_k(index, store, query_embeddings, k=10)
+    """
+
+    def __init__(self, n_lists, n_probe=8, n_iter=20, seed=0):
+        self.n_lists = int(n_lists)
+        self.n_probe = int(n_probe)
+        self.n_iter = int(n_iter)
+        self.seed = seed
+        self.centroids = None
+        self._list_ids = [np.empty(0, dtype=np.int64) for _ in range(self.n_lists)]
+        self._list_vectors = None
+
+    def __len__(self):
+        return int(sum(len(ids) for ids in self._list_ids))
+
+    def train(self, vectors, max_training_points=256):
+        """
+        Learns the list centroids from (a sample of) the vectors. Raises
+        ValueError if there are fewer vectors than lists.
+
+        Parameters
+        ----------
+        vectors : numpy.ndarray of shape (n, dim)
+            L2-normalized vectors, e.g. `store.vectors`.
+        max_training_points : int, default=256
+            Points sampled per list for k-means.
+        """
+        if len(vectors) < self.n_lists:
+            raise ValueError(f"Cannot train {self.n_lists} lists on {len(vectors)} vectors")
+        rng = np.random.default_rng(self.seed)
+        n_sample = min(len(vectors), self.n_lists * max_training_points)
+        sample = vectors[np.sort(rng.choice(len(vectors), size=n_sample, replace=False))]
+        self.centroids = spherical_kmeans(np.asarray(sample, dtype=np.float32), self.n_lists,
+                                          n_iter=self.n_iter, seed=self.seed)
+        dim = self.centroids.shape[1]
+        self._list_vectors = [np.empty((0, dim), dtype=np.float32) for _ in range(self.n_lists)]
+        return self
+
+    def add(self, vectors, row_ids):
+        """
+        Inserts vectors into their nearest lists. Can be called repeatedly to
+        index new rows without retraining.
+
+        Parameters
+        ----------
+        vectors : numpy.ndarray of shape (n, dim)
+            L2-normalized vectors.
+        row_ids : array-like of int
+            Row ids of the vectors in the EmbeddingStore.
+        """
+        if self.centroids is None:
+            raise RuntimeError("IVFIndex must be trained before adding vectors")
+
+        vectors = np.asarray(vectors, dtype=np.float32)
+        row_ids = np.asarray(row_ids, dtype=np.int64)
+        assignments = assign_to_centroids(vectors, self.centroids)
+
+        # Group the new rows by list with one sort
+        order = np.argsort(assignments, kind='stable')
+        list_ids, starts = np.unique(assignments[order], return_index=True)
+        ends = np.append(starts[1:], len(order))
+
+        for list_id, start, end in zip(list_ids, starts, ends):
+            members = order[start:end]
+            self._list_ids[list_id] = np.concatenate([self._list_ids[list_id], row_ids[members]])
+            self._list_vectors[list_id] = np.concatenate([self._list_vectors[list_id], vectors[members]])
+
+        return self
+
+    def search(self, query_embeddings, k=3, n_probe=None):
+        """
+        Approximate top-k search.
+
+        Parameters
+        ----------
+        query_embeddings : array-like of shape (n_queries, dim)
+        k : int, default=3
+        n_probe : int, optional
+            Overrides the index default for this call.
+
+        Returns
+        -------
+        indices : numpy.ndarray of shape (n_queries, k)
+            Row ids, most similar first (-1 where fewer than k candidates were found).
+        scores : numpy.ndarray of shape (n_queries, k)
+        """
+        n_probe = min(self.n_probe if n_probe is None else int(n_probe), self.n_lists)
+        queries = normalize_rows(np.array(query_embeddings, dtype=np.float32))
+
+        # Lists to probe for every query
+        probe_lists, _ = top_k_from_scores(queries @ self.centroids.T, n_probe)
+
+        indices = np.full((len(queries), k), -1, dtype=np.int64)
+        scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+
+        for q, (query, lists) in enumerate(zip(queries, probe_lists)):
+            candidate_ids = np.concatenate([self._list_ids[l] for l in lists])
+            metrics.observe('ivf_index.candidates', len(candidate_ids))
+            if len(candidate_ids) == 0:
+                continue
+            candidate_vectors = np.concatenate([self._list_vectors[l] for l in lists])
+
+            best, best_scores = top_k_from_scores((candidate_vectors @ query)[None, :], k)
+            indices[q, :best.shape[1]] = candidate_ids[best[0]]
+            scores[q, :best.shape[1]] = best_scores[0]
+
+        return indices, scores
+
+    def save(self, path):
+        """
+        Saves the index to a single .npz file.
+        """
+        sizes = np.array([len(ids) for ids in self._list_ids], dtype=np.int64)
+        np.savez(
+            path,
+            params=np.array([self.n_lists, self.n_probe, self.n_iter, self.seed], dtype=np.int64),
+            centroids=self.centroids,
+            list_sizes=sizes,
+            ids=np.concatenate(self._list_ids),
+            vectors=np.concatenate(self._list_vectors),
+        )
+
+    @classmethod
+    def load(cls, path):
+        """
+        Loads an index written by `save`.
+        """
+        with np.load(path) as data:
+            n_lists, n_probe, n_iter, seed = (int(x) for x in data['params'])
+            index = cls(n_lists, n_probe=n_probe, n_iter=n_iter, seed=seed)
+            index.centroids = data['centroids']
+            offsets = np.concatenate([[0], np.cumsum(data['list_sizes'])])
+            ids, vectors = data['ids'], data['vectors']
+
+        index._list_ids = [ids[offsets[i]:offsets[i + 1]] for i in range(n_lists)]
+        index._list_vectors = [vectors[offsets[i]:offsets[i + 1]] for i in range(n_lists)]
+        return index
+
+#------------------------------------#
+# Build and evaluate
+#------------------------------------#
+
+def build_ivf_index(store, n_lists=None, n_probe=8, n_iter=20, seed=0):
+    """
+    Trains an IVFIndex on an EmbeddingStore and adds all of its rows.
+    Raises ValueError if the store is empty.
+
+    Parameters
+    ----------
+    store : EmbeddingStore
+    n_lists : int, optional
+        Defaults to 4 * sqrt(len(store)), and is capped at len(store).
+
+    Returns
+    -------
+    index : IVFIndex
+    """
+    if len(store) == 0:
+        raise ValueError("Cannot build an IVF index on an empty store")
+    if n_lists is None:
+        n_lists = int(4 * np.sqrt(len(store)))
+    n_lists = max(1, min(n_lists, len(store)))
+
+    index = IVFIndex(n_lists, n_probe=n_probe, n_iter=n_iter, seed=seed)
+    index.train(store.vectors)
+    index.add(store.vectors, np.arange(len(store)))
+    return index
+
+def recall_at_k(index, store, query_embeddings, k=10, n_probe=None):
+    """
+    Fraction of the exact top-k rows that the approximate index also returns.
+
+    Parameters
+    ----------
+    index : IVFIndex
+    store : EmbeddingStore
+        Used for the exact brute-force reference.
+    query_embeddings : array-like of shape (n_queries, dim)
+    k : int, default=10
+    n_probe : int, optional
+
+    Returns
+    -------
+    recall : float
+        1.0 means the index returned exactly the same rows as the exact scan.
+
+    Example
+    -------
+    >>> for n_probe in [1, 4, 16, 64]:
+    >>>     print(n_probe, recall_at_k(index, store, sample_queries, k=10, n_probe=n_probe))
+    """
+    exact, _ = store.search(query_embeddings, k=k)
+    approx, _ = index.search(query_embeddings, k=k, n_probe=n_probe)
+
+    hits = sum(len(np.intersect1d(e, a)) for e, a in zip(exact, approx))
+    return hits / exact.size
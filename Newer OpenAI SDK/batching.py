@@ -0,0 +1,203 @@
+#------------------------------------#
+# Import Libraries
+#------------------------------------#
+import numpy as np
+from functools import lru_cache
+
+try:
+    import tiktoken
+except ImportError: # fall back to the byte-based upper bound
+    tiktoken = None
+
+# Limits of the OpenAI embeddings endpoint
+MAX_TOKENS_PER_ITEM = 8191
+MAX_TOKENS_PER_REQUEST = 300000
+MAX_ITEMS_PER_REQUEST = 2048
+
+#------------------------------------#
+# Token counting
+#------------------------------------#
+
+@lru_cache(maxsize=None)
+def get_encoding(embed_model):
+    """
+    tiktoken encoding for a model, or None if tiktoken is not installed.
+    """
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(embed_model)
+    except KeyError:
+        return tiktoken.get_encoding('cl100k_base')
+
+def count_tokens(texts, embed_model='text-embedding-3-small'):
+    """
+    Number of tokens of each text: exact with tiktoken, otherwise the UTF-8
+    length in bytes. Every token covers at least one byte, so the fallback
+    never undercounts (digits, CJK) and chunks stay under the API limits,
+    but it overestimates English text about 4x: install tiktoken.
+
+    Parameters
+    ----------
+    texts : list of str
+    embed_model : str
+
+    Returns
+    -------
+    counts : list of int
+    """
+    encoding = get_encoding(embed_model)
+    if encoding is None:
+        return [len(t.encode('utf-8')) for t in texts]
+    return [len(tokens) for tokens in encoding.encode_ordinary_batch(texts)]
+
+def split_by_tokens(text, max_tokens, embed_model='text-embedding-3-small'):
+    """
+    Splits a text into consecutive pieces of at most `max_tokens` tokens.
+    """
+    encoding = get_encoding(embed_model)
+    if encoding is None:
+        return split_by_bytes(text, max_tokens)
+    tokens = encoding.encode_ordinary(text)
+    return [encoding.decode(tokens[i:i + max_tokens]) for i in range(0, len(tokens), max_tokens)] or ['']
+
+def split_by_bytes(text, max_bytes):
+    """
+    Splits a text into consecutive pieces of at most `max_bytes` UTF-8 bytes,
+    without cutting a character.
+    """
+    data = text.encode('utf-8')
+    pieces, start = [], 0
+    while start < len(data):
+        end = min(start + max_bytes, len(data))
+        while end < len(data) and end > start + 1 and (data[end] & 0xC0) == 0x80:
+            end -= 1 # back up to the first byte of a character
+        pieces.append(data[start:end].decode('utf-8'))
+        start = end
+    return pieces or ['']
+
+#------------------------------------#
+# Oversized chunks and packing
+#------------------------------------#
+
+def prepare_inputs(texts, embed_model='text-embedding-3-small', max_tokens_per_item=MAX_TOKENS_PER_ITEM,
+                   oversize_policy='truncate'):
+    """
+    Applies the oversize policy to chunks longer than the model's input limit.
+
+    Parameters
+    ----------
+    texts : list of str
+    embed_model : str
+    max_tokens_per_item : int, default=8191
+    oversize_policy : {'truncate', 'split', 'error'}, default='truncate'
+        'truncate' keeps the first `max_tokens_per_item` tokens, 'split'
+        embeds every piece and averages them (weighted by token count),
+        'error' raises ValueError.
+
+    Returns
+    -------
+    pieces : list of str
+        Texts to send.
+    sources : list of int
+        Index into `texts` of each piece.
+    token_counts : list of int
+        Tokens of each piece.
+    """
+    if oversize_policy not in ('truncate', 'split', 'error'):
+        raise ValueError(f"Unknown oversize_policy: {oversize_policy}")
+
+    pieces, sources, token_counts = [], [], []
+
+    for i, (text, n_tokens) in enumerate(zip(texts, count_tokens(texts, embed_model))):
+        if n_tokens <= max_tokens_per_item:
+            pieces.append(text)
+            sources.append(i)
+            token_counts.append(n_tokens)
+            continue
+
+        if oversize_policy == 'error':
+            raise ValueError(f"Chunk {i} has {n_tokens} tokens, above the limit of {max_tokens_per_item}")
+
+        parts = split_by_tokens(text, max_tokens_per_item, embed_model)
+        if oversize_policy == 'truncate':
+            parts = parts[:1]
+        for part, part_tokens in zip(parts, count_tokens(parts, embed_model)):
+            pieces.append(part)
+            sources.append(i)
+            token_counts.append(min(part_tokens, max_tokens_per_item))
+
+    return pieces, sources, token_counts
+
+def pack_batches(token_counts, max_tokens_per_request=MAX_TOKENS_PER_REQUEST, max_items=MAX_ITEMS_PER_REQUEST):
+    """
+    Packs items, in order, into as few requests as possible without going
+    over the per-request token and item limits.
+
+    Parameters
+    ----------
+    token_counts : list of int
+    max_tokens_per_request : int, default=300000
+    max_items : int, default=2048
+
+    Returns
+    -------
+    batches : list of list of int
+        Item indices of each request.
+    """
+    batches = []
+    current, current_tokens = [], 0
+
+    for i, n_tokens in enumerate(token_counts):
+        if current and (len(current) >= max_items or current_tokens + n_tokens > max_tokens_per_request):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(i)
+        current_tokens += n_tokens
+
+    if current:
+        batches.append(current)
+    return batches
+
+def merge_pieces(embeddings, sources, token_counts, n_texts):
+    """
+    Combines the embeddings of the pieces back into one vector per text.
+    Split texts get the token-weighted mean of their pieces; the others keep
+    their embedding as is (even an empty text with 0 tokens).
+
+    Parameters
+    ----------
+    embeddings : list
+        One embedding (or None if its request failed) per piece.
+    sources, token_counts : list of int
+        As returned by `prepare_inputs`.
+    n_texts : int
+
+    Returns
+    -------
+    merged : list
+        One embedding per text; None if any of its pieces is missing.
+    """
+    merged = [None] * n_texts
+    weights = [0] * n_texts
+    n_pieces = np.bincount(np.asarray(sources, dtype=np.int64), minlength=n_texts)
+    failed = set()
+
+    for emb, src, n_tokens in zip(embeddings, sources, token_counts):
+        if emb is None:
+            failed.add(src)
+            continue
+        emb = np.asarray(emb, dtype=np.float32)
+        if n_pieces[src] == 1:
+            merged[src], weights[src] = emb, 1
+            continue
+        n_tokens = max(n_tokens, 1)
+        merged[src] = emb * n_tokens if merged[src] is None else merged[src] + emb * n_tokens
+        weights[src] += n_tokens
+
+    for src in range(n_texts):
+        if src in failed:
+            merged[src] = None
+        elif merged[src] is not None:
+            merged[src] = merged[src] / max(weights[src], 1)
+    return merged
@@ -0,0 +1,58 @@
+#------------------------------------#
+# Import Libraries
+#------------------------------------#
+import time
+import random
+import argparse
+from preprocess_text import break_and_clean
+from chunking import Chunker, chunk_documents
+
+#------------------------------------#
+# Chunking throughput benchmark
+#------------------------------------#
+
+WORDS = ('the report shows inventory sales order customer invoice item warehouse '
+         'shipment quantity price vendor account ledger balance total date').split()
+
+def synthetic_documents(n_docs=500, sentences_per_doc=200, seed=0):
+    """
+    Documents of random sentences, shaped like extracted records.
+    """
+    rng = random.Random(seed)
+    docs = []
+    for i in range(n_docs):
+        sentences = []
+        for _ in range(sentences_per_doc):
+            words = rng.choices(WORDS, k=rng.randint(6, 30))
+            sentences.append(' '.join(words).capitalize() + rng.choice(['.', '.', '.', '?', '!']))
+        docs.append({'file': f'doc_{i}.htm', 'text': ' '.join(sentences), 'title': f'Doc {i}'})
+    return docs
+
+def run(name, fn, docs):
+    n_bytes = sum(len(d['text']) for d in docs)
+    start = time.perf_counter()
+    chunks = fn(docs)
+    elapsed = time.perf_counter() - start
+    print(f"{name:<32} {elapsed:8.2f} s {len(docs) / elapsed:10.1f} docs/s "
+          f"{n_bytes / elapsed / 1024**2:8.2f} MB/s {len(chunks):8d} chunks")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare chunking throughput.')
+    parser.add_argument('--docs', type=int, default=500)
+    parser.add_argument('--sentences', type=int, default=200)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--max-tokens', type=int, default=256)
+    parser.add_argument('--overlap', type=int, default=32)
+    args = parser.parse_args()
+
+    docs = synthetic_documents(args.docs, args.sentences)
+    regex = Chunker(args.max_tokens, args.overlap, splitter='regex')
+    punkt = Chunker(args.max_tokens, args.overlap, splitter='punkt')
+
+    try:
+        run('break_and_clean (punkt, 10 sent.)', break_and_clean, docs)
+        run('Chunker punkt, 1 process', lambda d: chunk_documents(d, punkt, workers=1), docs)
+    except LookupError as e:
+        print(f"Skipping punkt runs, tokenizer data not available: {e}")
+    run('Chunker regex, 1 process', lambda d: chunk_documents(d, regex, workers=1), docs)
+    run('Chunker regex, all processes', lambda d: chunk_documents(d, regex, workers=args.workers), docs)
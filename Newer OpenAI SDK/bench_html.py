@@ -0,0 +1,79 @@
+#------------------------------------#
+# Import Libraries
+#------------------------------------#
+import os
+import time
+import random
+import argparse
+import numpy as np
+from extract_text import parse_html, lxml, list_files, decode_html
+
+#------------------------------------#
+# HTML parsing throughput benchmark
+#------------------------------------#
+
+WORDS = ('the report shows inventory sales order customer invoice item warehouse '
+         'shipment quantity price vendor account ledger balance total date').split()
+
+def synthetic_page(rng, n_sections=40):
+    """
+    An HTML help page with headings, paragraphs, tables, images and scripts.
+    """
+    body = []
+    for i in range(n_sections):
+        level = rng.randint(1, 4)
+        body.append(f'<h{level}>Section <b>{i}</b></h{level}>')
+        for _ in range(rng.randint(1, 4)):
+            body.append('<p>' + ' '.join(rng.choices(WORDS, k=rng.randint(20, 80))) + '.</p>')
+        if rng.random() < 0.3:
+            body.append(f'<img src="images/fig_{i}.gif" alt="figure">')
+        if rng.random() < 0.2:
+            body.append('<table>' + '<tr><td>cell</td><td>&nbsp;42</td></tr>' * 5 + '</table>')
+        if rng.random() < 0.1:
+            body.append('<script>var x = "not text";</script><!-- comment -->')
+    return ('<html><head><title>Synthetic page</title><style>p {margin: 0}</style></head><body>'
+            + '\n'.join(body) + '</body></html>')
+
+def load_folder(folder_path):
+    """
+    The decoded .htm files of a real corpus, as `extract_html_file` reads them.
+    """
+    pages = []
+    for file_path in list_files(folder_path, '.htm'):
+        with open(file_path, 'rb') as f:
+            pages.append(decode_html(f.read(), os.path.dirname(file_path))[0])
+    return pages
+
+def run(name, pages, parser):
+    n_bytes = sum(len(p) for p in pages)
+    results, durations = [], []
+    for page in pages:
+        start = time.perf_counter()
+        results.append(parse_html(page, parser=parser))
+        durations.append(time.perf_counter() - start)
+    elapsed = sum(durations)
+    p50, p95 = np.percentile(durations, [50, 95]) * 1000
+    print(f"{name:<14} {elapsed:8.2f} s {len(pages) / elapsed:10.1f} pages/s {n_bytes / elapsed / 1024**2:8.2f} MB/s "
+          f"  per page p50 {p50:7.2f} ms  p95 {p95:7.2f} ms")
+    return results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare HTML metadata extraction throughput.')
+    parser.add_argument('--pages', type=int, default=500)
+    parser.add_argument('--folder', default=None, help='Parse the .htm files of this corpus instead of synthetic pages.')
+    args = parser.parse_args()
+
+    if args.folder:
+        pages = load_folder(args.folder)
+        print(f"{len(pages)} pages from {args.folder}")
+    else:
+        rng = random.Random(0)
+        pages = [synthetic_page(rng) for _ in range(args.pages)]
+
+    reference = run('BeautifulSoup', pages, 'bs4')
+    if lxml is None:
+        print("lxml is not installed, skipping the single-pass extractor")
+    else:
+        results = run('lxml', pages, 'lxml')
+        mismatches = sum(r != ref for r, ref in zip(results, reference))
+        print(f"{mismatches} of {len(pages)} pages differ between the two extractors")
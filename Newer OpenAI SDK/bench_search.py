@@ -0,0 +1,95 @@
+#------------------------------------#
+# Import Libraries
+#------------------------------------#
+import os
+import time
+import argparse
+import numpy as np
+from benchmarks import make_embeddings, percentiles
+from embedding_store import EmbeddingStore
+from sharded_search import ShardedSearch
+from lexical_index import BM25Index
+from hybrid_search import hybrid_search
+
+#------------------------------------#
+# Exact search latency against core count
+#------------------------------------#
+
+def latencies(search, queries, k, batch):
+    """
+    Seconds per call of `search` over the queries, `batch` queries per call.
+    """
+    samples = []
+    for start in range(0, len(queries), batch):
+        begin = time.perf_counter()
+        search(queries[start:start + batch], k)
+        samples.append(time.perf_counter() - begin)
+    return samples
+
+def synthetic_texts(n, words_per_text=60, vocabulary=20000, seed=0):
+    """
+    Texts of Zipf-distributed words ("w17 w3 w1204 ..."), shaped like chunk
+    texts for the lexical index.
+    """
+    rng = np.random.default_rng(seed)
+    words = np.minimum(rng.zipf(1.3, size=(n, words_per_text)), vocabulary)
+    return [' '.join(f"w{w}" for w in row) for row in words]
+
+def run(name, search, queries, k, batch):
+    search(queries[:batch], k) # warm up (page in a memory-mapped matrix, start threads)
+    p = percentiles(latencies(search, queries, k, batch))
+    print(f"{name:<16} p50 {p['p50'] * 1000:8.2f} ms   p95 {p['p95'] * 1000:8.2f} ms   "
+          f"p99 {p['p99'] * 1000:8.2f} ms")
+    return p
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Exact search latency against the number of cores. '
+                                                 'Run with OPENBLAS_NUM_THREADS=1 to isolate the sharding.')
+    parser.add_argument('--vectors', type=int, default=1000000)
+    parser.add_argument('--dim', type=int, default=1536)
+    parser.add_argument('--queries', type=int, default=50)
+    parser.add_argument('--batch', type=int, default=1, help='Queries per search call.')
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--workers', type=int, nargs='+', default=None,
+                        help='Thread counts to try (default: 1, 2, 4, ... up to the core count).')
+    parser.add_argument('--index', default=None, help='Search this saved index instead of synthetic vectors.')
+    parser.add_argument('--hybrid', action='store_true',
+                        help='Compare vector-only and hybrid BM25 + vector latency instead of core counts.')
+    args = parser.parse_args()
+
+    if args.index:
+        store = EmbeddingStore.open(args.index)
+        queries = np.array(store.vectors[np.random.default_rng(1).choice(len(store), args.queries)])
+    else:
+        store = EmbeddingStore(args.dim, capacity=args.vectors)
+        store.add(make_embeddings(args.vectors, args.dim), [{} for _ in range(args.vectors)])
+        queries = make_embeddings(args.queries, args.dim, seed=1)
+
+    cores = os.cpu_count() or 1
+    workers = args.workers or sorted({2 ** i for i in range(cores.bit_length()) if 2 ** i <= cores} | {cores})
+    print(f"{len(store)} rows x {store.dim}, {cores} cores, batch of {args.batch}")
+
+    if args.hybrid:
+        texts = store.metadata['text'].tolist() if args.index else synthetic_texts(len(store))
+        start = time.perf_counter()
+        bm25 = BM25Index().build(texts)
+        print(f"BM25 index: {len(bm25.vocabulary)} terms, {bm25.weights.nnz} postings, "
+              f"built in {time.perf_counter() - start:.1f} s")
+
+        # Query texts of 4 words drawn from random rows; searches get batches of query positions
+        rng = np.random.default_rng(2)
+        query_texts = [' '.join(rng.choice(texts[i].split() or [''], size=4))
+                       for i in rng.choice(len(texts), len(queries))]
+        positions = np.arange(len(queries))
+        run('vector only', lambda p, k: store.search(queries[p], k), positions, args.k, args.batch)
+        run('BM25 only', lambda p, k: bm25.search([query_texts[i] for i in p], k), positions, args.k, args.batch)
+        run('hybrid (RRF)', lambda p, k: hybrid_search(store.search, bm25, [query_texts[i] for i in p], queries[p], k=k),
+            positions, args.k, args.batch)
+    else:
+        expected = store.search(queries, args.k)
+        run('serial', store.search, queries, args.k, args.batch)
+        for n in workers:
+            with ShardedSearch(store, workers=n) as sharded:
+                result = sharded.search(queries, args.k)
+                assert all(np.array_equal(a, b) for a, b in zip(result, expected)), 'sharded results differ'
+                run(f'{n} workers', sharded.search, queries, args.k, args.batch)
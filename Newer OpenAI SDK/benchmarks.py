@@ -0,0 +1,308 @@
+#------------------------------------#
+# Import Libraries
+#------------------------------------#
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import platform
+import argparse
+import tempfile
+import tracemalloc
+import numpy as np
+from multiprocessing import cpu_count
+from bench_html import synthetic_page
+from extract_text import process_files_parallel
+from chunking import Chunker, chunk_documents
+from create_embeddings import embed_texts
+from embedding_backends import LocalBackend
+from embedding_scheduler import EmbeddingScheduler
+from embedding_store import EmbeddingStore, normalize_rows
+from index_writer import IndexWriter
+from pipeline import run_pipeline
+
+#------------------------------------#
+# Synthetic data
+#------------------------------------#
+
+def write_simple_pdf(path, pages):
+    """
+    Writes a minimal text-only PDF with one line of Helvetica per page.
+    """
+    n = len(pages)
+    objects = ['<< /Type /Catalog /Pages 2 0 R >>',
+               '<< /Type /Pages /Kids [%s] /Count %d >>' % (' '.join(f'{3 + 2 * i} 0 R' for i in range(n)), n)]
+    font = 3 + 2 * n
+    for i, text in enumerate(pages):
+        text = text.replace('\\', '').replace('(', '').replace(')', '')
+        stream = f'BT /F1 10 Tf 72 720 Td ({text}) Tj ET'
+        objects.append(f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents {4 + 2 * i} 0 R '
+                       f'/Resources << /Font << /F1 {font} 0 R >> >> >>')
+        objects.append(f'<< /Length {len(stream)} >>\nstream\n{stream}\nendstream')
+    objects.append('<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>')
+
+    out = bytearray(b'%PDF-1.4\n')
+    offsets = []
+    for i, obj in enumerate(objects):
+        offsets.append(len(out))
+        out += f'{i + 1} 0 obj\n{obj}\nendobj\n'.encode('latin-1')
+    xref = len(out)
+    out += f'xref\n0 {len(objects) + 1}\n0000000000 65535 f \n'.encode('latin-1')
+    for offset in offsets:
+        out += f'{offset:010d} 00000 n \n'.encode('latin-1')
+    out += f'trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n'.encode('latin-1')
+    with open(path, 'wb') as f:
+        f.write(out)
+
+def make_corpus(path, n_html=200, n_pdf=20, pdf_pages=20, seed=0):
+    """
+    Writes a reproducible corpus of HTML help pages and text PDFs in
+    nested folders under `path`.
+    """
+    rng = random.Random(seed)
+    for i in range(n_html):
+        folder = os.path.join(path, f'section_{i % 8}')
+        os.makedirs(folder, exist_ok=True)
+        with open(os.path.join(folder, f'page_{i}.htm'), 'w', encoding='utf-8') as f:
+            f.write(synthetic_page(rng))
+    for i in range(n_pdf):
+        folder = os.path.join(path, 'manuals')
+        os.makedirs(folder, exist_ok=True)
+        pages = [' '.join(rng.choices(['invoice', 'order', 'item', 'vendor', 'total', 'posted'], k=60)) + '.'
+                 for _ in range(pdf_pages)]
+        write_simple_pdf(os.path.join(folder, f'manual_{i}.pdf'), pages)
+    return path
+
+def make_embeddings(n, dim, n_clusters=64, noise=0.5, seed=0):
+    """
+    Normalized float32 vectors drawn around random cluster centres (real
+    embeddings are clustered too, which matters for approximate search).
+    """
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((n_clusters, dim)).astype(np.float32)
+    vectors = centres[rng.integers(0, n_clusters, n)] + noise * rng.standard_normal((n, dim)).astype(np.float32)
+    return normalize_rows(vectors)
+
+#------------------------------------#
+# Measurement helpers
+#------------------------------------#
+
+def percentiles(samples):
+    """
+    p50, p95, p99, mean and max of a list of durations (seconds).
+    """
+    samples = np.asarray(samples, dtype=np.float64)
+    return {
+        'p50': float(np.percentile(samples, 50)),
+        'p95': float(np.percentile(samples, 95)),
+        'p99': float(np.percentile(samples, 99)),
+        'mean': float(samples.mean()),
+        'max': float(samples.max()),
+    }
+
+def measure(fn, repeats=3, items=None, nbytes=None, memory=True):
+    """
+    Runs `fn` `repeats` times and reports the timings, the throughput of the
+    median run and (in one extra run under tracemalloc) the peak Python heap
+    allocation. Memory of worker processes is not included.
+    """
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+
+    result = {'seconds': percentiles(times), 'repeats': repeats}
+    median = result['seconds']['p50']
+    if items is not None:
+        result['items'] = items
+        result['items_per_second'] = items / median
+    if nbytes is not None:
+        result['mb_per_second'] = nbytes / median / 1024**2
+
+    if memory:
+        tracemalloc.start()
+        fn()
+        result['peak_memory_mb'] = tracemalloc.get_traced_memory()[1] / 1024**2
+        tracemalloc.stop()
+    return result
+
+#------------------------------------#
+# Suite
+#------------------------------------#
+
+def run_suite(n_html=200, n_pdf=20, n_vectors=100000, dim=1536, n_queries=200, k=10, workers=None,
+              repeats=3, memory=True, seed=0, stages=None):
+    """
+    Runs the benchmark stages on synthetic data and returns the results.
+
+    Stages: extract, chunk, embed (LocalBackend, no network), write,
+    search (exact, with per-query latency percentiles) and end_to_end
+    (`run_pipeline` from files to index).
+
+    Returns
+    -------
+    results : dict
+        'config', 'environment' and one entry per stage.
+    """
+    workers = workers or cpu_count()
+    stages = set(stages or ['extract', 'chunk', 'embed', 'write', 'search', 'end_to_end'])
+    config = {'n_html': n_html, 'n_pdf': n_pdf, 'n_vectors': n_vectors, 'dim': dim, 'n_queries': n_queries,
+              'k': k, 'workers': workers, 'repeats': repeats, 'seed': seed}
+    results = {
+        'config': config,
+        'environment': {'python': platform.python_version(), 'numpy': np.__version__,
+                        'platform': platform.platform(), 'cpu_count': cpu_count()},
+        'stages': {},
+    }
+    tmp = tempfile.mkdtemp(prefix='embeddings_bench_')
+    backend = LocalBackend(dim=dim, seed=seed)
+    chunker = Chunker(max_tokens=256, overlap_tokens=32, splitter='regex')
+
+    def record(name, result):
+        results['stages'][name] = result
+        throughput = result.get('items_per_second')
+        print(f"{name:<12} p50 {result['seconds']['p50']:8.3f} s"
+              + (f" {throughput:12.1f} items/s" if throughput else '')
+              + (f" peak {result['peak_memory_mb']:8.1f} MB" if 'peak_memory_mb' in result else ''))
+
+    try:
+        corpus = make_corpus(os.path.join(tmp, 'corpus'), n_html, n_pdf, seed=seed)
+        docs = list(process_files_parallel(corpus, workers=workers))
+        chunks = chunk_documents(docs, chunker, workers=1)
+        texts = [c['text'] for c in chunks]
+        corpus_bytes = sum(len(d['text']) for d in docs)
+
+        if 'extract' in stages:
+            record('extract', measure(lambda: list(process_files_parallel(corpus, workers=workers)),
+                                      repeats, items=len(docs), nbytes=corpus_bytes, memory=memory))
+        if 'chunk' in stages:
+            record('chunk', measure(lambda: chunk_documents(docs, chunker, workers=1),
+                                    repeats, items=len(docs), nbytes=corpus_bytes, memory=memory))
+        if 'embed' in stages:
+            scheduler = EmbeddingScheduler(backend)
+            record('embed', measure(lambda: embed_texts(texts, scheduler=scheduler, show_progress=False),
+                                    repeats, items=len(texts), memory=memory))
+
+        vectors = make_embeddings(n_vectors, dim, seed=seed)
+        if 'write' in stages:
+            def write():
+                index_path = os.path.join(tmp, 'written')
+                shutil.rmtree(index_path, ignore_errors=True)
+                with IndexWriter(index_path) as writer:
+                    for start in range(0, n_vectors, 10000):
+                        writer.append(vectors[start:start + 10000],
+                                      [{'text': str(i)} for i in range(start, min(start + 10000, n_vectors))])
+            record('write', measure(write, repeats, items=n_vectors, nbytes=vectors.nbytes, memory=memory))
+
+        if 'search' in stages:
+            store = EmbeddingStore(dim, capacity=n_vectors)
+            store.add(vectors, [{'row': i} for i in range(n_vectors)])
+            queries = make_embeddings(n_queries, dim, seed=seed + 1)
+            latencies = []
+            for q in queries:
+                start = time.perf_counter()
+                store.search(q[None, :], k=k)
+                latencies.append(time.perf_counter() - start)
+            result = measure(lambda: store.search(queries, k=k), repeats, items=n_queries, memory=memory)
+            result['query_latency'] = percentiles(latencies)
+            result['single_queries_per_second'] = n_queries / sum(latencies)
+            record('search', result)
+
+        if 'end_to_end' in stages:
+            def end_to_end():
+                index_path = os.path.join(tmp, 'pipeline_index')
+                shutil.rmtree(index_path, ignore_errors=True)
+                run_pipeline(corpus, index_path, workers=workers, scheduler=EmbeddingScheduler(backend),
+                             chunker=chunker)
+            record('end_to_end', measure(end_to_end, repeats, items=n_html + n_pdf, nbytes=corpus_bytes,
+                                         memory=memory))
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    return results
+
+#------------------------------------#
+# Comparing runs
+#------------------------------------#
+
+# Metric -> True if larger is better
+COMPARED_METRICS = {
+    ('seconds', 'p50'): False,
+    ('items_per_second',): True,
+    ('query_latency', 'p95'): False,
+    ('peak_memory_mb',): False,
+}
+
+def compare_results(current, baseline, threshold=0.10):
+    """
+    Compares two runs stage by stage.
+
+    Parameters
+    ----------
+    current, baseline : dict
+        Outputs of `run_suite`.
+    threshold : float, default=0.10
+        Relative change counted as a regression or an improvement.
+
+    Returns
+    -------
+    rows : list of dict
+        stage, metric, baseline, current, change (relative) and status
+        ('regression', 'improvement' or 'same').
+    """
+    rows = []
+    for stage, result in current['stages'].items():
+        old = baseline.get('stages', {}).get(stage)
+        if old is None:
+            continue
+        for path, higher_is_better in COMPARED_METRICS.items():
+            new_value, old_value = result, old
+            for key in path:
+                new_value = new_value.get(key) if isinstance(new_value, dict) else None
+                old_value = old_value.get(key) if isinstance(old_value, dict) else None
+            if new_value is None or not old_value:
+                continue
+            change = (new_value - old_value) / old_value
+            better = change > 0 if higher_is_better else change < 0
+            status = 'same' if abs(change) < threshold else ('improvement' if better else 'regression')
+            rows.append({'stage': stage, 'metric': '.'.join(path), 'baseline': old_value,
+                         'current': new_value, 'change': change, 'status': status})
+    return rows
+
+def print_comparison(rows):
+    for row in rows:
+        print(f"{row['stage']:<12} {row['metric']:<20} {row['baseline']:12.4g} -> {row['current']:12.4g} "
+              f"{row['change']:+8.1%} {row['status']}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Reproducible benchmarks of every stage on synthetic data.')
+    parser.add_argument('--html', type=int, default=200, help='Synthetic HTML pages.')
+    parser.add_argument('--pdf', type=int, default=20, help='Synthetic PDF files.')
+    parser.add_argument('--vectors', type=int, default=100000, help='Rows of the synthetic embedding matrix.')
+    parser.add_argument('--dim', type=int, default=1536)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--stages', nargs='+', default=None)
+    parser.add_argument('--no-memory', action='store_true', help='Skip the tracemalloc run of each stage.')
+    parser.add_argument('--output', default=None, help='Write the results to this JSON file.')
+    parser.add_argument('--compare', default=None, help='JSON file of an earlier run to compare against.')
+    parser.add_argument('--threshold', type=float, default=0.10)
+    args = parser.parse_args()
+
+    results = run_suite(args.html, args.pdf, args.vectors, args.dim, args.queries, args.k, args.workers,
+                        args.repeats, not args.no_memory, args.seed, args.stages)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            rows = compare_results(results, json.load(f), args.threshold)
+        print_comparison(rows)
+        if any(row['status'] == 'regression' for row in rows):
+            sys.exit(1)
@@ -0,0 +1,223 @@
+#------------------------------------#
+# Import Libraries
+#------------------------------------#
+import re
+from functools import lru_cache
+from multiprocessing import Pool
+import nltk
+from batching import count_tokens
+
+#------------------------------------#
+# Sentence splitters
+#------------------------------------#
+
+# Sentence end: ., ! or ? (optionally followed by quotes/brackets) and whitespace
+SENTENCE_END = re.compile(r'(?<=[.!?])["\')\]]*\s+')
+
+def split_sentences_regex(text):
+    """
+    Fast rule-based sentence splitter (no model to load).
+    """
+    return [s for s in SENTENCE_END.split(text) if s]
+
+@lru_cache(maxsize=None)
+def get_punkt_tokenizer():
+    """
+    Loads the Punkt sentence tokenizer once per process.
+    """
+    try:
+        nltk.data.find('tokenizers/punkt')
+    except LookupError:
+        nltk.download('punkt')
+    return nltk.data.load('tokenizers/punkt/english.pickle')
+
+def split_sentences_punkt(text):
+    """
+    Sentence splitter using NLTK's Punkt model (loaded once).
+    """
+    return get_punkt_tokenizer().tokenize(text)
+
+SPLITTERS = {
+    'regex': split_sentences_regex,
+    'punkt': split_sentences_punkt,
+}
+
+def clean_chunk_text(text):
+    """
+    Same cleanup `break_and_clean` applies: newlines become spaces and
+    periods are removed.
+    """
+    return text.replace('\n', ' ').replace('.', '')
+
+#------------------------------------#
+# Token-bounded chunker
+#------------------------------------#
+
+class Chunker:
+    """
+    Splits text into windows of whole sentences of at most `max_tokens`
+    tokens, with about `overlap_tokens` tokens of trailing sentences repeated
+    at the start of the next window. A sentence longer than `max_tokens` is
+    cut into word windows. Cleanup happens in the same pass.
+
+    Token counts come from `batching.count_tokens` (tiktoken if installed,
+    otherwise the UTF-8 byte length), so chunk sizes line up with the embedding
+    request limits.
+
+    Parameters
+    ----------
+    max_tokens : int, default=256
+    overlap_tokens : int, default=32
+    splitter : {'regex', 'punkt'}, default='regex'
+    embed_model : str, default='text-embedding-3-small'
+        Model whose tokenizer is used for counting.
+    clean : bool, default=True
+        Apply `clean_chunk_text` to every chunk.
+
+    Example
+    -------
+    >>> chunker = Chunker(max_tokens=300, overlap_tokens=50)
+    >>> new_data = break_and_clean(extracted_text_data, chunker=chunker, workers=8)
+    """
+
+    def __init__(self, max_tokens=256, overlap_tokens=32, splitter='regex',
+                 embed_model='text-embedding-3-small', clean=True):
+        if overlap_tokens >= max_tokens:
+            raise ValueError("overlap_tokens must be smaller than max_tokens")
+        if splitter not in SPLITTERS:
+            raise ValueError(f"Unknown splitter: {splitter}")
+        self.max_tokens = int(max_tokens)
+        self.overlap_tokens = int(overlap_tokens)
+        self.splitter = splitter
+        self.embed_model = embed_model
+        self.clean = clean
+
+    def _sentences(self, text, tag=None):
+        """
+        (sentence, tokens, tag) triples; over-long sentences are cut into word windows.
+        """
+        sentences = SPLITTERS[self.splitter](text)
+        for sentence, n_tokens in zip(sentences, count_tokens(sentences, self.embed_model)):
+            if n_tokens <= self.max_tokens:
+                yield sentence, n_tokens, tag
+                continue
+            words = sentence.split()
+            step = max(1, len(words) * self.max_tokens // n_tokens)
+            pieces = [' '.join(words[i:i + step]) for i in range(0, len(words), step)]
+            for piece, piece_tokens in zip(pieces, count_tokens(pieces, self.embed_model)):
+                yield piece, piece_tokens, tag
+
+    def _windows(self, sentences):
+        """
+        Packs (sentence, tokens, tag) triples into overlapping windows.
+        Yields (text, first tag, last tag) as soon as each window is full.
+        """
+        window, window_tokens = [], 0
+
+        for sentence, n_tokens, tag in sentences:
+            if window and window_tokens + n_tokens > self.max_tokens:
+                yield self._emit(window)
+
+                # Carry trailing sentences over as overlap
+                overlap, overlap_tokens = [], 0
+                for item in reversed(window):
+                    t = item[1]
+                    if overlap_tokens + t > self.overlap_tokens or overlap_tokens + t + n_tokens > self.max_tokens:
+                        break
+                    overlap.insert(0, item)
+                    overlap_tokens += t
+                window, window_tokens = overlap, overlap_tokens
+
+            window.append((sentence, n_tokens, tag))
+            window_tokens += n_tokens
+
+        if window:
+            yield self._emit(window)
+
+    def _emit(self, window):
+        text = ' '.join(s for s, _, _ in window)
+        if self.clean:
+            text = clean_chunk_text(text)
+        return text, window[0][2], window[-1][2]
+
+    def chunk_text(self, text):
+        """
+        Splits one document.
+
+        Parameters
+        ----------
+        text : str
+
+        Returns
+        -------
+        chunks : list of str
+        """
+        return [chunk for chunk, _, _ in self._windows(self._sentences(text))]
+
+    def chunk_record(self, data):
+        """
+        Chunks one extracted record into chunk records (as `break_and_clean`
+        does: metadata copied, extension removed from 'file').
+        """
+        records = []
+        for chunk in self.chunk_text(data['text']):
+            new_item = data.copy()
+            new_item['text'] = chunk
+            new_item['file'] = data['file'][:-4]
+            records.append(new_item)
+        return records
+
+    def chunk_pages(self, pages):
+        """
+        Chunks a document given page by page (e.g. `iter_pdf_file_pages`),
+        holding only the current window in memory. Windows may cross page
+        boundaries; every chunk records the pages it spans.
+
+        Parameters
+        ----------
+        pages : iterable of dict
+            Page records of one document, with 'text' and 'page'.
+
+        Yields
+        ------
+        record : dict
+            Chunk record with the metadata of the first page (without
+            'images'), plus 'page_start' and 'page_end'.
+        """
+        base = None
+        def sentences():
+            nonlocal base
+            for page in pages:
+                if base is None:
+                    base = {k: v for k, v in page.items() if k not in ('text', 'page', 'images')}
+                yield from self._sentences(page['text'], page['page'])
+
+        for chunk, page_start, page_end in self._windows(sentences()):
+            new_item = dict(base, text=chunk, page_start=page_start, page_end=page_end)
+            new_item['file'] = base['file'][:-4]
+            yield new_item
+
+def chunk_documents(extracted_text_data, chunker, workers=None, chunksize=16):
+    """
+    Chunks many documents on a process pool, keeping document order.
+
+    Parameters
+    ----------
+    extracted_text_data : list of dict
+    chunker : Chunker
+    workers : int, optional
+        Number of processes. 1 runs in the current process.
+    chunksize : int, default=16
+        Documents handed to a worker at a time.
+
+    Returns
+    -------
+    new_data : list of dict
+    """
+    if workers == 1:
+        per_document = map(chunker.chunk_record, extracted_text_data)
+        return [item for records in per_document for item in records]
+
+    with Pool(processes=workers) as pool:
+        per_document = pool.imap(chunker.chunk_record, extracted_text_data, chunksize=chunksize)
+        return [item for records in per_document for item in records]
@@ -1,47 +1,173 @@
 #--------------------------------------------------------#
 # Import Libraries
 #--------------------------------------------------------#
-import os
 import numpy as np
 from time import sleep
-from openai import OpenAI
-from sklearn.metrics.pairwise import cosine_similarity
-
-#--------------------------------------------------------#
-# OpenAI Client - no need to pass api key
-# as long as it's an env variable named OPENAI_API_KEY
-# You can create in script as 
-#       os.environ['OPENAI_API_KEY'] = 'your_key_here'
-#--------------------------------------------------------#
-client = OpenAI()
+from embedding_store import EmbeddingStore
+from embedding_backends import as_backend
+from hybrid_search import hybrid_search
+from instrumentation import metrics
 
 #--------------------------------------------------------#
 # Define function to get top-k results
 #--------------------------------------------------------#
 
-def get_top_k_results_text(df, query_text, embed_model='text-embedding-3-small', n=3):
+def as_store(df):
+    """
+    Returns `df` unchanged if it is already an EmbeddingStore, otherwise converts a
+    DataFrame with a list-valued 'embedding' column. Convert once and reuse the
+    store: the conversion is the expensive part of a query.
+    """
+    if isinstance(df, EmbeddingStore):
+        return df
+    return EmbeddingStore.from_dataframe(df)
+
+def embed_queries(query_texts, embed_model='text-embedding-3-small', query_cache=None, backend=None,
+                  dimensions=None):
+    """
+    Embeds a list of query texts in a single request.
+
+    Parameters
+    ----------
+    query_texts : list of str
+    embed_model : str
+    query_cache : QueryCache, optional
+        Queries found in the cache are not sent; the rest are added to it.
+    backend : EmbeddingBackend, optional
+        Defaults to the default backend (see `embedding_backends.py`).
+    dimensions : int, optional
+        Output dimension to request (must match the store's).
+
+    Returns
+    -------
+    query_embeddings : numpy.ndarray of shape (len(query_texts), dim)
+    """
+    if query_cache is not None:
+        query_embeddings = query_cache.get_many(query_texts, embed_model, dimensions)
+        missing = [i for i, emb in enumerate(query_embeddings) if emb is None]
+        if missing:
+            missing_texts = [query_texts[i] for i in missing]
+            new_embeddings = embed_queries(missing_texts, embed_model=embed_model, backend=backend,
+                                           dimensions=dimensions)
+            query_cache.put_many(missing_texts, new_embeddings, embed_model, dimensions)
+            for i, emb in zip(missing, new_embeddings):
+                query_embeddings[i] = emb
+        return np.stack(query_embeddings)
+
     # create embeddings (try-except added to avoid RateLimitError)
     # Added a max of 5 retries
     max_retries = 2
     retry_count = 0
     done = False
+    request_kwargs = {} if dimensions is None else {'dimensions': dimensions}
 
     while not done and retry_count < max_retries:
         try:
-            res = client.embeddings.create(input=query_text, model=embed_model)
+            embeddings = as_backend(backend).embed(list(query_texts), embed_model, **request_kwargs)
             done = True
         except Exception as e:
             # print(f"Error creating embeddings for batch {e}")
             retry_count += 1
             sleep(5)
-    query_embedding = res.data[0].embedding
 
-    # Compute cosine similarity
-    similarities = cosine_similarity([query_embedding], list(df['embedding']))
-    
-    # Find top-k indices and metadata
-    top_k_indices = np.argsort(similarities[0])[-n:][::-1]
-    top_k_results = df.iloc[top_k_indices]
+    if not done:
+        raise RuntimeError(f"Failed to embed {len(query_texts)} queries after {max_retries} retries")
+
+    return np.array(embeddings, dtype=np.float32)
+
+def query_model(store, embed_model=None):
+    """
+    Model to embed queries with: the one recorded in the store unless
+    another is given (a mismatch raises ValueError).
+    """
+    if embed_model is None:
+        return store.embed_model or 'text-embedding-3-small'
+    if store.embed_model is not None and embed_model != store.embed_model:
+        raise ValueError(f"The store was built with {store.embed_model}, not {embed_model}")
+    return embed_model
+
+@metrics.timed('search_batch')
+def search_batch(df, queries, embed_model=None, n=3, index=None, query_cache=None, backend=None, filters=None,
+                 lexical=None):
+    """
+    Top-k search for many queries at once.
+
+    Query texts are embedded in one request, scored against the store with one
+    matrix-matrix product, and the top `n` are selected with argpartition.
+
+    Parameters
+    ----------
+    df : EmbeddingStore or pandas.DataFrame
+    queries : list of str or array-like of shape (n_queries, dim)
+        Query texts, or query vectors that are already embedded.
+    embed_model : str, optional
+        Defaults to the model recorded in the store. Queries are requested
+        with the store's `dimensions`, and wider query vectors are
+        prefix-truncated to the store's dimension.
+    n : int, default=3
+    index : IVFIndex, optional
+        Approximate index (see `ann_index.build_ivf_index`) to search instead
+        of the exact scan over every row.
+    query_cache : QueryCache, optional
+        Cache of query embeddings (see `embedding_cache.QueryCache`).
+    backend : EmbeddingBackend, optional
+        Backend that embeds query texts.
+    filters : dict, optional
+        Metadata predicates: folder_prefix, files, title_contains and/or
+        heading_contains (see `EmbeddingStore.select_rows`). Only the
+        matching rows are scored, with an exact scan (`index` is not used).
+    lexical : BM25Index, optional
+        Hybrid search: BM25 and vector rankings of the query texts are
+        computed concurrently and fused with reciprocal rank fusion (see
+        `hybrid_search.py`). Scores are then fusion scores, not similarities.
+
+    Returns
+    -------
+    indices : numpy.ndarray of shape (n_queries, n)
+        Row ids into the store, most similar first.
+    scores : numpy.ndarray of shape (n_queries, n)
+        Cosine similarities.
+
+    Example
+    -------
+    >>> store = create_and_append_embeddings(new_data)
+    >>> indices, scores = search_batch(store, ['How do I post an invoice?', 'What is a BOM?'])
+    """
+    store = as_store(df)
+    metrics.count('search_batch.queries', len(queries))
+
+    if len(queries) and isinstance(queries[0], str):
+        query_embeddings = embed_queries(queries, embed_model=query_model(store, embed_model),
+                                         query_cache=query_cache, backend=backend, dimensions=store.dimensions)
+    else:
+        query_embeddings = queries
+    query_embeddings = store.match_queries(query_embeddings)
+
+    # Rows scored per query (an approximate index records its own candidates)
+    rows = store.select_rows(**filters) if filters else None
+    if rows is not None:
+        metrics.observe('search_batch.candidates', len(rows))
+        vector_search = lambda q, k: store.search(q, k=k, rows=rows)
+    elif index is not None:
+        vector_search = index.search
+    else:
+        metrics.observe('search_batch.candidates', len(store))
+        vector_search = store.search
+
+    if lexical is not None:
+        if not (len(queries) and isinstance(queries[0], str)):
+            raise ValueError("Hybrid search needs the query texts, not only their embeddings")
+        return hybrid_search(vector_search, lexical, list(queries), query_embeddings, k=n, rows=rows)
+    return vector_search(query_embeddings, n)
+
+def get_top_k_results_text(df, query_text, embed_model=None, n=3, index=None, query_cache=None, backend=None,
+                           filters=None, lexical=None):
+    store = as_store(df)
+    top_k_indices, _ = search_batch(store, [query_text], embed_model=embed_model, n=n, index=index,
+                                    query_cache=query_cache, backend=backend, filters=filters, lexical=lexical)
+
+    # Find top-k metadata
+    top_k_results = store.metadata.iloc[top_k_indices[0][top_k_indices[0] >= 0]]
 
     # Join the text of the top-k results
     joined_text = ' '.join(list(top_k_results['text']))
@@ -52,35 +178,64 @@ def get_top_k_results_text(df, query_text, embed_model='text-embedding-3-small',
 # Context-Augmented Query
 #--------------------------------------------------------#
 
-def retrieve(query, df, limit_of_context = 3750, embed_model = 'text-embedding-3-small'):
+@metrics.timed('retrieve')
+def retrieve(query, df, limit_of_context = 3750, embed_model = None, index = None,
+             query_cache = None, backend = None, filters = None, lexical = None):
     """
     Retrieve relevant contexts from the dataset and build a prompt for the question answering model.
 
     Parameters
     ----------
-    query : str
-        The query to answer.
-    df : pandas.DataFrame
-        The DataFrame containing the embedding vectors and metadata.
+    query : str or list of str
+        The query to answer. Pass a list to answer many queries with one
+        embedding request and one scoring pass.
+    df : EmbeddingStore or pandas.DataFrame
+        The store (or legacy DataFrame) containing the embedding vectors and metadata.
     limit_of_context : int
         The maximum number of characters to use for the context.
-    embed_model : str
-        The embedding model to use.
+    embed_model : str, optional
+        The embedding model to use. Defaults to the one recorded in the store.
+    index : IVFIndex, optional
+        Approximate nearest-neighbour index to use in place of the exact scan.
+    query_cache : QueryCache, optional
+        Reuses the embeddings of repeated queries instead of calling the API.
+    backend : EmbeddingBackend, optional
+        Backend that embeds the queries (the default backend if not given).
+    filters : dict, optional
+        Restricts the search to matching chunks, e.g.
+        {'folder_prefix': 'Made2Manage/Sales', 'title_contains': 'invoice'}.
+        Keys: folder_prefix, files, title_contains, heading_contains.
+    lexical : BM25Index, optional
+        Adds BM25 matching (exact product names, error codes) to the vector
+        search; see `lexical_index.build_bm25_index`.
     
     Returns
     -------
-    prompt : str
-        The prompt to use for the question answering model.
+    prompt : str or list of str
+        The prompt to use for the question answering model (one per query
+        if a list was given).
     """
-    # get relevant contexts
-    contexts = get_top_k_results_text(df, query, embed_model=embed_model, n=3)
-
-    # Limit the number of characters
-    contexts = contexts[:limit_of_context]
-
-    # build our prompt with the retrieved contexts included
-    prompt = (
-        f"Answer the question based on the context below.\n\n"+
-        f"Context:\n {contexts}\n\n"+f"Question: {query}\nAnswer:"
-    )
-    return prompt
+    store = as_store(df)
+    queries = [query] if isinstance(query, str) else list(query)
+    metrics.count('retrieve.queries', len(queries))
+
+    # get relevant contexts for all queries at once
+    top_k_indices, _ = search_batch(store, queries, embed_model=embed_model, n=3, index=index,
+                                    query_cache=query_cache, backend=backend, filters=filters, lexical=lexical)
+
+    prompts = []
+    for q, indices in zip(queries, top_k_indices):
+        indices = indices[indices >= 0] # approximate and hybrid searches may return fewer than n rows
+        contexts = ' '.join(list(store.metadata.iloc[indices]['text']))
+
+        # Limit the number of characters
+        contexts = contexts[:limit_of_context]
+
+        # build our prompt with the retrieved contexts included
+        prompt = (
+            f"Answer the question based on the context below.\n\n"+
+            f"Context:\n {contexts}\n\n"+f"Question: {q}\nAnswer:"
+        )
+        prompts.append(prompt)
+
+    return prompts[0] if isinstance(query, str) else prompts
@@ -3,78 +3,329 @@
 #-------------------------------------#
 import os
 import datetime
-import pandas as pd
-from time import sleep
-from openai import OpenAI
-from tqdm.auto import tqdm
-
-#--------------------------------------------------------#
-# OpenAI Client - no need to pass api key
-# as long as it's an env variable named OPENAI_API_KEY
-# You can create in script as 
-#       os.environ['OPENAI_API_KEY'] = 'your_key_here'
-#--------------------------------------------------------#
-client = OpenAI()
+import numpy as np
+from embedding_store import EmbeddingStore
+from index_writer import IndexWriter
+from embedding_scheduler import EmbeddingScheduler, RETRY_QUEUE_FILE
+from instrumentation import metrics
+from batching import prepare_inputs, pack_batches, merge_pieces, MAX_TOKENS_PER_REQUEST, MAX_ITEMS_PER_REQUEST
 
 #----------------------------------------------#
-# Create embeddings and append to DataFrame
+# Embed a list of texts
 #----------------------------------------------#
 
-def create_and_append_embeddings(new_data, embed_model = 'text-embedding-3-small'):
-    batch_size = 100  # how many embeddings we create and insert at once
+# Metadata kept for each row of the store
+METADATA_COLUMNS = ['file', 'text', 'title', 'headings', 'images', 'folder', 'path', 'page_start', 'page_end',
+                    'heading_levels', 'chunk_id', 'sources']
 
-    # Create an empty DataFrame (INITIALIZE AT THE BEGINNING OF THE PROCESS ONLY)
-    columns = ['file', 'text', 'title', 'headings', 'images', 'folder', 'embedding']
-    # df = pd.DataFrame(columns=columns)
+def embed_texts(texts, embed_model = 'text-embedding-3-small', cache = None, scheduler = None,
+                max_tokens_per_request = MAX_TOKENS_PER_REQUEST, max_items_per_request = MAX_ITEMS_PER_REQUEST,
+                oversize_policy = 'truncate', show_progress = True, dimensions = None, metadata = None):
+    """
+    Embeds texts: cache lookup, token-aware packing, concurrent requests.
 
-    for i in tqdm(range(0, len(new_data), batch_size)):
-        # find end of batch
-        i_end = min(len(new_data), i+batch_size)
-        meta_batch = new_data[i:i_end]
-        # get ids (files)
-        ids_batch = [x['file'] for x in meta_batch]
+    Parameters
+    ----------
+    texts : list of str
+    embed_model, cache, scheduler, max_tokens_per_request, max_items_per_request, oversize_policy, dimensions
+        As in `create_and_append_embeddings`.
+    show_progress : bool, default=True
+    metadata : list of dict, optional
+        One metadata row per text, kept with failed requests in the
+        scheduler's retry queue as {'row': ..., 'split': ...} so that
+        `retry_failed_embeddings` can add them to the index ('split' marks
+        the pieces of an oversized chunk).
+
+    Returns
+    -------
+    embeds : list
+        One embedding per text, in input order; None where the request failed.
+    """
+    # Look up unchanged chunks in the cache first; only misses go to the API
+    if cache is not None:
+        embeds = cache.get_many(texts, embed_model, dimensions)
+    else:
+        embeds = [None] * len(texts)
+    missing = [j for j, emb in enumerate(embeds) if emb is None]
+    if not missing:
+        return embeds
+
+    # Truncate or split oversized chunks, then pack the misses into requests
+    # close to the per-request token and item limits
+    pieces, sources, token_counts = prepare_inputs([texts[j] for j in missing], embed_model,
+                                                   oversize_policy=oversize_policy)
+    batches = pack_batches(token_counts, max_tokens_per_request=max_tokens_per_request,
+                           max_items=max_items_per_request)
+
+    # Send them in concurrent, rate-limited requests (results come back in input order)
+    if scheduler is None:
+        scheduler = EmbeddingScheduler()
+    request_kwargs = {} if dimensions is None else {'dimensions': dimensions}
+    batch_metadata = None
+    if metadata is not None:
+        n_pieces = np.bincount(sources, minlength=len(missing))
+        piece_metadata = [{'row': metadata[missing[i]], 'split': bool(n_pieces[i] > 1)} for i in sources]
+        batch_metadata = [[piece_metadata[p] for p in batch] for batch in batches]
+    results = scheduler.embed_batches([[pieces[p] for p in batch] for batch in batches], embed_model,
+                                      token_counts=[sum(token_counts[p] for p in batch) for batch in batches],
+                                      show_progress=show_progress, metadata=batch_metadata, **request_kwargs)
+
+    piece_embeds = [None] * len(pieces)
+    for batch, batch_embeds in zip(batches, results):
+        if batch_embeds is None:
+            continue # kept in the scheduler's retry queue
+        for p, emb in zip(batch, batch_embeds):
+            piece_embeds[p] = emb
+
+    # One vector per chunk (split chunks are averaged)
+    merged = merge_pieces(piece_embeds, sources, token_counts, len(missing))
+    for j, emb in zip(missing, merged):
+        embeds[j] = emb
+
+    if cache is not None:
+        done = [j for j, emb in zip(missing, merged) if emb is not None]
+        cache.put_many([texts[j] for j in done], [embeds[j] for j in done], embed_model, dimensions)
+
+    return embeds
+
+#----------------------------------------------#
+# Create embeddings and append to EmbeddingStore
+#----------------------------------------------#
+
+@metrics.timed('create_and_append_embeddings')
+def create_and_append_embeddings(new_data, embed_model = 'text-embedding-3-small', store = None, save_path = None, cache = None, scheduler = None,
+                                 max_tokens_per_request = MAX_TOKENS_PER_REQUEST, max_items_per_request = MAX_ITEMS_PER_REQUEST,
+                                 oversize_policy = 'truncate', index_path = None, shard_rows = 10000, dimensions = None):
+    """
+    Creates embeddings for the chunks and appends them to an EmbeddingStore.
+
+    Parameters
+    ----------
+    new_data : list of dict
+        Chunks as returned by `break_and_clean`.
+    embed_model : str
+        The embedding model to use.
+    store : EmbeddingStore, optional
+        Existing store to append to. A new one is created (preallocated for
+        `new_data`) if not given.
+    save_path : str, optional
+        If given, the store is written to this index directory (see
+        `EmbeddingStore.save`) and can be reopened with `EmbeddingStore.open`.
+    cache : EmbeddingCache, optional
+        Persistent cache (see `embedding_cache.py`). Chunks whose text was
+        embedded before with the same model are taken from it instead of the API.
+    scheduler : EmbeddingScheduler, optional
+        Controls concurrency, rate limits, retries and the retry queue (see
+        `embedding_scheduler.py`). Defaults to 4 concurrent requests to the
+        default backend (see `embedding_backends.py`), with failed requests
+        kept in `failed_batches.jsonl` in `index_path` or `save_path` (replay
+        them with `retry_failed_embeddings`).
+    max_tokens_per_request : int, default=300000
+        Chunks are packed into requests up to this many tokens...
+    max_items_per_request : int, default=2048
+        ...and this many chunks (see `batching.py`).
+    oversize_policy : {'truncate', 'split', 'error'}, default='truncate'
+        What to do with chunks above the model's 8191-token input limit.
+    index_path : str, optional
+        Write the embeddings straight to this index directory with an
+        IndexWriter, appending if it already exists, instead of keeping them
+        in memory. Memory stays bounded by one shard; `store` is ignored and
+        the memory-mapped index is returned.
+    shard_rows : int, default=10000
+        Chunks embedded and written per shard when `index_path` is given.
+    dimensions : int, optional
+        Output dimension requested from the model (text-embedding-3-* can
+        shorten its vectors). Recorded in the store; when appending, the
+        store's value is used if not given.
+
+    Returns
+    -------
+    store : EmbeddingStore
+        Normalized float32 vectors plus metadata (`store.metadata`).
+    """
+    if cache is not None:
+        cache.reset_stats()
+    n_embedded = 0
+    if scheduler is None and (index_path or save_path) is not None:
+        scheduler = EmbeddingScheduler(retry_queue_path=os.path.join(index_path or save_path, RETRY_QUEUE_FILE))
+    if dimensions is None and store is not None and index_path is None:
+        dimensions = store.dimensions
+
+    # Stream to disk: embed one shard's worth of chunks at a time
+    if index_path is not None:
+        with IndexWriter(index_path, shard_rows=shard_rows, embed_model=embed_model, dimensions=dimensions) as writer:
+            dimensions = writer.dimensions # an existing index keeps its own
+            for i in range(0, len(new_data), shard_rows):
+                window = new_data[i:i+shard_rows]
+                records = [{col: x.get(col) for col in METADATA_COLUMNS} for x in window]
+                embeds = embed_texts([x['text'] for x in window], embed_model=embed_model, cache=cache,
+                                     scheduler=scheduler, max_tokens_per_request=max_tokens_per_request,
+                                     max_items_per_request=max_items_per_request, oversize_policy=oversize_policy,
+                                     dimensions=dimensions, metadata=records)
+                keep = [j for j, emb in enumerate(embeds) if emb is not None]
+                n_embedded += len(keep)
+                if keep:
+                    writer.append(np.array([embeds[j] for j in keep], dtype=np.float32),
+                                  [records[j] for j in keep])
+        store = EmbeddingStore.open(index_path)
+
+    else:
         # get texts to encode
-        texts = [x['text'] for x in meta_batch]
-
-        # create embeddings (try-except added to avoid RateLimitError)
-        # Added a max of 5 retries
-        max_retries = 2
-        retry_count = 0
-        done = False
-
-        while not done and retry_count < max_retries:
-            try:
-                res = client.embeddings.create(input=texts, model=embed_model)
-                done = True
-            except Exception as e:
-                print(f"Error creating embeddings for batch {i}: {e}")
-                retry_count += 1
-                sleep(5)
-
-        if not done:
-            print(f"Failed to create embeddings for batch {i} after {max_retries} retries. Skipping this batch.")
+        texts = [x['text'] for x in new_data]
+        records = [{col: x.get(col) for col in METADATA_COLUMNS} for x in new_data]
+        embeds = embed_texts(texts, embed_model=embed_model, cache=cache, scheduler=scheduler,
+                             max_tokens_per_request=max_tokens_per_request,
+                             max_items_per_request=max_items_per_request, oversize_policy=oversize_policy,
+                             dimensions=dimensions, metadata=records)
+
+        # Append embeddings and metadata to the store in input order (rows stay aligned)
+        keep = [j for j, emb in enumerate(embeds) if emb is not None]
+        n_embedded = len(keep)
+        if keep:
+            if store is None:
+                store = EmbeddingStore(dim=len(embeds[keep[0]]), capacity=len(keep), embed_model=embed_model,
+                                       dimensions=dimensions)
+            elif store.embed_model is None:
+                store.embed_model, store.dimensions = embed_model, dimensions
+            store.add(np.array([embeds[j] for j in keep], dtype=np.float32), [records[j] for j in keep])
+
+    metrics.count('create_and_append_embeddings.chunks', len(new_data))
+    metrics.count('create_and_append_embeddings.embedded', n_embedded)
+    metrics.count('create_and_append_embeddings.failed', len(new_data) - n_embedded)
+
+    if cache is not None:
+        print(cache.report())
+
+    # Shape of the store
+    if store is not None:
+        print(f"The store now has {len(store)} rows of dimension {store.dim}")
+
+    # Save as a memory-mappable index directory if user wants to
+    if save_path is not None and store is not None:
+        store.save(save_path)
+
+    return store
+
+
+#----------------------------------------------#
+# Update an existing store after a Manifest scan
+#----------------------------------------------#
+
+def update_embeddings(store, new_data, changes, embed_model = 'text-embedding-3-small', save_path = None, cache = None, scheduler = None):
+    """
+    Brings a store up to date with the files changed since the last scan:
+    drops the old chunks of modified and deleted files, then embeds and
+    appends the chunks of added and modified files.
+
+    Raises ValueError if chunks must be dropped but the store has no 'path'
+    column (e.g. one converted from a legacy DataFrame).
+
+    Parameters
+    ----------
+    store : EmbeddingStore
+    new_data : list of dict
+        Chunks (from `break_and_clean`) of the files in `changes.to_process`.
+    changes : manifest.Changes
+        Result of `Manifest.scan`.
+    embed_model, save_path, cache, scheduler
+        As in `create_and_append_embeddings`.
+
+    Returns
+    -------
+    store : EmbeddingStore
+
+    Example
+    -------
+    >>> changes = manifest.scan(folder_path)
+    >>> new_data = break_and_clean(process_html_files(folder_path, files=changes.to_process))
+    >>> store = update_embeddings(store, new_data, changes, save_path='my_index')
+    >>> manifest.save()
+    """
+    # Drop the chunks of files that changed or disappeared
+    if changes.to_remove:
+        if 'path' not in store.metadata.columns:
+            raise ValueError("The store has no 'path' column, so the chunks of modified and deleted files "
+                             "cannot be found; rebuild it from extracted files before updating it")
+        stale = np.flatnonzero(store.metadata['path'].isin(changes.to_remove).to_numpy())
+        n_removed = store.remove(stale)
+        print(f"Removed {n_removed} chunks from {len(changes.to_remove)} modified or deleted files")
+
+    return create_and_append_embeddings(new_data, embed_model=embed_model, store=store,
+                                        save_path=save_path, cache=cache, scheduler=scheduler)
+
+#----------------------------------------------#
+# Add the batches of the retry queue to a store
+#----------------------------------------------#
+
+def retry_failed_embeddings(scheduler, store = None, index_path = None, save_path = None, cache = None):
+    """
+    Replays the scheduler's retry queue (see `EmbeddingScheduler.retry_failed`)
+    and adds the chunks that are embedded this time to the store or index
+    they were meant for, with the metadata kept in the queue. Chunks that
+    were split for being too long are embedded again whole, so their pieces
+    are averaged as usual. Batches that fail again stay in the queue.
+
+    Raises ValueError unless exactly one of `store` and `index_path` is given.
+
+    Parameters
+    ----------
+    scheduler : EmbeddingScheduler
+        Scheduler with a `retry_queue_path`. For a default scheduler of
+        `create_and_append_embeddings` or `run_pipeline`, that is
+        `os.path.join(index_path, RETRY_QUEUE_FILE)`.
+    store : EmbeddingStore, optional
+        Store to add the chunks to (saved to `save_path` if given)...
+    index_path : str, optional
+        ...or index directory to append them to with an IndexWriter.
+    save_path, cache
+        As in `create_and_append_embeddings`.
+
+    Returns
+    -------
+    store : EmbeddingStore
+
+    Example
+    -------
+    >>> scheduler = EmbeddingScheduler(retry_queue_path=os.path.join('my_index', RETRY_QUEUE_FILE))
+    >>> store = retry_failed_embeddings(scheduler, index_path='my_index')
+    """
+    if (store is None) == (index_path is None):
+        raise ValueError("Give either a store or an index_path")
+
+    records, vectors, split_rows = [], [], {}
+    n_unknown = 0
+    for texts, embeds, metadata in scheduler.retry_failed():
+        if metadata is None:
+            n_unknown += len(texts) # queued without metadata, nowhere to put it
             continue
+        for emb, meta in zip(embeds, metadata):
+            if meta['split']:
+                split_rows[(meta['row'].get('path'), meta['row']['text'])] = meta['row']
+            else:
+                records.append(meta['row'])
+                vectors.append(emb)
+    if n_unknown:
+        print(f"Dropped {n_unknown} recovered texts that were queued without metadata")
+    print(f"Recovered {len(records) + len(split_rows)} chunks from the retry queue")
+
+    if index_path is not None:
+        with IndexWriter(index_path) as writer:
+            embed_model, dimensions = writer.embed_model, writer.dimensions
+            if records:
+                writer.append(np.array(vectors, dtype=np.float32), records)
+        store = EmbeddingStore.open(index_path)
+    else:
+        embed_model, dimensions = store.embed_model, store.dimensions
+        if records:
+            store.add(np.array(vectors, dtype=np.float32), records)
+
+    if cache is not None and records:
+        cache.put_many([r['text'] for r in records], vectors, embed_model, dimensions)
 
-        embeds = [record.embedding for record in res.data]
-        meta_batch = [{
-            'file': x['file'],
-            'text': x['text'],
-            'title': x['title'],
-            'headings': x['headings'],
-            'images': x['images'],
-            'folder': x['folder']
-        } for x in meta_batch]
-
-        # Append embeddings and metadata to DataFrame
-        batch_data = []
-        for idx, (emb, meta) in enumerate(zip(embeds, meta_batch)):
-            data = {**meta, 'embedding': emb}
-            batch_data.append(data)
-
-        batch_df = pd.DataFrame(batch_data, columns=columns)
-        df = pd.concat([df, batch_df], ignore_index=True)
-
-    # Shape of the DataFrame
-    print(f"The dataframe now has a shape of {df.shape}")
-
-    return df
+    if split_rows:
+        return create_and_append_embeddings(list(split_rows.values()), embed_model=embed_model, store=store,
+                                            save_path=save_path, cache=cache, scheduler=scheduler,
+                                            oversize_policy='split', index_path=index_path, dimensions=dimensions)
+    if save_path is not None:
+        store.save(save_path)
+    return store
@@ -0,0 +1,324 @@
+#------------------------------------#
+# Import Libraries
+#------------------------------------#
+import os
+import re
+import json
+import zlib
+import hashlib
+import numpy as np
+from batching import count_tokens
+from instrumentation import metrics
+
+# Files written into the index directory by Deduplicator.save
+DUPLICATES_FILE = 'duplicates.json'
+SIGNATURES_FILE = 'dedup_signatures.npz'
+
+# Hash functions h(x) = (a * x + b) mod p of the MinHash signatures
+MERSENNE_PRIME = (1 << 31) - 1
+
+#------------------------------------#
+# Normalization and hashing
+#------------------------------------#
+
+NON_WORD = re.compile(r'\W+')
+
+def normalize_text(text):
+    """
+    Lower-cased words separated by single spaces: copies that differ only in
+    case, punctuation or whitespace normalize to the same string.
+    """
+    return NON_WORD.sub(' ', text.lower()).strip()
+
+def lsh_bands(num_perm, threshold, false_negative_weight=0.9):
+    """
+    (bands, rows) with bands * rows <= num_perm minimizing the weighted
+    false-positive and false-negative areas of the LSH candidate curve
+    1 - (1 - s**rows)**bands around `threshold`. Missed pairs are weighted
+    more: every candidate is verified, so false positives only cost time.
+    """
+    s = np.linspace(0.0, 1.0, 201) # uniform grid: the mean approximates the areas
+
+    def error(bands, rows):
+        p = 1.0 - (1.0 - s ** rows) ** bands
+        return np.mean(np.where(s < threshold, (1.0 - false_negative_weight) * p, false_negative_weight * (1.0 - p)))
+
+    return min(((b, num_perm // b) for b in range(1, num_perm + 1)), key=lambda br: error(*br))
+
+#------------------------------------#
+# Exact and near-duplicate chunk filter
+#------------------------------------#
+
+class Deduplicator:
+    """
+    Drops repeated chunks (navigation text, footers, "see also" blocks)
+    between chunking and embedding, so each is embedded and stored once.
+
+    - Exact duplicates: same hash of the normalized text.
+    - Near duplicates: MinHash signatures of word shingles, bucketed with
+      LSH; a candidate is a duplicate when the estimated Jaccard similarity
+      of the shingle sets is at least `threshold`.
+
+    The first copy is kept. Its record gets a 'chunk_id' and a 'sources' list
+    with the path of every file the chunk (or a near copy of it) came from.
+
+    `save` writes that mapping to `duplicates.json` (and the MinHash
+    signatures to `dedup_signatures.npz`) in the index directory, and `load`
+    reads them back, so chunks indexed by an earlier run are recognized.
+    Before re-processing changed files, `remove_sources` takes them out of
+    the mapping; a chunk left without sources is forgotten.
+
+    Memory grows with the number of distinct chunks seen (the id, the source
+    paths and, with `near`, a signature of 4 * num_perm bytes each); it is
+    not bounded by `run_pipeline`'s `max_memory_mb`. Use `near=False` or a
+    smaller `num_perm` on very large corpora.
+
+    Parameters
+    ----------
+    threshold : float, default=0.9
+        Jaccard similarity above which chunks are near duplicates.
+    near : bool, default=True
+        Set to False to only drop exact duplicates.
+    num_perm : int, default=128
+        MinHash signature length.
+    shingle_size : int, default=3
+        Words per shingle.
+    embed_model : str
+        Tokenizer used to report the tokens saved.
+    seed : int, default=0
+
+    Example
+    -------
+    >>> dedup = Deduplicator(threshold=0.9)
+    >>> chunks = dedup.filter(break_and_clean(extracted))
+    >>> print(dedup.report())
+    >>> store = create_and_append_embeddings(list(chunks))
+    """
+
+    def __init__(self, threshold=0.9, near=True, num_perm=128, shingle_size=3,
+                 embed_model='text-embedding-3-small', seed=0):
+        self.threshold = float(threshold)
+        self.near = near
+        self.num_perm = int(num_perm)
+        self.shingle_size = int(shingle_size)
+        self.embed_model = embed_model
+        self.seed = int(seed)
+        self.bands, self.rows = lsh_bands(self.num_perm, self.threshold)
+
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, MERSENNE_PRIME, size=self.num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, MERSENNE_PRIME, size=self.num_perm, dtype=np.uint64)
+
+        self.sources = {}      # chunk id -> list of source paths
+        self._source_sets = {} # chunk id -> set of the same paths
+        self._signatures = {}  # chunk id -> MinHash signature
+        self._buckets = [{} for _ in range(self.bands)]
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.n_chunks = 0
+        self.exact_duplicates = 0
+        self.near_duplicates = 0
+        self.tokens_saved = 0
+
+    def signature(self, normalized):
+        """
+        MinHash signature (uint32 array of length num_perm) of a normalized text.
+        """
+        words = normalized.split()
+        n = self.shingle_size
+        shingles = {' '.join(words[i:i + n]) for i in range(max(len(words) - n + 1, 1))}
+        x = np.fromiter((zlib.crc32(s.encode('utf-8')) for s in shingles), dtype=np.uint64, count=len(shingles))
+        x %= np.uint64(MERSENNE_PRIME)
+        hashes = (self._a[:, None] * x[None, :] + self._b[:, None]) % np.uint64(MERSENNE_PRIME)
+        return hashes.min(axis=1).astype(np.uint32)
+
+    def _near_match(self, signature):
+        """
+        Id of a kept chunk whose signature agrees with `signature` on at
+        least `threshold` of its positions, or None.
+        """
+        seen = set()
+        for band, buckets in enumerate(self._buckets):
+            key = signature[band * self.rows:(band + 1) * self.rows].tobytes()
+            for chunk_id in buckets.get(key, ()):
+                if chunk_id in seen:
+                    continue
+                seen.add(chunk_id)
+                if np.mean(self._signatures[chunk_id] == signature) >= self.threshold:
+                    return chunk_id
+        return None
+
+    def _band_keys(self, signature):
+        return [signature[band * self.rows:(band + 1) * self.rows].tobytes() for band in range(self.bands)]
+
+    def _remember(self, chunk_id, sources, signature=None):
+        self.sources[chunk_id], self._source_sets[chunk_id] = list(sources), set(sources)
+        if self.near and signature is not None:
+            self._signatures[chunk_id] = signature
+            for buckets, key in zip(self._buckets, self._band_keys(signature)):
+                buckets.setdefault(key, []).append(chunk_id)
+
+    def _forget(self, chunk_id):
+        del self.sources[chunk_id], self._source_sets[chunk_id]
+        signature = self._signatures.pop(chunk_id, None)
+        if signature is not None:
+            for buckets, key in zip(self._buckets, self._band_keys(signature)):
+                bucket = buckets[key]
+                bucket.remove(chunk_id)
+                if not bucket:
+                    del buckets[key]
+
+    def _add_source(self, chunk_id, chunk):
+        source = chunk.get('path') or chunk.get('file')
+        if source is not None and source not in self._source_sets[chunk_id]:
+            self._source_sets[chunk_id].add(source)
+            self.sources[chunk_id].append(source)
+
+    def add(self, chunk):
+        """
+        Returns the chunk (with 'chunk_id' and 'sources') if it is new, or
+        None if it duplicates a chunk seen before.
+        """
+        self.n_chunks += 1
+        normalized = normalize_text(chunk['text'])
+        chunk_id = hashlib.blake2b(normalized.encode('utf-8'), digest_size=16).hexdigest() # hash of the normalized text
+
+        duplicate_of = chunk_id if chunk_id in self.sources else None
+        if duplicate_of is not None:
+            self.exact_duplicates += 1
+        elif self.near:
+            signature = self.signature(normalized)
+            duplicate_of = self._near_match(signature)
+            if duplicate_of is not None:
+                self.near_duplicates += 1
+
+        if duplicate_of is not None:
+            self._add_source(duplicate_of, chunk)
+            n_tokens = count_tokens([chunk['text']], self.embed_model)[0]
+            self.tokens_saved += n_tokens
+            metrics.count('dedup.duplicates')
+            metrics.count('dedup.tokens_saved', n_tokens)
+            return None
+
+        self._remember(chunk_id, [], signature if self.near else None)
+        self._add_source(chunk_id, chunk)
+
+        chunk = dict(chunk, chunk_id=chunk_id)
+        chunk['sources'] = self.sources[chunk_id] # shared: later duplicates add their files
+        return chunk
+
+    def filter(self, chunks):
+        """
+        Yields the chunks that are not duplicates.
+        """
+        for chunk in chunks:
+            kept = self.add(chunk)
+            if kept is not None:
+                yield kept
+
+    @property
+    def n_duplicates(self):
+        return self.exact_duplicates + self.near_duplicates
+
+    def report(self):
+        """
+        One-line summary of the chunks and tokens saved.
+        """
+        share = self.n_duplicates / self.n_chunks if self.n_chunks else 0.0
+        return (f"Dedup: kept {self.n_chunks - self.n_duplicates} of {self.n_chunks} chunks, dropped "
+                f"{self.exact_duplicates} exact and {self.near_duplicates} near duplicates "
+                f"({share:.1%}), {self.tokens_saved} tokens not embedded")
+
+    def remove_sources(self, paths):
+        """
+        Takes files (e.g. `changes.to_remove` of a Manifest scan) out of the
+        sources of every chunk. Chunks left without sources are forgotten, so
+        they are kept again when they next appear.
+
+        Returns
+        -------
+        n_forgotten : int
+        """
+        paths = set(paths)
+        forgotten = []
+        for chunk_id, sources in self.sources.items():
+            if paths & self._source_sets[chunk_id]:
+                self.sources[chunk_id] = [s for s in sources if s not in paths]
+                self._source_sets[chunk_id] -= paths
+                if not self.sources[chunk_id]:
+                    forgotten.append(chunk_id)
+        for chunk_id in forgotten:
+            self._forget(chunk_id)
+        return len(forgotten)
+
+    def save(self, path):
+        """
+        Writes the chunk id -> source files mapping to `duplicates.json` in
+        the index directory `path`, and the signatures of the chunks to
+        `dedup_signatures.npz`. `load` them first to keep earlier runs.
+        """
+        tmp = os.path.join(path, 'duplicates.tmp.json')
+        with open(tmp, 'w') as f:
+            json.dump(self.sources, f)
+        os.replace(tmp, os.path.join(path, DUPLICATES_FILE))
+
+        if self.near:
+            chunk_ids = list(self._signatures)
+            signatures = np.array([self._signatures[c] for c in chunk_ids], dtype=np.uint32).reshape(-1, self.num_perm)
+            tmp = os.path.join(path, 'dedup_signatures.tmp.npz')
+            np.savez(tmp, params=np.array([self.num_perm, self.shingle_size, self.seed], dtype=np.int64),
+                     chunk_ids=np.array(chunk_ids, dtype=str), signatures=signatures)
+            os.replace(tmp, os.path.join(path, SIGNATURES_FILE))
+
+    def load(self, path):
+        """
+        Reads the state written by `save` into the index directory `path`
+        (nothing if it has none) and merges it into this deduplicator.
+        Returns self.
+        """
+        file_path = os.path.join(path, DUPLICATES_FILE)
+        if not os.path.exists(file_path):
+            return self
+        with open(file_path) as f:
+            mapping = json.load(f)
+
+        signatures = {}
+        signatures_path = os.path.join(path, SIGNATURES_FILE)
+        if self.near and os.path.exists(signatures_path):
+            with np.load(signatures_path) as data:
+                if list(data['params']) != [self.num_perm, self.shingle_size, self.seed]:
+                    raise ValueError(f"{signatures_path} was written with other num_perm, shingle_size or seed")
+                signatures = dict(zip(data['chunk_ids'].tolist(), data['signatures']))
+
+        for chunk_id, sources in mapping.items():
+            if chunk_id in self.sources:
+                for source in sources:
+                    self._add_source(chunk_id, {'path': source})
+            else:
+                self._remember(chunk_id, sources, signatures.get(chunk_id))
+        return self
+
+def dedup_chunks(chunks, threshold=0.9, near=True, deduplicator=None):
+    """
+    Removes exact and near-duplicate chunks (see `Deduplicator`) and prints
+    how many chunks and tokens were saved.
+
+    Parameters
+    ----------
+    chunks : list of dict
+        Chunks as returned by `break_and_clean`.
+    threshold : float, default=0.9
+    near : bool, default=True
+    deduplicator : Deduplicator, optional
+        Reuse one across calls to also drop chunks seen in earlier batches.
+
+    Returns
+    -------
+    chunks : list of dict
+        Kept chunks, each with 'chunk_id' and 'sources'.
+    """
+    deduplicator = deduplicator or Deduplicator(threshold=threshold, near=near)
+    kept = list(deduplicator.filter(chunks))
+    print(deduplicator.report())
+    return kept
@@ -0,0 +1,187 @@
+#------------------------------------#
+# Import Libraries
+#------------------------------------#
+import os
+import re
+import math
+import hashlib
+from collections import Counter
+from functools import lru_cache
+import numpy as np
+from embedding_store import normalize_rows
+
+#------------------------------------#
+# Backend interface
+#------------------------------------#
+
+class EmbeddingBackend:
+    """
+    Something that turns texts into vectors. Subclasses implement `embed`;
+    the scheduler, `create_and_append_embeddings` and the query functions
+    only talk to this interface.
+    """
+
+    def embed(self, texts, model, **kwargs):
+        """
+        Embeds a batch of texts.
+
+        Parameters
+        ----------
+        texts : list of str
+        model : str
+        **kwargs
+            Extra request options (e.g. dimensions).
+
+        Returns
+        -------
+        embeddings : list of array-like
+            One vector per text, in input order.
+        """
+        raise NotImplementedError
+
+class OpenAIBackend(EmbeddingBackend):
+    """
+    Embeddings from the OpenAI API. The client is created on first use, so
+    importing the scripts needs neither network access nor an API key.
+
+    Parameters
+    ----------
+    client : openai.OpenAI, optional
+        Client to use. By default one is created with `max_retries=0`
+        (retries are handled by `EmbeddingScheduler`) and `client_kwargs`.
+    **client_kwargs
+        Passed to `OpenAI(...)`, e.g. base_url or api_key.
+    """
+
+    def __init__(self, client=None, **client_kwargs):
+        self._client = client
+        self.client_kwargs = client_kwargs
+
+    @property
+    def client(self):
+        if self._client is None:
+            from openai import OpenAI
+            # no need to pass api key as long as it's an env variable named OPENAI_API_KEY
+            self._client = OpenAI(**{'max_retries': 0, **self.client_kwargs})
+        return self._client
+
+    def embed(self, texts, model, **kwargs):
+        res = self.client.embeddings.create(input=list(texts), model=model, **kwargs)
+        return [record.embedding for record in res.data]
+
+#------------------------------------#
+# Deterministic local backend
+#------------------------------------#
+
+TOKEN_PATTERN = re.compile(r'\w+')
+
+@lru_cache(maxsize=2**18)
+def feature_slots(feature, dim, n_hashes, seed):
+    """
+    The `n_hashes` output coordinates and signs of a hashed feature: one
+    column of a sparse random projection, generated on demand.
+    """
+    digest = hashlib.blake2b(feature.encode('utf-8'), digest_size=8 * n_hashes,
+                             key=seed.to_bytes(8, 'little')).digest()
+    values = np.frombuffer(digest, dtype=np.uint64)
+    slots = (values % np.uint64(dim)).astype(np.int64)
+    signs = np.where(values & np.uint64(1 << 63), -1.0, 1.0)
+    return slots, signs
+
+class LocalBackend(EmbeddingBackend):
+    """
+    Deterministic embeddings computed locally, for running every stage
+    offline (tests, benchmarks, demos). Words and word bigrams are feature
+    hashed and projected to `dim` with a sparse random projection, so texts
+    that share words get similar vectors. Same text, same vector, in every
+    process.
+
+    Parameters
+    ----------
+    dim : int, default=1536
+        Output dimension (overridden by a `dimensions` argument).
+    n_hashes : int, default=4
+        Non-zero coordinates per feature.
+    bigrams : bool, default=True
+    seed : int, default=0
+
+    Example
+    -------
+    >>> set_default_backend(LocalBackend())
+    >>> store = create_and_append_embeddings(new_data)
+    >>> prompt = retrieve('How do I post an invoice?', store)
+    """
+
+    def __init__(self, dim=1536, n_hashes=4, bigrams=True, seed=0):
+        self.dim = int(dim)
+        self.n_hashes = int(n_hashes)
+        self.bigrams = bigrams
+        self.seed = int(seed)
+
+    def features(self, text):
+        """
+        Hashed features of a text with their weights (1 + log count).
+        """
+        words = TOKEN_PATTERN.findall(text.lower())
+        counts = Counter(words)
+        if self.bigrams:
+            counts.update(f"{a} {b}" for a, b in zip(words, words[1:]))
+        return {feature: 1.0 + math.log(count) for feature, count in counts.items()}
+
+    def embed(self, texts, model=None, dimensions=None, **kwargs):
+        dim = int(dimensions or self.dim)
+        vectors = np.zeros((len(texts), dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            features = self.features(text)
+            if not features:
+                continue
+            slots, signs = zip(*(feature_slots(f, dim, self.n_hashes, self.seed) for f in features))
+            weights = np.repeat(list(features.values()), self.n_hashes)
+            vectors[i] = np.bincount(np.concatenate(slots), weights=np.concatenate(signs) * weights,
+                                     minlength=dim)
+        return list(normalize_rows(vectors))
+
+#------------------------------------#
+# Default backend
+#------------------------------------#
+
+BACKENDS = {
+    'openai': OpenAIBackend,
+    'local': LocalBackend,
+}
+
+_default_backend = None
+
+def get_default_backend():
+    """
+    Backend used when none is passed: set with `set_default_backend`, or
+    chosen by the EMBEDDING_BACKEND environment variable ('openai', the
+    default, or 'local'). Created on first use.
+    """
+    global _default_backend
+    if _default_backend is None:
+        name = os.environ.get('EMBEDDING_BACKEND', 'openai')
+        if name not in BACKENDS:
+            raise ValueError(f"Unknown EMBEDDING_BACKEND: {name}")
+        _default_backend = BACKENDS[name]()
+    return _default_backend
+
+def set_default_backend(backend):
+    """
+    Makes `backend` (an EmbeddingBackend or an OpenAI client) the default.
+    """
+    global _default_backend
+    _default_backend = as_backend(backend)
+
+def as_backend(backend=None):
+    """
+    Returns an EmbeddingBackend: `backend` itself, an OpenAI-compatible client
+    wrapped in OpenAIBackend, or the default backend if None.
+    """
+    if backend is None:
+        return get_default_backend()
+    if isinstance(backend, EmbeddingBackend):
+        return backend
+    if hasattr(backend, 'embeddings'):
+        return OpenAIBackend(client=backend)
+    raise TypeError(f"Not an embedding backend or client: {type(backend).__name__}")
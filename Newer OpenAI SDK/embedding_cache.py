@@ -0,0 +1,311 @@
+#------------------------------------#
+# Import Libraries
+#------------------------------------#
+import re
+import time
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+import numpy as np
+from embedding_store import normalize_rows
+from instrumentation import metrics
+
+#------------------------------------#
+# Persistent embedding cache
+#------------------------------------#
+
+def text_hash(text):
+    """
+    SHA-256 of the chunk text, used as the content key of the cache.
+    """
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+class EmbeddingCache:
+    """
+    Local SQLite cache of embeddings keyed on (model, dimensions, hash of text),
+    so unchanged chunks are never sent to the API twice.
+
+    Least recently used entries are evicted once the stored vectors exceed
+    `max_bytes`. Hits and misses are counted for the end-of-run report.
+
+    One connection is shared by all threads (e.g. the embedding stage of
+    `run_pipeline`) and every access to it holds a lock.
+
+    Parameters
+    ----------
+    path : str, default='embedding_cache.sqlite'
+        SQLite file. Use ':memory:' for a throwaway cache.
+    max_bytes : int, default=2 GB
+        Size limit for the stored vectors.
+
+    Example
+    -------
+    >>> cache = EmbeddingCache('embedding_cache.sqlite')
+    >>> store = create_and_append_embeddings(new_data, cache=cache)
+    >>> print(cache.report())
+    """
+
+    def __init__(self, path='embedding_cache.sqlite', max_bytes=2 * 1024**3):
+        self.path = path
+        self.max_bytes = int(max_bytes)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " model TEXT NOT NULL,"
+            " dimensions INTEGER NOT NULL,"
+            " text_hash TEXT NOT NULL,"
+            " vector BLOB NOT NULL,"
+            " nbytes INTEGER NOT NULL,"
+            " last_used REAL NOT NULL,"
+            " PRIMARY KEY (model, dimensions, text_hash))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_used ON embeddings (last_used)")
+        self._conn.commit()
+
+    def get_many(self, texts, model, dimensions=None, chunk_size=500):
+        """
+        Looks up the embeddings of many texts.
+
+        Parameters
+        ----------
+        texts : list of str
+        model : str
+        dimensions : int, optional
+            Requested output dimension (None for the model default).
+
+        Returns
+        -------
+        embeddings : list of numpy.ndarray or None
+            One entry per text; None where the cache has no entry.
+        """
+        hashes = [text_hash(t) for t in texts]
+        found = {}
+        dims = dimensions or 0
+
+        with self._lock:
+            for start in range(0, len(hashes), chunk_size):
+                chunk = list(set(hashes[start:start + chunk_size]))
+                placeholders = ','.join('?' * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings"
+                    f" WHERE model = ? AND dimensions = ? AND text_hash IN ({placeholders})",
+                    [model, dims, *chunk],
+                ).fetchall()
+                for h, blob in rows:
+                    found[h] = np.frombuffer(blob, dtype=np.float32)
+
+            # Refresh the LRU timestamp of the entries that were used
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE model = ? AND dimensions = ? AND text_hash = ?",
+                    [(now, model, dims, h) for h in found],
+                )
+                self._conn.commit()
+
+            embeddings = [found.get(h) for h in hashes]
+            n_hits = sum(e is not None for e in embeddings)
+            self.hits += n_hits
+            self.misses += len(embeddings) - n_hits
+        metrics.count('embedding_cache.hits', n_hits)
+        metrics.count('embedding_cache.misses', len(embeddings) - n_hits)
+        return embeddings
+
+    def put_many(self, texts, embeddings, model, dimensions=None):
+        """
+        Stores embeddings for texts, then evicts old entries if over `max_bytes`.
+        """
+        now = time.time()
+        dims = dimensions or 0
+        rows = []
+        for text, emb in zip(texts, embeddings):
+            blob = np.asarray(emb, dtype=np.float32).tobytes()
+            rows.append((model, dims, text_hash(text), blob, len(blob), now))
+
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?, ?, ?)", rows)
+            self._conn.commit()
+            self.evict()
+
+    def size_bytes(self):
+        """
+        Total size of the stored vectors.
+        """
+        with self._lock:
+            return self._conn.execute("SELECT COALESCE(SUM(nbytes), 0) FROM embeddings").fetchone()[0]
+
+    def evict(self):
+        """
+        Removes least recently used entries until the cache fits in `max_bytes`.
+
+        Returns
+        -------
+        n_evicted : int
+        """
+        with self._lock:
+            excess = self.size_bytes() - self.max_bytes
+            if excess <= 0:
+                return 0
+
+            victims = []
+            freed = 0
+            for rowid, nbytes in self._conn.execute("SELECT rowid, nbytes FROM embeddings ORDER BY last_used"):
+                victims.append((rowid,))
+                freed += nbytes
+                if freed >= excess:
+                    break
+
+            self._conn.executemany("DELETE FROM embeddings WHERE rowid = ?", victims)
+            self._conn.commit()
+        metrics.count('embedding_cache.evicted', len(victims))
+        return len(victims)
+
+    def reset_stats(self):
+        """
+        Zeroes the hit/miss counters (e.g. at the start of a run).
+        """
+        self.hits = 0
+        self.misses = 0
+
+    def report(self):
+        """
+        One-line summary of hits, misses and cache size.
+        """
+        total = self.hits + self.misses
+        rate = self.hits / total if total else 0.0
+        return (f"Embedding cache: {self.hits} hits, {self.misses} misses ({rate:.1%} hit rate), "
+                f"{self.size_bytes() / 1024**2:.1f} MB stored")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+#------------------------------------#
+# In-memory query embedding cache
+#------------------------------------#
+
+def normalize_query(text, ignore_case=False):
+    """
+    Canonical form of a query for cache lookups: Unicode NFKC, whitespace
+    collapsed and stripped (and lowercased if `ignore_case`).
+    """
+    text = re.sub(r'\s+', ' ', unicodedata.normalize('NFKC', text)).strip()
+    return text.lower() if ignore_case else text
+
+class QueryCache:
+    """
+    In-memory LRU cache of query embeddings with a time-to-live, keyed on
+    (model, dimensions, normalized query text). Repeated queries skip the
+    embedding request entirely.
+
+    Vectors are stored L2-normalized, so a cached query can be scored
+    against the (normalized) store rows with a plain dot product.
+
+    Parameters
+    ----------
+    max_entries : int, default=10000
+    ttl : float, default=3600
+        Seconds an entry stays valid. None keeps entries until evicted.
+    ignore_case : bool, default=False
+        Treat queries that differ only in case as the same query.
+
+    Example
+    -------
+    >>> query_cache = QueryCache(max_entries=50000, ttl=24 * 3600)
+    >>> prompt = retrieve('How do I post an invoice?', store, query_cache=query_cache)
+    >>> print(query_cache.report())
+    """
+
+    def __init__(self, max_entries=10000, ttl=3600, ignore_case=False):
+        self.max_entries = int(max_entries)
+        self.ttl = ttl
+        self.ignore_case = ignore_case
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self._entries = OrderedDict() # key -> (vector, expires_at)
+        self._lock = threading.Lock()
+
+    def _key(self, text, model, dimensions):
+        return (model, dimensions or 0, normalize_query(text, self.ignore_case))
+
+    def get_many(self, texts, model, dimensions=None):
+        """
+        Looks up many queries.
+
+        Returns
+        -------
+        embeddings : list of numpy.ndarray or None
+            One normalized vector per query; None on a miss.
+        """
+        now = time.monotonic()
+        embeddings = []
+        n_expired = 0
+        with self._lock:
+            for text in texts:
+                key = self._key(text, model, dimensions)
+                entry = self._entries.get(key)
+                if entry is not None and entry[1] is not None and entry[1] <= now:
+                    del self._entries[key]
+                    n_expired += 1
+                    entry = None
+                if entry is None:
+                    embeddings.append(None)
+                else:
+                    self._entries.move_to_end(key)
+                    embeddings.append(entry[0])
+            n_hits = sum(e is not None for e in embeddings)
+            self.hits += n_hits
+            self.misses += len(embeddings) - n_hits
+            self.expired += n_expired
+        metrics.count('query_cache.hits', n_hits)
+        metrics.count('query_cache.misses', len(embeddings) - n_hits)
+        metrics.count('query_cache.expired', n_expired)
+        return embeddings
+
+    def put_many(self, texts, embeddings, model, dimensions=None):
+        """
+        Stores query embeddings (normalized on the way in), evicting the
+        least recently used entries beyond `max_entries`.
+        """
+        vectors = normalize_rows(np.array(embeddings, dtype=np.float32).reshape(len(texts), -1))
+        expires_at = None if self.ttl is None else time.monotonic() + self.ttl
+        with self._lock:
+            for text, vector in zip(texts, vectors):
+                key = self._key(text, model, dimensions)
+                self._entries[key] = (vector, expires_at)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def reset_stats(self):
+        """
+        Zeroes the hit/miss counters.
+        """
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def report(self):
+        """
+        One-line summary of hits, misses and size.
+        """
+        return (f"Query cache: {self.hits} hits, {self.misses} misses ({self.hit_rate():.1%} hit rate), "
+                f"{self.expired} expired, {len(self)} entries")
@@ -0,0 +1,263 @@
+#------------------------------------#
+# Import Libraries
+#------------------------------------#
+import os
+import json
+import time
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from tqdm.auto import tqdm
+from batching import count_tokens
+from embedding_backends import as_backend
+from instrumentation import metrics
+
+# Retry queue kept in an index directory when the scheduler is created for it
+RETRY_QUEUE_FILE = 'failed_batches.jsonl'
+
+#------------------------------------#
+# Rate limiting
+#------------------------------------#
+
+class TokenBucket:
+    """
+    Thread-safe token bucket refilled continuously at `rate_per_minute`.
+
+    Parameters
+    ----------
+    rate_per_minute : float
+        Refill rate. None disables the limit.
+    capacity : float, optional
+        Maximum burst. Defaults to one minute's worth.
+    """
+
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = None if rate_per_minute is None else rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, amount=1):
+        """
+        Blocks until `amount` tokens are available, then takes them.
+        Requests larger than the capacity are let through once the bucket is full.
+        """
+        if self.rate is None:
+            return
+        amount = min(amount, self.capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return
+                wait = (amount - self._tokens) / self.rate
+            time.sleep(wait)
+
+#------------------------------------#
+# Retry helpers
+#------------------------------------#
+
+def retry_after_seconds(error):
+    """
+    Reads a Retry-After (or retry-after-ms) header from an API error, if any.
+    """
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None)
+    if not headers:
+        return None
+    try:
+        if headers.get('retry-after-ms') is not None:
+            return float(headers['retry-after-ms']) / 1000.0
+        if headers.get('retry-after') is not None:
+            return float(headers['retry-after'])
+    except (TypeError, ValueError):
+        return None
+    return None
+
+def is_retryable(error):
+    """
+    Rate limits, timeouts, connection problems and 5xx are retried; other 4xx
+    (bad request, auth) will not succeed on a second try.
+    """
+    status = getattr(error, 'status_code', None)
+    if status is None:
+        return True
+    return status in (408, 409, 429) or status >= 500
+
+def to_json(value):
+    """
+    Converts the numpy values found in chunk metadata for json.dumps.
+    """
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+#------------------------------------#
+# Scheduler
+#------------------------------------#
+
+class EmbeddingScheduler:
+    """
+    Sends embedding requests concurrently while staying under the account's
+    requests-per-minute and tokens-per-minute limits.
+
+    Failed requests are retried with exponential backoff and full jitter,
+    honouring Retry-After when the API sends it. Batches that still fail are
+    appended to a durable JSONL retry queue instead of being dropped; replay
+    them later with `retry_failed`.
+
+    Parameters
+    ----------
+    backend : EmbeddingBackend or openai.OpenAI, optional
+        Where the requests go (see `embedding_backends.py`). Defaults to the
+        default backend. An OpenAI client should be created with
+        `max_retries=0` so the SDK does not retry underneath the scheduler.
+    max_in_flight : int, default=4
+        Concurrent requests.
+    requests_per_minute : float, optional
+    tokens_per_minute : float, optional
+    max_retries : int, default=6
+    base_delay : float, default=1.0
+        First backoff delay in seconds (doubles on every retry).
+    max_delay : float, default=60.0
+    retry_queue_path : str, optional
+        JSONL file where batches that exhausted their retries are kept, with
+        the metadata passed to `embed_batches`. Without it they are only
+        reported. `create_and_append_embeddings` and `run_pipeline` default to
+        RETRY_QUEUE_FILE in the index directory.
+
+    Example
+    -------
+    >>> scheduler = EmbeddingScheduler(OpenAI(max_retries=0), max_in_flight=8,
+    >>>                                requests_per_minute=3000, tokens_per_minute=1_000_000,
+    >>>                                retry_queue_path='failed_batches.jsonl')
+    >>> store = create_and_append_embeddings(new_data, scheduler=scheduler)
+    """
+
+    def __init__(self, backend=None, max_in_flight=4, requests_per_minute=None, tokens_per_minute=None,
+                 max_retries=6, base_delay=1.0, max_delay=60.0, retry_queue_path=None):
+        self.backend = as_backend(backend)
+        self.max_in_flight = int(max_in_flight)
+        self.request_bucket = TokenBucket(requests_per_minute)
+        self.token_bucket = TokenBucket(tokens_per_minute)
+        self.max_retries = int(max_retries)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_queue_path = retry_queue_path
+        self.retries = 0
+        self.failures = 0
+        self._queue_lock = threading.Lock()
+
+    def _backoff(self, attempt, error):
+        retry_after = retry_after_seconds(error)
+        if retry_after is not None:
+            return retry_after + random.uniform(0, self.base_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def _send(self, texts, embed_model, request_kwargs, n_tokens=None, metadata=None):
+        """
+        One request with rate limiting and retries. Returns the list of
+        embeddings, or None after the retries are exhausted.
+        """
+        if n_tokens is None:
+            n_tokens = sum(count_tokens(texts, embed_model))
+
+        for attempt in range(self.max_retries + 1):
+            with metrics.timer('embedding_scheduler.throttle'):
+                self.request_bucket.acquire(1)
+                self.token_bucket.acquire(n_tokens)
+            try:
+                with metrics.timer('embedding_scheduler.request'):
+                    embeds = self.backend.embed(texts, embed_model, **request_kwargs)
+            except Exception as e:
+                metrics.count('embedding_scheduler.errors', status=getattr(e, 'status_code', None))
+                if attempt == self.max_retries or not is_retryable(e):
+                    self._enqueue_failed(texts, embed_model, request_kwargs, e, metadata)
+                    return None
+                self.retries += 1
+                metrics.count('embedding_scheduler.retries')
+                time.sleep(self._backoff(attempt, e))
+            else:
+                metrics.count('embedding_scheduler.texts', len(texts))
+                metrics.count('embedding_scheduler.tokens', n_tokens)
+                return embeds
+
+    def _enqueue_failed(self, texts, embed_model, request_kwargs, error, metadata=None):
+        self.failures += 1
+        metrics.count('embedding_scheduler.failures')
+        print(f"Failed to create embeddings for a batch of {len(texts)} texts: {error}")
+        if self.retry_queue_path is None:
+            return
+        entry = json.dumps({'model': embed_model, 'kwargs': request_kwargs, 'texts': texts, 'metadata': metadata,
+                            'error': str(error), 'time': time.time()}, default=to_json)
+        os.makedirs(os.path.dirname(os.path.abspath(self.retry_queue_path)), exist_ok=True)
+        with self._queue_lock, open(self.retry_queue_path, 'a') as f:
+            f.write(entry + '\n')
+
+    def embed_batches(self, batches, embed_model, token_counts=None, show_progress=True, metadata=None,
+                      **request_kwargs):
+        """
+        Embeds many batches concurrently.
+
+        Parameters
+        ----------
+        batches : list of list of str
+        embed_model : str
+        token_counts : list of int, optional
+            Tokens per batch for the tokens-per-minute limit (estimated if not given).
+        show_progress : bool, default=True
+        metadata : list of list, optional
+            One JSON-serializable value per text of each batch (e.g. the chunk
+            it belongs to), kept with failed batches in the retry queue.
+        **request_kwargs
+            Extra request options for the backend (e.g. dimensions).
+
+        Returns
+        -------
+        results : list
+            One entry per batch, in input order: the list of embeddings, or
+            None if the batch failed (it is then in the retry queue).
+        """
+        results = [None] * len(batches)
+        if token_counts is None:
+            token_counts = [None] * len(batches)
+        if metadata is None:
+            metadata = [None] * len(batches)
+        with ThreadPoolExecutor(max_workers=self.max_in_flight) as pool:
+            futures = {pool.submit(self._send, texts, embed_model, request_kwargs, n_tokens, batch_metadata): i
+                       for i, (texts, n_tokens, batch_metadata) in enumerate(zip(batches, token_counts, metadata))}
+            for future in tqdm(as_completed(futures), total=len(futures), disable=not show_progress):
+                results[futures[future]] = future.result()
+        return results
+
+    def retry_failed(self):
+        """
+        Replays the batches in the retry queue.
+
+        Returns
+        -------
+        recovered : list of (list of str, list of embeddings, list or None)
+            Texts, embeddings and metadata (as passed to `embed_batches`) of
+            the batches that succeeded this time. Batches that fail again stay
+            in the queue. See `retry_failed_embeddings` in create_embeddings.py
+            to add them to an index.
+        """
+        if self.retry_queue_path is None or not os.path.exists(self.retry_queue_path):
+            return []
+
+        with self._queue_lock:
+            with open(self.retry_queue_path) as f:
+                entries = [json.loads(line) for line in f if line.strip()]
+            os.remove(self.retry_queue_path)
+
+        recovered = []
+        for entry in entries:
+            metadata = entry.get('metadata')
+            embeds = self._send(entry['texts'], entry['model'], entry.get('kwargs', {}), metadata=metadata)
+            if embeds is not None:
+                recovered.append((entry['texts'], embeds, metadata))
+        return recovered
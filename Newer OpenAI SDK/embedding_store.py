@@ -0,0 +1,480 @@
+#------------------------------------#
+# Import Libraries
+#------------------------------------#
+import os
+import json
+import numpy as np
+import pandas as pd
+from metadata_index import MetadataIndex, FILTERS_FILE
+
+# File names inside an index directory written by EmbeddingStore.save
+VECTORS_FILE = 'vectors.npy'
+METADATA_FILE = 'metadata.parquet'
+INFO_FILE = 'index.json'
+FORMAT_VERSION = 1
+
+# Metadata columns stored as lists whatever the rows hold (PDF headings are a
+# plain title), with the type of their items
+LIST_COLUMNS = {'headings': str, 'images': str, 'heading_levels': int, 'sources': str}
+
+#------------------------------------#
+# Helpers
+#------------------------------------#
+
+def normalize_rows(vectors):
+    """
+    L2-normalizes each row of a 2-D array (in place for float32 input).
+
+    Parameters
+    ----------
+    vectors : numpy.ndarray of shape (n, dim)
+
+    Returns
+    -------
+    vectors : numpy.ndarray of shape (n, dim), dtype float32
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors.reshape(1, -1)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0 # Leave all-zero vectors untouched
+    vectors /= norms
+    return vectors
+
+def top_k_from_scores(scores, k):
+    """
+    Selects the top `k` entries of each row of a score matrix using a partial
+    selection (argpartition) instead of a full sort.
+
+    Parameters
+    ----------
+    scores : numpy.ndarray of shape (n_queries, n_rows)
+    k : int
+
+    Returns
+    -------
+    indices : numpy.ndarray of shape (n_queries, k)
+        Column ids, highest score first.
+    scores : numpy.ndarray of shape (n_queries, k)
+    """
+    n_rows = scores.shape[1]
+    k = min(int(k), n_rows)
+    if k <= 0:
+        empty = np.empty((scores.shape[0], 0))
+        return empty.astype(np.int64), empty.astype(scores.dtype)
+
+    if k < n_rows:
+        candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        candidates = np.tile(np.arange(n_rows), (scores.shape[0], 1))
+    candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+
+    # Only the k survivors get sorted (ties broken by the lower row id)
+    order = np.lexsort((candidates, -candidate_scores), axis=1)
+    indices = np.take_along_axis(candidates, order, axis=1)
+    return indices, np.take_along_axis(candidate_scores, order, axis=1)
+
+def truncate_embeddings(vectors, dim):
+    """
+    Keeps the first `dim` coordinates of each vector and renormalizes. For
+    models trained for it (text-embedding-3-*), this is equivalent to
+    requesting `dimensions=dim` from the API.
+
+    Parameters
+    ----------
+    vectors : array-like of shape (n, full_dim)
+    dim : int
+
+    Returns
+    -------
+    vectors : numpy.ndarray of shape (n, dim), dtype float32
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors.reshape(1, -1)
+    if dim > vectors.shape[1]:
+        raise ValueError(f"Cannot truncate embeddings of dimension {vectors.shape[1]} to {dim}")
+    return normalize_rows(np.array(vectors[:, :dim]))
+
+def rerank_candidates(vectors, queries, candidates, k):
+    """
+    Re-scores candidate rows of each query exactly and keeps the top `k`.
+
+    Parameters
+    ----------
+    vectors : numpy.ndarray of shape (n_rows, dim)
+        Full-precision normalized rows (may be memory-mapped).
+    queries : numpy.ndarray of shape (n_queries, dim)
+        Normalized queries.
+    candidates : numpy.ndarray of shape (n_queries, n_candidates)
+    k : int
+
+    Returns
+    -------
+    indices, scores : numpy.ndarray of shape (n_queries, k)
+    """
+    k = min(k, candidates.shape[1])
+    indices = np.empty((len(queries), k), dtype=np.int64)
+    scores = np.empty((len(queries), k), dtype=np.float32)
+    for q, (query, rows) in enumerate(zip(queries, candidates)):
+        rows = np.sort(rows) # ascending reads from a memory-mapped file
+        best, best_scores = top_k_from_scores((vectors[rows] @ query)[None, :], k)
+        indices[q], scores[q] = rows[best[0]], best_scores[0]
+    return indices, scores
+
+def to_columnar(df):
+    """
+    Makes metadata safe for a columnar file: list-like cells become lists of
+    numbers if all their items are numbers and lists of str otherwise, and
+    other non-primitive objects (e.g. PIL images) become str.
+    The `LIST_COLUMNS`, and any column that mixes lists and scalars, are
+    stored as lists throughout (a missing value is an empty list), so every
+    shard of an index agrees on their type.
+    """
+    df = df.copy()
+    for col in df.columns:
+        if df[col].dtype != object and col not in LIST_COLUMNS:
+            continue
+        values = df[col].tolist()
+        if col in LIST_COLUMNS or any(isinstance(v, (list, tuple, np.ndarray)) for v in values):
+            cast = LIST_COLUMNS.get(col)
+            if cast is None:
+                items = [x for v in values if isinstance(v, (list, tuple, np.ndarray)) for x in v]
+                numeric = items and all(isinstance(x, (int, float, np.integer, np.floating))
+                                        and not isinstance(x, bool) for x in items)
+                cast = (lambda x: x) if numeric else str
+            df[col] = [[cast(x) for x in v] if isinstance(v, (list, tuple, np.ndarray))
+                       else ([] if v is None or pd.isna(v) else [cast(v)]) for v in values]
+        else:
+            df[col] = [v if v is None or isinstance(v, (str, int, float, bool)) else str(v)
+                       for v in values]
+    return df
+
+#------------------------------------#
+# Embedding Store
+#------------------------------------#
+
+class EmbeddingStore:
+    """
+    Keeps embedding vectors in one contiguous, L2-normalized float32 matrix
+    with the chunk metadata aligned row by row.
+
+    Because rows are normalized when they are added, cosine similarity against
+    a (normalized) query is a single matrix-vector product over `vectors`.
+
+    Parameters
+    ----------
+    dim : int
+        Dimension of the embedding vectors.
+    capacity : int, default=1024
+        Number of rows to preallocate. The matrix doubles when it fills up.
+    embed_model : str, optional
+        Model the vectors come from.
+    dimensions : int, optional
+        `dimensions` requested from the model (None for its default). Saved
+        with the index so query embeddings are requested with the same value.
+
+    Example
+    -------
+    >>> store = EmbeddingStore(dim=1536, capacity=len(new_data))
+    >>> store.add(embeds, meta_batch)
+    >>> scores = store.score(query_embedding)
+    >>> store.save('my_index')
+    >>> store = EmbeddingStore.open('my_index') # memory-mapped, opens in milliseconds
+    """
+
+    def __init__(self, dim, capacity=1024, embed_model=None, dimensions=None):
+        self.dim = int(dim)
+        self.embed_model = embed_model
+        self.dimensions = dimensions
+        self._vectors = np.empty((max(int(capacity), 1), self.dim), dtype=np.float32)
+        self._size = 0
+        self._records = []
+        self._metadata = None
+        self._metadata_path = None
+        self._metadata_index = None
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def vectors(self):
+        """Normalized float32 matrix of shape (len(store), dim). A view, not a copy."""
+        return self._vectors[:self._size]
+
+    @property
+    def metadata(self):
+        """Chunk metadata as a DataFrame whose index is the row id into `vectors`."""
+        if self._records is None:
+            # Opened from disk: read the columnar file on first use only
+            if self._metadata is None:
+                self._metadata = pd.read_parquet(self._metadata_path)
+            return self._metadata
+        if self._metadata is None or len(self._metadata) != self._size:
+            self._metadata = pd.DataFrame.from_records(self._records)
+        return self._metadata
+
+    @property
+    def metadata_index(self):
+        """
+        Inverted indexes over the metadata (see `metadata_index.MetadataIndex`):
+        read from the index directory if it was saved with one, built from
+        the metadata otherwise.
+        """
+        if self._metadata_index is None or len(self._metadata_index) != self._size:
+            index_dir = os.path.dirname(self._metadata_path) if self._metadata_path else None
+            if self._records is None and index_dir and os.path.exists(os.path.join(index_dir, FILTERS_FILE)):
+                self._metadata_index = MetadataIndex.load(index_dir)
+            else:
+                self._metadata_index = MetadataIndex.build(self.metadata)
+        return self._metadata_index
+
+    def select_rows(self, folder_prefix=None, files=None, title_contains=None, heading_contains=None):
+        """
+        Row ids matching metadata predicates (see `MetadataIndex.select`), or
+        None if no predicate is given.
+
+        Returns
+        -------
+        rows : numpy.ndarray of int, or None
+            Sorted row ids, to pass as `search(..., rows=rows)`.
+        """
+        mask = self.metadata_index.select(folder_prefix=folder_prefix, files=files,
+                                          title_contains=title_contains, heading_contains=heading_contains)
+        return None if mask is None else np.flatnonzero(mask)
+
+    def _reserve(self, n_new):
+        needed = self._size + n_new
+        if needed <= self._vectors.shape[0]:
+            return
+        capacity = max(needed, 2 * self._vectors.shape[0])
+        grown = np.empty((capacity, self.dim), dtype=np.float32)
+        grown[:self._size] = self._vectors[:self._size]
+        self._vectors = grown
+
+    def add(self, embeddings, metadata):
+        """
+        Appends embeddings and their metadata to the store.
+
+        Parameters
+        ----------
+        embeddings : array-like of shape (n, dim)
+        metadata : list of dict
+            One record per embedding (file, text, title, ...).
+
+        Returns
+        -------
+        row_ids : numpy.ndarray of int
+            Row ids assigned to the new entries.
+        """
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if embeddings.ndim == 1:
+            embeddings = embeddings.reshape(1, -1)
+        if embeddings.shape[1] != self.dim:
+            raise ValueError(f"Expected embeddings of dimension {self.dim}, got {embeddings.shape[1]}")
+        if len(metadata) != len(embeddings):
+            raise ValueError("embeddings and metadata must have the same length")
+
+        if self._records is None:
+            # Appending to an opened index: take ownership of the metadata
+            self._records = self.metadata.to_dict('records')
+
+        n = len(embeddings)
+        self._reserve(n)
+        start = self._size
+        block = self._vectors[start:start + n]
+        block[:] = embeddings
+        normalize_rows(block)
+        self._records.extend(metadata)
+        self._size += n
+        self._metadata_index = None
+
+        return np.arange(start, start + n)
+
+    def remove(self, row_ids):
+        """
+        Drops rows from the store and compacts it. Row ids of the remaining
+        rows shift down, so rebuild any index built on the old ids.
+
+        Parameters
+        ----------
+        row_ids : array-like of int
+
+        Returns
+        -------
+        n_removed : int
+        """
+        drop = np.zeros(self._size, dtype=bool)
+        drop[np.asarray(row_ids, dtype=np.int64)] = True
+        n_removed = int(drop.sum())
+        if n_removed == 0:
+            return 0
+
+        keep = np.flatnonzero(~drop)
+        records = self.metadata.to_dict('records') if self._records is None else self._records
+        self._vectors = np.ascontiguousarray(self.vectors[keep]) # also detaches from a memory map
+        self._records = [records[i] for i in keep]
+        self._metadata = None
+        self._metadata_index = None
+        self._size = len(keep)
+        return n_removed
+
+    def match_queries(self, query_embeddings):
+        """
+        Normalized float32 queries of the store's dimension. Wider query
+        vectors (e.g. the model's full output when the store was built with
+        `dimensions`) are prefix-truncated; narrower ones raise ValueError.
+        """
+        queries = np.array(query_embeddings, dtype=np.float32)
+        if queries.ndim == 1:
+            queries = queries.reshape(1, -1)
+        if queries.shape[1] > self.dim:
+            return truncate_embeddings(queries, self.dim)
+        if queries.shape[1] < self.dim:
+            raise ValueError(f"Query embeddings have dimension {queries.shape[1]}, the store has {self.dim}")
+        return normalize_rows(queries)
+
+    def score(self, query_embedding):
+        """
+        Cosine similarity between one query vector and every stored row.
+
+        Parameters
+        ----------
+        query_embedding : array-like of shape (dim,)
+
+        Returns
+        -------
+        similarities : numpy.ndarray of shape (len(store),)
+        """
+        query = self.match_queries(query_embedding)[0]
+        return self.vectors @ query
+
+    def search(self, query_embeddings, k=3, rows=None):
+        """
+        Finds the `k` most similar rows for many queries at once: one
+        matrix-matrix product followed by a partial top-k selection.
+
+        Parameters
+        ----------
+        query_embeddings : array-like of shape (n_queries, dim)
+        k : int, default=3
+        rows : array-like of int, optional
+            Sorted row ids to search (e.g. from `select_rows`). Only these rows
+            are read and scored.
+
+        Returns
+        -------
+        indices : numpy.ndarray of shape (n_queries, k)
+            Row ids, most similar first.
+        scores : numpy.ndarray of shape (n_queries, k)
+        """
+        queries = self.match_queries(query_embeddings)
+        if rows is None:
+            return top_k_from_scores(queries @ self.vectors.T, k)
+        rows = np.asarray(rows, dtype=np.int64)
+        indices, scores = top_k_from_scores(queries @ self.vectors[rows].T, k)
+        return rows[indices], scores
+
+    def top_k(self, query_embedding, n=3):
+        """
+        Finds the `n` rows most similar to a single query vector.
+
+        Returns
+        -------
+        indices : numpy.ndarray of int
+            Row ids, most similar first.
+        scores : numpy.ndarray of float32
+        """
+        indices, scores = self.search([query_embedding], k=n)
+        return indices[0], scores[0]
+
+    @classmethod
+    def from_dataframe(cls, df, embedding_column='embedding'):
+        """
+        Builds a store from a DataFrame with a list-valued embedding column,
+        i.e. the format previously returned by `create_and_append_embeddings`.
+
+        The conversion happens once; query the returned store afterwards.
+        """
+        embeddings = np.array(list(df[embedding_column]), dtype=np.float32)
+        store = cls(dim=embeddings.shape[1], capacity=len(embeddings))
+        records = df.drop(columns=[embedding_column]).to_dict('records')
+        store.add(embeddings, records)
+        return store
+
+    def save(self, path):
+        """
+        Writes the store to an index directory: the vectors as a raw `.npy`
+        matrix (memory-mappable), the metadata as Parquet, and a small JSON
+        header.
+
+        Every file is written next to its target and then renamed over it, so
+        a store opened (memory-mapped) from `path` can be saved back in place:
+        readers keep the old files until they reopen the index.
+
+        Parameters
+        ----------
+        path : str
+            Directory to write to (created if needed).
+        """
+        os.makedirs(path, exist_ok=True)
+        metadata, metadata_index = self.metadata, self.metadata_index # read before anything is replaced
+
+        tmp_vectors = os.path.join(path, 'vectors.tmp.npy')
+        tmp_metadata = os.path.join(path, 'metadata.tmp.parquet')
+        tmp_info = os.path.join(path, 'index.tmp.json')
+        np.save(tmp_vectors, self.vectors)
+        to_columnar(metadata).to_parquet(tmp_metadata, index=False)
+        with open(tmp_info, 'w') as f:
+            json.dump({'format_version': FORMAT_VERSION, 'dim': self.dim, 'count': self._size,
+                       'embed_model': self.embed_model, 'dimensions': self.dimensions}, f)
+
+        os.replace(tmp_vectors, os.path.join(path, VECTORS_FILE))
+        os.replace(tmp_metadata, os.path.join(path, METADATA_FILE))
+        os.replace(tmp_info, os.path.join(path, INFO_FILE))
+        metadata_index.save(path)
+
+    @classmethod
+    def open(cls, path, mmap=True):
+        """
+        Opens an index directory written by `save`.
+
+        With `mmap=True` the vector matrix is memory-mapped read-only: nothing
+        is read until a query touches it, and every process that opens the
+        same index shares the same physical pages through the OS page cache.
+        Metadata is read lazily on first access to `store.metadata`.
+
+        Parameters
+        ----------
+        path : str
+        mmap : bool, default=True
+            Set to False to load the vectors fully into memory.
+
+        Returns
+        -------
+        store : EmbeddingStore
+        """
+        with open(os.path.join(path, INFO_FILE)) as f:
+            info = json.load(f)
+        if info.get('format_version', 0) > FORMAT_VERSION:
+            raise ValueError(f"Index format {info['format_version']} is newer than supported ({FORMAT_VERSION})")
+
+        store = cls.__new__(cls)
+        store.dim = int(info['dim'])
+        store.embed_model = info.get('embed_model')
+        store.dimensions = info.get('dimensions')
+        store._vectors = np.load(os.path.join(path, VECTORS_FILE), mmap_mode='r' if mmap else None)
+        store._size = int(info['count'])
+        store._records = None
+        store._metadata = None
+        store._metadata_path = os.path.join(path, METADATA_FILE)
+        store._metadata_index = None
+        return store
+
+    def to_dataframe(self, embedding_column='embedding'):
+        """
+        Returns the metadata with a list-valued embedding column (normalized vectors).
+        """
+        df = self.metadata.copy()
+        df[embedding_column] = list(self.vectors)
+        return df
@@ -6,14 +6,132 @@ import re
 import os
 import PyPDF2
 import re
+import time
+import threading
+from multiprocessing import Pool, cpu_count
 from PIL import Image
 from io import BytesIO
 from bs4 import BeautifulSoup
+from instrumentation import metrics
+
+try:
+    import lxml.html
+    import lxml.etree
+except ImportError: # fall back to BeautifulSoup
+    lxml = None
 
 #------------------------------------#
 # Data Preparation for HTML Files
 #------------------------------------#
 
+HEADING_TAGS = {'h1': 1, 'h2': 2, 'h3': 3, 'h4': 4, 'h5': 5, 'h6': 6}
+
+def parse_html_bs4(html_content):
+    """
+    `parse_html` with BeautifulSoup's pure-Python parser.
+    """
+    soup = BeautifulSoup(html_content, 'html.parser')
+    
+    # Extract title
+    # (plain str: a NavigableString keeps the whole parse tree alive and cannot be pickled)
+    title = str(soup.title.string) if soup.title and soup.title.string is not None else None
+    
+    # Extract headings, in document order
+    headings, heading_levels = [], []
+    for heading in soup.find_all(list(HEADING_TAGS)):
+        headings.append(heading.get_text(strip=True))
+        heading_levels.append(HEADING_TAGS[heading.name])
+
+    # Extract images
+    images = [img.get('src') for img in soup.find_all('img')]
+
+    # Remove script and style elements to avoid extracting unwanted text
+    for script in soup(['script', 'style']):
+        script.decompose()
+        
+    text = soup.get_text()
+
+    return text, title, headings, heading_levels, images
+
+def heading_text_lxml(el):
+    """
+    Stripped text of an lxml heading, without scripts, styles and comments
+    (as `get_text(strip=True)` gives with BeautifulSoup).
+    """
+    parts = [el.text.strip()] if el.text else []
+    for child in el:
+        if isinstance(child.tag, str) and child.tag not in ('script', 'style'):
+            parts.append(heading_text_lxml(child))
+        if child.tail:
+            parts.append(child.tail.strip())
+    return ''.join(parts)
+
+def parse_html_lxml(html_content):
+    """
+    `parse_html` with lxml: a single walk over the tree collects the title,
+    headings, images and visible text.
+    """
+    root = lxml.html.document_fromstring(html_content.encode('utf-8'),
+                                         parser=lxml.html.HTMLParser(encoding='utf-8'))
+    title = None
+    headings, heading_levels, images, parts = [], [], [], []
+
+    for event, el in lxml.etree.iterwalk(root, events=('start', 'end', 'comment', 'pi')):
+        if event != 'start':
+            if el.tail: # text after an element, comment or processing instruction
+                parts.append(el.tail)
+            continue
+        tag = el.tag
+
+        if tag in HEADING_TAGS:
+            headings.append(heading_text_lxml(el))
+            heading_levels.append(HEADING_TAGS[tag])
+        elif tag == 'img':
+            images.append(el.get('src'))
+        elif tag == 'title' and title is None:
+            title = el.text if len(el) == 0 else None
+
+        if el.text and tag not in ('script', 'style'):
+            parts.append(el.text)
+
+    return ''.join(parts), title, headings, heading_levels, images
+
+def parse_html(html_content, parser=None):
+    """
+    Extracts text, title, headings (with their levels, in document order)
+    and image sources from an HTML document.
+
+    Parameters
+    ----------
+    html_content : str
+    parser : {'lxml', 'bs4'}, optional
+        Defaults to lxml when it is installed, BeautifulSoup otherwise.
+
+    Returns
+    -------
+    parsed : dict
+        'text', 'title', 'headings', 'heading_levels' and 'images'.
+    """
+    if parser is None:
+        parser = 'lxml' if lxml is not None else 'bs4'
+
+    text = None
+    if parser == 'lxml':
+        try:
+            text, title, headings, heading_levels, images = parse_html_lxml(html_content)
+        except (lxml.etree.ParserError, ValueError):
+            pass # e.g. an empty document; BeautifulSoup copes with anything
+    if text is None:
+        text, title, headings, heading_levels, images = parse_html_bs4(html_content)
+
+    return {
+        'text': re.sub(r'\s+', ' ', text).strip(), # Remove extra whitespace and newlines
+        'title': title,
+        'headings': headings,
+        'heading_levels': heading_levels,
+        'images': images,
+    }
+
 def extract_metadata_from_html(html_content):
     """
     Extracts text, title, headings, and image names from an HTML document.
@@ -29,38 +147,187 @@ def extract_metadata_from_html(html_content):
     headings : list of str
     images : list of str
     """
-    soup = BeautifulSoup(html_content, 'html.parser')
-    
-    # Extract title
-    title = soup.title.string if soup.title else None
-    
-    # Extract headings
-    headings = []
-    for h_tag in ['h1', 'h2', 'h3', 'h4', 'h5', 'h6']:
-        for heading in soup.find_all(h_tag):
-            headings.append(heading.get_text(strip=True))
+    parsed = parse_html(html_content)
+    return parsed['text'], parsed['title'], parsed['headings'], parsed['images']
 
-    # Extract images
-    images = [img.get('src') for img in soup.find_all('img')]
+import chardet
+import codecs
 
-    # Remove script and style elements to avoid extracting unwanted text
-    for script in soup(['script', 'style']):
-        script.decompose()
-        
-    text = soup.get_text()
-    cleaned_text = re.sub(r'\s+', ' ', text).strip() # Remove extra whitespace and newlines
+#------------------------------------#
+# Encoding detection
+#------------------------------------#
 
-    return cleaned_text, title, headings, images
+# Longest first: the UTF-32 LE BOM starts with the UTF-16 LE one
+BOMS = [
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+]
 
-import chardet
+# <meta charset="..."> or <meta http-equiv="Content-Type" content="text/html; charset=...">
+META_CHARSET = re.compile(rb'''<meta[^>]*?charset\s*=\s*["']?\s*([-\w.:]+)''', re.IGNORECASE)
+
+SNIFF_BYTES = 4096
+CHARDET_SAMPLE_BYTES = 64 * 1024
+NON_ASCII = re.compile(rb'[\x80-\xff]')
+# Below this chardet is guessing (a few accented words come out as Greek or
+# Central European); such files are read as cp1252
+CHARDET_MIN_CONFIDENCE = 0.2
+
+# Directory -> encoding chardet found for an earlier file in it
+_directory_encodings = {}
+
+def try_decode(raw, encoding):
+    """
+    Strict decode; None if the encoding is unknown or does not fit the bytes.
+    """
+    try:
+        return raw.decode(encoding)
+    except (LookupError, UnicodeDecodeError):
+        return None
+
+def decode_html(raw, directory=None):
+    """
+    Decodes the bytes of an HTML file, detecting the encoding cheaply:
+
+    1. byte order mark,
+    2. <meta charset> / http-equiv declaration in the first 4 KB,
+    3. strict UTF-8,
+    4. the encoding detected earlier for a file in the same directory,
+    5. chardet on 64 KB starting at the first non-ASCII byte (a long ASCII
+       prefix would be detected as 'ascii'), falling back to cp1252 when
+       it is not confident.
+
+    Only an encoding that decodes the whole file strictly is remembered
+    for the directory.
+
+    Parameters
+    ----------
+    raw : bytes
+    directory : str, optional
+        Key for the per-directory cache of step 4.
+
+    Returns
+    -------
+    text : str
+    encoding : str
+    """
+    for bom, encoding in BOMS:
+        if raw.startswith(bom):
+            text = try_decode(raw, encoding)
+            if text is not None:
+                return text, encoding
+
+    match = META_CHARSET.search(raw, 0, SNIFF_BYTES)
+    if match:
+        encoding = match.group(1).decode('ascii', 'ignore')
+        text = try_decode(raw, encoding)
+        if text is not None:
+            return text, encoding
+
+    text = try_decode(raw, 'utf-8')
+    if text is not None:
+        return text, 'utf-8'
 
-def process_html_files(folder_path):
+    cached = _directory_encodings.get(directory)
+    if cached is not None:
+        text = try_decode(raw, cached)
+        if text is not None:
+            return text, cached
+
+    # Not UTF-8, so there is a non-ASCII byte: sample from there
+    first = NON_ASCII.search(raw)
+    start = first.start() if first else 0
+    detected = chardet.detect(raw[start:start + CHARDET_SAMPLE_BYTES])
+    encoding = detected['encoding']
+    if encoding is None or encoding.lower() == 'ascii' or detected['confidence'] < CHARDET_MIN_CONFIDENCE:
+        encoding = 'cp1252'
+
+    text = try_decode(raw, encoding)
+    if text is not None:
+        if directory is not None:
+            _directory_encodings[directory] = encoding
+        return text, encoding
+    try:
+        text = raw.decode(encoding, errors='replace')
+    except LookupError:
+        encoding = 'cp1252'
+        text = raw.decode(encoding, errors='replace')
+    return text, encoding
+
+@metrics.timed('extract_html_file')
+def extract_html_file(file_path, folder_path):
+    """
+    Extracts text, title, headings, and image names from one HTML file.
+
+    Parameters
+    ----------
+    file_path : str
+    folder_path : str
+        Root folder of the corpus (used for the relative 'folder' and 'path').
+
+    Returns
+    -------
+    record : dict
+    """
+    # Read the file once and decode it with the detected encoding
+    with open(file_path, 'rb') as f:
+        raw_data = f.read()
+    metrics.count('extract_html_file.bytes', len(raw_data))
+    html_content, _ = decode_html(raw_data, os.path.dirname(file_path))
+
+    parsed = parse_html(html_content)
+
+    return {
+        'file': os.path.basename(file_path),
+        'text': parsed['text'],
+        'title': parsed['title'],
+        'headings': parsed['headings'],
+        'heading_levels': parsed['heading_levels'],
+        'images': parsed['images'],
+        'folder': os.path.relpath(os.path.dirname(file_path), folder_path), # Calculate the relative directory path
+        'path': os.path.relpath(file_path, folder_path),
+    }
+
+def list_files(folder_path, extensions, files=None):
+    """
+    Lists the files to process under `folder_path`.
+
+    Parameters
+    ----------
+    folder_path : str
+    extensions : str or tuple of str
+    files : list of str, optional
+        Paths relative to `folder_path` (e.g. `changes.to_process` from a
+        Manifest scan). If given, only these files are returned.
+
+    Returns
+    -------
+    file_paths : list of str
+    """
+    if files is not None:
+        return [os.path.join(folder_path, f) for f in files if f.endswith(extensions)]
+
+    file_paths = []
+    for root, dirs, names in os.walk(folder_path): # Use os.walk to traverse subdirectories
+        for file in names:
+            if file.endswith(extensions):
+                file_paths.append(os.path.join(root, file))
+    return file_paths
+
+@metrics.timed('process_html_files')
+def process_html_files(folder_path, files=None):
     """
     Extracts text, title, headings, and image names from all HTML files in a folder.
     
     Parameters
     ----------
     folder_path : str
+    files : list of str, optional
+        Only process these paths (relative to `folder_path`), e.g. the
+        `changes.to_process` of a Manifest scan.
     
     Returns
     -------
@@ -72,32 +339,11 @@ def process_html_files(folder_path):
     >>> extracted_text_data = process_html_files(folder_path)
     """
     extracted_data = []
-    
-    for root, dirs, files in os.walk(folder_path): # Use os.walk to traverse subdirectories
-        for file in files:
-            if file.endswith('.htm'):
-                file_path = os.path.join(root, file)
-
-                # Detect file encoding using chardet
-                with open(file_path, 'rb') as f:
-                    raw_data = f.read()
-                    detected_encoding = chardet.detect(raw_data)['encoding']
-
-                # Read the file using the detected encoding
-                with open(file_path, 'r', encoding=detected_encoding) as f:
-                    html_content = f.read()
-
-                    text, title, headings, images = extract_metadata_from_html(html_content)
-
-                    extracted_data.append({
-                        'file': file,
-                        'text': text,
-                        'title': title,
-                        'headings': headings,
-                        'images': images,
-                        'folder': os.path.relpath(root, folder_path), # Calculate the relative directory path
-                    })
 
+    for file_path in list_files(folder_path, '.htm', files):
+        extracted_data.append(extract_html_file(file_path, folder_path))
+
+    metrics.count('process_html_files.files', len(extracted_data))
     return extracted_data
 
 
@@ -129,13 +375,77 @@ def extract_images_from_pdf_page(page):
 
     return images
 
-def extract_text_from_pdf(pdf_content):
+def pdf_title(pdf_reader, pdf_content):
+    """
+    Title from the PDF's document info, or the file name.
+    """
+    try:
+        metadata = pdf_reader.metadata or {}
+    except:
+        # Fill with fake data if metadata extraction fails
+        metadata = {}
+    return metadata.get('/Title', pdf_content.name)
+
+def iter_pdf_pages(pdf_content, extract_images=False, max_pages=None, max_bytes=None):
+    """
+    Yields the pages of a PDF document one at a time, so only one page's
+    text is in memory.
+
+    Parameters
+    ----------
+    pdf_content : file-like object or PyPDF2.PdfReader
+    extract_images : bool, default=False
+        Decode image XObjects (slow; skipped unless asked).
+    max_pages : int, optional
+        Stop after this many pages.
+    max_bytes : int, optional
+        Stop once this much text (UTF-8 bytes) has been extracted; the page
+        that crosses the limit is still yielded.
+
+    Yields
+    ------
+    page : dict
+        'page' (1-based page number), 'text' and 'images'.
+    """
+    if isinstance(pdf_content, PyPDF2.PdfReader):
+        pdf_reader = pdf_content
+    else:
+        pdf_reader = PyPDF2.PdfReader(pdf_content)
+    n_pages = len(pdf_reader.pages)
+    if max_pages is not None:
+        n_pages = min(n_pages, max_pages)
+
+    n_bytes = 0
+    for page_num in range(n_pages):
+        page = pdf_reader.pages[page_num]
+        text = page.extract_text()
+
+        images = []
+        if extract_images:
+            try:
+                images = extract_images_from_pdf_page(page)
+            except:
+                pass
+
+        yield {'page': page_num + 1, 'text': text, 'images': images}
+
+        n_bytes += len(text.encode('utf-8'))
+        if max_bytes is not None and n_bytes >= max_bytes:
+            break
+
+def extract_text_from_pdf(pdf_content, extract_images=False, max_pages=None, max_bytes=None):
     """
     Extracts text, title, headings, and image names from a PDF document.
     
     Parameters
     ----------
     pdf_content : file-like object
+    extract_images : bool, default=False
+        Decode the images of every page.
+    max_pages : int, optional
+        Only read this many pages.
+    max_bytes : int, optional
+        Stop reading pages once this much text has been extracted.
     
     Returns
     -------
@@ -151,37 +461,104 @@ def extract_text_from_pdf(pdf_content):
     >>>     text, title, headings, images = extract_text_from_pdf(pdf_content)  
     """
     pdf_reader = PyPDF2.PdfReader(pdf_content)
-    text = ""
+    title = pdf_title(pdf_reader, pdf_content)
 
-    for page_num in range(len(pdf_reader.pages)):
-        page = pdf_reader.pages[page_num]
-        text += page.extract_text() + ' '
+    # headings = extract_headings(text)
+    headings = title
 
-    try:
-        metadata = pdf_reader.metadata
-    except:
-        # Fill with fake data if metadata extraction fails
-        metadata = {'/Title': pdf_content.name}
-    title = metadata.get('/Title', pdf_content.name)
+    texts, images = [], []
+    for page in iter_pdf_pages(pdf_reader, extract_images, max_pages, max_bytes):
+        texts.append(page['text'])
+        images.extend(page['images'])
 
-    # headings = extract_headings(text)
-    headings = metadata.get('/Title', pdf_content.name)
-    try:
-        images = []
-        for page_num in range(len(pdf_reader.pages)):
-            images.extend(extract_images_from_pdf_page(pdf_reader.pages[page_num]))
-    except:
-        pass
+    return ' '.join(texts).strip(), title, headings, images
+
+@metrics.timed('extract_pdf_file')
+def extract_pdf_file(file_path, folder_path, extract_images=False, max_pages=None, max_bytes=None):
+    """
+    Extracts text, title, headings, and images from one PDF file.
+
+    Parameters
+    ----------
+    file_path : str
+    folder_path : str
+        Root folder of the corpus (used for the relative 'folder' and 'path').
+    extract_images : bool, default=False
+    max_pages : int, optional
+    max_bytes : int, optional
+        Page and text budgets, see `iter_pdf_pages`.
 
-    return text.strip(), title, headings, images
+    Returns
+    -------
+    record : dict
+    """
+    metrics.count('extract_pdf_file.bytes', os.path.getsize(file_path))
+    with open(file_path, 'rb') as f:
+        pdf_content = f
 
-def process_pdf_files(folder_path):
+        extracted_text, title, headings, images = extract_text_from_pdf(pdf_content, extract_images,
+                                                                        max_pages, max_bytes)
+
+    return {
+        'file': os.path.basename(file_path),
+        'text': extracted_text,
+        'folder': os.path.relpath(os.path.dirname(file_path), folder_path),
+        'path': os.path.relpath(file_path, folder_path),
+        'title': title,
+        'headings': headings,
+        'images': images,
+    }
+
+def iter_pdf_file_pages(file_path, folder_path, extract_images=False, max_pages=None, max_bytes=None):
+    """
+    Yields one record per page of a PDF file (the fields of `extract_pdf_file`
+    plus 'page'). Feed them to `Chunker.chunk_pages` to chunk a PDF of any
+    size in constant memory.
+
+    Parameters
+    ----------
+    file_path : str
+    folder_path : str
+    extract_images : bool, default=False
+    max_pages : int, optional
+    max_bytes : int, optional
+        Page and text budgets, see `iter_pdf_pages`.
+
+    Yields
+    ------
+    record : dict
+
+    Example
+    -------
+    >>> pages = iter_pdf_file_pages('Made2Manage/manual.pdf', 'Made2Manage')
+    >>> new_data = list(Chunker(max_tokens=300).chunk_pages(pages))
+    """
+    with open(file_path, 'rb') as f:
+        pdf_reader = PyPDF2.PdfReader(f)
+        title = pdf_title(pdf_reader, f)
+        base = {
+            'file': os.path.basename(file_path),
+            'folder': os.path.relpath(os.path.dirname(file_path), folder_path),
+            'path': os.path.relpath(file_path, folder_path),
+            'title': title,
+            'headings': title,
+        }
+        metrics.count('iter_pdf_file_pages.bytes', os.path.getsize(file_path))
+        for page in iter_pdf_pages(pdf_reader, extract_images, max_pages, max_bytes):
+            metrics.count('iter_pdf_file_pages.pages')
+            yield dict(base, **page)
+
+@metrics.timed('process_pdf_files')
+def process_pdf_files(folder_path, files=None):
     """
     Extracts text, title, headings, and image names from all PDF files in a folder.
     
     Parameters
     ----------
     folder_path : str
+    files : list of str, optional
+        Only process these paths (relative to `folder_path`), e.g. the
+        `changes.to_process` of a Manifest scan.
     
     Returns
     -------
@@ -194,22 +571,115 @@ def process_pdf_files(folder_path):
     """
     extracted_data = []
 
-    for root, dirs, files in os.walk(folder_path):
-        for file in files:
-            if file.endswith('.pdf'):
-                file_path = os.path.join(root, file)
-
-                with open(file_path, 'rb') as f:
-                    pdf_content = f
-
-                    extracted_text, title, headings, images = extract_text_from_pdf(pdf_content)
-                    extracted_data.append({
-                        'file': file,
-                        'text': extracted_text,
-                        'folder': os.path.relpath(root, folder_path),
-                        'title': title,
-                        'headings': headings,
-                        'images': images,
-                    })
-
-    return extracted_data
\ No newline at end of file
+    for file_path in list_files(folder_path, '.pdf', files):
+        extracted_data.append(extract_pdf_file(file_path, folder_path))
+
+    metrics.count('process_pdf_files.files', len(extracted_data))
+    return extracted_data
+
+
+#------------------------------------#
+# Parallel extraction (HTML and PDF)
+#------------------------------------#
+
+# File extension -> per-file extractor
+EXTRACTORS = {
+    '.htm': extract_html_file,
+    '.pdf': extract_pdf_file,
+}
+
+def extract_file(task):
+    """
+    Worker for `process_files_parallel`: extracts one file and never raises.
+
+    Parameters
+    ----------
+    task : tuple of (file_path, folder_path)
+
+    Returns
+    -------
+    result : tuple of (record or None, file_path, error message or None, seconds, bytes)
+        The time and file size are reported back because metrics taken in
+        a worker process are not collected.
+    """
+    file_path, folder_path = task
+    start = time.perf_counter()
+    try:
+        extension = os.path.splitext(file_path)[1]
+        if extension not in EXTRACTORS:
+            raise ValueError(f"No extractor for {extension or 'files without an extension'}")
+        record, error = EXTRACTORS[extension](file_path, folder_path), None
+    except Exception as e:
+        record, error = None, f"{type(e).__name__}: {e}"
+    nbytes = os.path.getsize(file_path) if os.path.exists(file_path) else 0
+    return record, file_path, error, time.perf_counter() - start, nbytes
+
+def process_files_parallel(folder_path, extensions=('.htm', '.pdf'), workers=None, chunksize=8, files=None, errors=None,
+                           max_pending=None):
+    """
+    Extracts HTML and PDF files in a single traversal of the folder, using a
+    pool of worker processes. Records are yielded as soon as each file is done
+    (not in folder order). A file that fails is reported and skipped.
+
+    Parameters
+    ----------
+    folder_path : str
+    extensions : tuple of str, default=('.htm', '.pdf')
+    workers : int, optional
+        Number of worker processes. Defaults to the number of CPU cores.
+    chunksize : int, default=8
+        Files handed to a worker at a time (fewer round-trips for small files).
+    files : list of str, optional
+        Only process these paths (relative to `folder_path`).
+    errors : list, optional
+        If given, (file_path, message) tuples of failed files are appended to it.
+    max_pending : int, optional
+        Files submitted but not yet consumed. Bounds memory when the consumer
+        is slower than the workers. Defaults to 4 * workers * chunksize.
+
+    Yields
+    ------
+    record : dict
+        Same fields as the records of `process_html_files` / `process_pdf_files`.
+
+    Example
+    -------
+    >>> failed = []
+    >>> extracted_text_data = list(process_files_parallel('Made2Manage', workers=16, errors=failed))
+    """
+    tasks = [(file_path, folder_path) for file_path in list_files(folder_path, tuple(extensions), files)]
+    workers = workers or cpu_count()
+    if max_pending is None:
+        max_pending = 4 * workers * chunksize
+
+    # The pool's feeder thread blocks here once `max_pending` results are waiting
+    max_pending = max(max_pending, chunksize)
+    slots = threading.Semaphore(max_pending)
+    stop = threading.Event()
+    def feed():
+        for task in tasks:
+            slots.acquire()
+            if stop.is_set():
+                return
+            yield task
+
+    with Pool(processes=workers) as pool:
+        try:
+            for record, file_path, error, seconds, nbytes in pool.imap_unordered(extract_file, feed(),
+                                                                                  chunksize=chunksize):
+                slots.release()
+                extension = os.path.splitext(file_path)[1]
+                metrics.observe('process_files_parallel.file_seconds', seconds, extension=extension)
+                metrics.count('process_files_parallel.bytes', nbytes, extension=extension)
+                if error is not None:
+                    metrics.count('process_files_parallel.failed', extension=extension)
+                    print(f"Failed to extract {file_path}: {error}")
+                    if errors is not None:
+                        errors.append((file_path, error))
+                    continue
+                metrics.count('process_files_parallel.files', extension=extension)
+                yield record
+        finally:
+            # Unblock the feeder so the pool can shut down if the consumer stops early
+            stop.set()
+            slots.release(max_pending)
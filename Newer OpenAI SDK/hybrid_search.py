@@ -0,0 +1,101 @@
+#------------------------------------#
+# Import Libraries
+#------------------------------------#
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+_executor = None
+
+def get_executor():
+    """
+    Thread pool that runs the lexical half of hybrid searches (created on first use).
+    """
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='lexical')
+    return _executor
+
+#------------------------------------#
+# Rank fusion
+#------------------------------------#
+
+def reciprocal_rank_fusion(rankings, k, rrf_k=60, weights=None):
+    """
+    Fuses several rankings of row ids per query with reciprocal rank fusion:
+    each row scores sum(weight / (rrf_k + rank)) over the rankings it
+    appears in (rank starts at 1). Scores of different scales never need to
+    be compared, only ranks.
+
+    Parameters
+    ----------
+    rankings : list of numpy.ndarray of shape (n_queries, depth)
+        Row ids, best first; -1 entries are ignored.
+    k : int
+    rrf_k : int, default=60
+        Damping constant: larger values flatten the contribution of the top ranks.
+    weights : list of float, optional
+        One weight per ranking (default 1 each).
+
+    Returns
+    -------
+    indices : numpy.ndarray of shape (n_queries, k)
+        Fused row ids, best first; -1 pads queries with fewer than k rows.
+    scores : numpy.ndarray of shape (n_queries, k)
+    """
+    weights = [1.0] * len(rankings) if weights is None else weights
+    n_queries = len(rankings[0])
+    indices = np.full((n_queries, k), -1, dtype=np.int64)
+    scores = np.zeros((n_queries, k), dtype=np.float32)
+    for q in range(n_queries):
+        row_ids = np.concatenate([ranking[q] for ranking in rankings])
+        contributions = np.concatenate([w / (rrf_k + np.arange(1, ranking.shape[1] + 1, dtype=np.float64))
+                                        for w, ranking in zip(weights, rankings)])
+        valid = row_ids >= 0
+        unique_ids, inverse = np.unique(row_ids[valid], return_inverse=True)
+        fused = np.bincount(inverse, weights=contributions[valid], minlength=len(unique_ids))
+        order = np.lexsort((unique_ids, -fused))[:k] # ties broken by the lower row id
+        indices[q, :len(order)] = unique_ids[order]
+        scores[q, :len(order)] = fused[order]
+    return indices, scores
+
+#------------------------------------#
+# Hybrid lexical + vector search
+#------------------------------------#
+
+def hybrid_search(vector_search, lexical, query_texts, query_embeddings, k=3, depth=None, rrf_k=60,
+                  weights=None, rows=None):
+    """
+    Lexical (BM25) and vector top-`depth` rankings, computed concurrently
+    and fused with reciprocal rank fusion.
+
+    The BM25 search runs on a pool thread while the vector search runs on the
+    calling thread; both spend their time in native code (sparse and dense
+    products), so they overlap.
+
+    Parameters
+    ----------
+    vector_search : callable
+        `vector_search(query_embeddings, k)` -> (indices, scores), e.g.
+        `store.search` or the `search` method of an index.
+    lexical : BM25Index
+    query_texts : list of str
+    query_embeddings : numpy.ndarray of shape (n_queries, dim)
+    k : int, default=3
+    depth : int, optional
+        Candidates taken from each ranking (default max(10 * k, 50)).
+    rrf_k : int, default=60
+    weights : tuple of float, optional
+        (lexical, vector) weights in the fusion.
+    rows : array-like of int, optional
+        Restricts the lexical side to these row ids (the vector side should
+        be restricted by `vector_search` itself).
+
+    Returns
+    -------
+    indices, scores : numpy.ndarray of shape (n_queries, k)
+    """
+    depth = max(k, depth or max(10 * k, 50))
+    lexical_future = get_executor().submit(lexical.search, query_texts, depth, rows)
+    vector_indices, _ = vector_search(query_embeddings, depth)
+    lexical_indices, _ = lexical_future.result()
+    return reciprocal_rank_fusion([lexical_indices, vector_indices], k, rrf_k=rrf_k, weights=weights)
@@ -0,0 +1,283 @@
+#------------------------------------#
+# Import Libraries
+#------------------------------------#
+import os
+import json
+import glob
+import shutil
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from embedding_store import (normalize_rows, to_columnar, VECTORS_FILE, METADATA_FILE,
+                             INFO_FILE, FORMAT_VERSION, LIST_COLUMNS)
+from metadata_index import MetadataIndex, FIELDS
+
+SHARDS_DIR = 'shards'
+
+# Arrow type of the items of each of the LIST_COLUMNS
+ITEM_TYPES = {str: pa.string(), int: pa.int64()}
+
+def with_list_types(schema):
+    """
+    `schema` with the `LIST_COLUMNS` typed list<string> (list<int64> for
+    heading levels), whatever an older index or a shard of empty lists
+    recorded for them.
+    """
+    for col, item_type in LIST_COLUMNS.items():
+        if col in schema.names:
+            schema = schema.set(schema.get_field_index(col), pa.field(col, pa.list_(ITEM_TYPES[item_type])))
+    return schema
+
+#------------------------------------#
+# Append-only sharded index writer
+#------------------------------------#
+
+class IndexWriter:
+    """
+    Append-only writer for an index directory (the `EmbeddingStore.save`
+    format). Rows are buffered until `shard_rows` are collected and then
+    written as one fixed-size shard: a vector block (`.npy`) plus a metadata
+    block (`.parquet`). Memory is bounded by one shard and every row is
+    written exactly once before finalizing.
+
+    `close` concatenates the shards into `vectors.npy` and
+    `metadata.parquet` in a single sequential pass (linear time), and builds
+    the metadata filters (`filters.npz`) from the few columns they need.
+
+    Opening a writer on an existing index appends to it: the finalized index
+    becomes the first shard. Its rows whose 'path' is in `remove_paths` are
+    left out while it is copied (the old chunks of modified or deleted files).
+    A deduplicated row (see dedup.py) is only left out once none of its
+    'sources' remain; otherwise it keeps the remaining sources and, if its
+    own file was removed, takes the path of the first of them.
+
+    An interrupted run leaves the finalized index untouched (it is only
+    replaced by `close`) and its shards behind. They are discarded when the
+    next writer opens: resume by running the same update again (a Manifest
+    that was not saved reports the same changes), which writes those rows
+    once more.
+
+    Note that `close` copies the whole existing index again, so each append
+    costs time proportional to the full index, not to the rows added: many
+    small appends add up to quadratic time. Collect changes and append them
+    in few, large runs (e.g. one Manifest scan per day).
+
+    Parameters
+    ----------
+    path : str
+        Index directory (created if needed).
+    shard_rows : int, default=10000
+        Rows per shard.
+    embed_model : str, optional
+    dimensions : int, optional
+        Recorded in `index.json` (see `EmbeddingStore`). When appending to an
+        existing index they must match what it was built with.
+    remove_paths : list of str, optional
+        Files whose rows are dropped from the existing index, e.g.
+        `changes.to_remove` of a Manifest scan.
+    sources : dict, optional
+        Chunk id -> source files, e.g. `Deduplicator.sources`. Read when the
+        index is finalized: the 'sources' column of every row with a
+        'chunk_id' is rewritten from it, so duplicates found after the
+        row's shard was written are included.
+
+    Example
+    -------
+    >>> with IndexWriter('my_index') as writer:
+    >>>     for embeds, records in embedded_batches:
+    >>>         writer.append(embeds, records)
+    >>> store = EmbeddingStore.open('my_index')
+    """
+
+    def __init__(self, path, shard_rows=10000, embed_model=None, dimensions=None, remove_paths=None,
+                 sources=None):
+        self.path = path
+        self.shard_rows = int(shard_rows)
+        self.embed_model = embed_model
+        self.dimensions = dimensions
+        self.sources = sources
+        self.shards_path = os.path.join(path, SHARDS_DIR)
+        if os.path.isdir(self.shards_path) and os.listdir(self.shards_path):
+            print(f"Discarding the shards of an interrupted run in {self.shards_path}")
+            shutil.rmtree(self.shards_path)
+        os.makedirs(self.shards_path, exist_ok=True)
+
+        self.dim = None
+        self.count = 0
+        self._buffer_vectors = []
+        self._buffer_records = []
+        self._buffered = 0
+
+        # Rows already on disk in a finalized index
+        self._base = None
+        self._base_keep = None # mask of the finalized rows to copy (None: all)
+        self._base_updates = {} # finalized row -> {column: new value}
+        if os.path.exists(os.path.join(path, INFO_FILE)):
+            with open(os.path.join(path, INFO_FILE)) as f:
+                info = json.load(f)
+            for key in ('embed_model', 'dimensions'):
+                recorded, given = info.get(key), getattr(self, key)
+                if recorded is not None and given is not None and recorded != given:
+                    raise ValueError(f"Index {path} was built with {key}={recorded}, not {given}")
+                setattr(self, key, given if given is not None else recorded)
+            if info['count']:
+                self._base = info
+                self.dim = info['dim']
+                self.count = info['count']
+                if remove_paths:
+                    self._drop_paths(remove_paths)
+        self._n_shards = 0
+
+    def _drop_paths(self, remove_paths):
+        metadata_file = os.path.join(self.path, METADATA_FILE)
+        if 'path' not in pq.read_schema(metadata_file).names:
+            raise ValueError(f"Index {self.path} has no 'path' column, so the rows of removed files "
+                             "cannot be found; rebuild it instead of appending to it")
+        remove = set(remove_paths)
+        if 'sources' not in pq.read_schema(metadata_file).names:
+            paths = pd.read_parquet(metadata_file, columns=['path'])['path']
+            keep = ~paths.isin(remove).to_numpy()
+        else:
+            metadata = pd.read_parquet(metadata_file, columns=['path', 'sources'])
+            keep = np.ones(len(metadata), dtype=bool)
+            for row, (path, sources) in enumerate(zip(metadata['path'], metadata['sources'])):
+                sources = [] if sources is None else list(sources)
+                remaining = [s for s in sources if s not in remove]
+                if not remaining:
+                    keep[row] = path not in remove
+                elif len(remaining) < len(sources):
+                    update = {'sources': remaining}
+                    if path in remove:
+                        new_path = remaining[0]
+                        update.update(path=new_path, folder=os.path.dirname(new_path) or '.',
+                                      file=os.path.splitext(os.path.basename(new_path))[0])
+                    self._base_updates[row] = update
+        if not keep.all():
+            self._base_keep = keep
+            self.count -= int((~keep).sum())
+
+    def _shard_files(self):
+        return sorted(f[:-len('.npy')] for f in glob.glob(os.path.join(self.shards_path, 'shard_?????.npy')))
+
+    def append(self, embeddings, records):
+        """
+        Normalizes and appends a batch of embeddings with their metadata.
+        A shard is written every time `shard_rows` rows are buffered.
+
+        Parameters
+        ----------
+        embeddings : array-like of shape (n, dim)
+        records : list of dict
+        """
+        embeddings = normalize_rows(np.array(embeddings, dtype=np.float32))
+        if len(embeddings) != len(records):
+            raise ValueError("embeddings and records must have the same length")
+        if self.dim is None:
+            self.dim = embeddings.shape[1]
+        elif embeddings.shape[1] != self.dim:
+            raise ValueError(f"Expected embeddings of dimension {self.dim}, got {embeddings.shape[1]}")
+
+        start = 0
+        while start < len(records):
+            take = min(self.shard_rows - self._buffered, len(records) - start)
+            self._buffer_vectors.append(embeddings[start:start + take])
+            self._buffer_records.extend(records[start:start + take])
+            self._buffered += take
+            self.count += take
+            start += take
+            if self._buffered >= self.shard_rows:
+                self.flush()
+
+    def flush(self):
+        """
+        Writes the buffered rows as a shard (also called automatically).
+        """
+        if not self._buffered:
+            return
+        name = os.path.join(self.shards_path, f"shard_{self._n_shards:05d}")
+
+        # Metadata first: a shard only counts once its .npy exists
+        to_columnar(pd.DataFrame.from_records(self._buffer_records)).to_parquet(name + '.parquet', index=False)
+        np.save(name + '.tmp.npy', np.concatenate(self._buffer_vectors))
+        os.replace(name + '.tmp.npy', name + '.npy')
+
+        self._n_shards += 1
+        self._buffer_vectors, self._buffer_records, self._buffered = [], [], 0
+
+    def close(self):
+        """
+        Flushes the last shard and finalizes the index directory. Returns the path.
+        """
+        self.flush()
+        shards = self._shard_files()
+        sources = [(os.path.join(self.path, VECTORS_FILE), os.path.join(self.path, METADATA_FILE), self._base_keep,
+                    self._base_updates)] if self._base else []
+        sources += [(s + '.npy', s + '.parquet', None, {}) for s in shards]
+        dim = self.dim or 0
+
+        # Vectors: one sequential copy of every block behind a fresh .npy header
+        tmp_vectors = os.path.join(self.path, 'vectors.tmp.npy')
+        out = np.lib.format.open_memmap(tmp_vectors, mode='w+', dtype=np.float32, shape=(self.count, dim))
+        row = 0
+        for vectors_file, _, keep, _ in sources:
+            block = np.load(vectors_file, mmap_mode='r')
+            for start in range(0, len(block), self.shard_rows):
+                part = block[start:start + self.shard_rows]
+                if keep is not None:
+                    part = part[keep[start:start + self.shard_rows]]
+                out[row:row + len(part)] = part
+                row += len(part)
+            del block
+        out.flush()
+        del out
+
+        # Metadata: agree on one schema (a column that is all null in one shard
+        # takes its type from the others), then copy shard by shard
+        tmp_metadata = os.path.join(self.path, 'metadata.tmp.parquet')
+        if sources:
+            schema = pa.unify_schemas([with_list_types(pq.read_schema(m).remove_metadata()) for _, m, _, _ in sources],
+                                      promote_options='permissive')
+            with pq.ParquetWriter(tmp_metadata, schema) as parquet:
+                for _, metadata_file, keep, updates in sources:
+                    start = 0
+                    for batch in pq.ParquetFile(metadata_file).iter_batches(batch_size=self.shard_rows):
+                        block = batch.to_pandas()
+                        rows = [row for row in range(start, start + len(block)) if row in updates] if updates else []
+                        for col in {col for row in rows for col in updates[row]} & set(block.columns):
+                            values = block[col].tolist()
+                            for row in rows:
+                                values[row - start] = updates[row].get(col, values[row - start])
+                            block[col] = pd.Series(values, dtype=object)
+                        if keep is not None:
+                            block = block[keep[start:start + len(block)]].reset_index(drop=True)
+                        start += batch.num_rows
+                        for col in schema.names:
+                            if col not in block.columns:
+                                block[col] = pd.Series([None] * len(block), dtype=object)
+                        if self.sources and 'chunk_id' in schema.names and 'sources' in schema.names:
+                            block['sources'] = [self.sources.get(chunk_id, old) for chunk_id, old
+                                                in zip(block['chunk_id'], block['sources'])]
+                        block = to_columnar(block[schema.names])
+                        parquet.write_table(pa.Table.from_pandas(block, schema=schema,
+                                                                 preserve_index=False))
+        else:
+            pd.DataFrame().to_parquet(tmp_metadata, index=False)
+
+        os.replace(tmp_vectors, os.path.join(self.path, VECTORS_FILE))
+        os.replace(tmp_metadata, os.path.join(self.path, METADATA_FILE))
+        metadata_file = os.path.join(self.path, METADATA_FILE)
+        columns = [c for c in FIELDS if c in pq.read_schema(metadata_file).names]
+        metadata = pd.read_parquet(metadata_file, columns=columns) if columns else pd.DataFrame(index=range(self.count))
+        MetadataIndex.build(metadata).save(self.path)
+        with open(os.path.join(self.path, INFO_FILE), 'w') as f:
+            json.dump({'format_version': FORMAT_VERSION, 'dim': dim, 'count': self.count,
+                       'embed_model': self.embed_model, 'dimensions': self.dimensions}, f)
+        shutil.rmtree(self.shards_path)
+        return self.path
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
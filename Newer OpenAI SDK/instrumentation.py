@@ -0,0 +1,271 @@
+#------------------------------------#
+# Import Libraries
+#------------------------------------#
+import json
+import time
+import math
+import pstats
+import cProfile
+import threading
+from functools import wraps
+
+#------------------------------------#
+# Histogram
+#------------------------------------#
+
+class Histogram:
+    """
+    Streaming histogram with logarithmic buckets (about 9% wide), so
+    percentiles are approximate but memory stays constant.
+    """
+
+    GROWTH = 1.09
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.buckets = {}
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        bucket = math.floor(math.log(value, self.GROWTH)) if value > 0 else None
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+
+    def percentile(self, q):
+        """
+        Approximate q-th percentile (0-100).
+        """
+        if not self.count:
+            return None
+        rank = q / 100.0 * self.count
+        seen = 0
+        for bucket in sorted(self.buckets, key=lambda b: -math.inf if b is None else b):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                value = 0.0 if bucket is None else self.GROWTH ** (bucket + 0.5)
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    def summary(self):
+        if not self.count:
+            return {'count': 0}
+        return {'count': self.count, 'sum': self.total, 'mean': self.total / self.count, 'min': self.min,
+                'max': self.max, 'p50': self.percentile(50), 'p95': self.percentile(95),
+                'p99': self.percentile(99)}
+
+#------------------------------------#
+# Metrics registry
+#------------------------------------#
+
+class _NullTimer:
+    """Timer used while metrics are disabled: does nothing."""
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc):
+        return False
+
+_NULL_TIMER = _NullTimer()
+
+class _Timer:
+    def __init__(self, metrics, name, tags):
+        self.metrics = metrics
+        self.name = name
+        self.tags = tags
+        self.profiler = None
+
+    def __enter__(self):
+        if self.name in self.metrics.profiled:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.seconds = time.perf_counter() - self.start
+        if self.profiler is not None:
+            self.profiler.disable()
+            self.metrics._add_profile(self.name, self.profiler)
+        self.metrics.observe(self.name + '.seconds', self.seconds, **self.tags)
+        return False
+
+class Metrics:
+    """
+    Timers, counters and histograms for the pipeline stages, with
+    user-attachable sinks and an optional cProfile hook per stage.
+
+    Disabled by default. While disabled, `timer`, `count` and `observe` only
+    check a flag and the `timed` decorator calls the function directly, so
+    the instrumentation costs next to nothing.
+
+    Every measurement is aggregated in memory (see `snapshot`) and passed to
+    each sink as an event dict: {'type', 'name', 'value', 'tags', 'time'}.
+    Measurements taken in worker processes are not collected.
+
+    Example
+    -------
+    >>> from instrumentation import metrics, JsonlSink
+    >>> metrics.enable()
+    >>> metrics.add_sink(JsonlSink('metrics.jsonl'))
+    >>> metrics.profile('create_and_append_embeddings')
+    >>> store = create_and_append_embeddings(break_and_clean(process_html_files('Made2Manage')))
+    >>> print(metrics.report())
+    >>> metrics.print_profile('create_and_append_embeddings')
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.sinks = []
+        self.profiled = set()
+        self.profiles = {}
+        self.counters = {}
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def add_sink(self, sink):
+        """
+        Registers a callable that receives every event.
+        """
+        self.sinks.append(sink)
+        return sink
+
+    def remove_sink(self, sink):
+        self.sinks.remove(sink)
+
+    def _emit(self, kind, name, value, tags):
+        if not self.sinks:
+            return
+        event = {'type': kind, 'name': name, 'value': value, 'tags': tags, 'time': time.time()}
+        for sink in self.sinks:
+            sink(event)
+
+    def count(self, name, value=1, **tags):
+        """
+        Adds `value` to a counter.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+        self._emit('counter', name, value, tags)
+
+    def observe(self, name, value, **tags):
+        """
+        Records a value in a histogram.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.add(value)
+        self._emit('histogram', name, value, tags)
+
+    def timer(self, name, **tags):
+        """
+        Context manager recording the elapsed seconds in the histogram
+        `<name>.seconds` (and profiling the block if `name` is profiled).
+        """
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, name, tags)
+
+    def timed(self, name):
+        """
+        Decorator: times every call of the function as `name`.
+        """
+        def decorator(fn):
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return fn(*args, **kwargs)
+                with _Timer(self, name, {}):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def profile(self, *names):
+        """
+        Runs the stages with these names under cProfile while timed.
+        """
+        self.profiled.update(names)
+
+    def _add_profile(self, name, profiler):
+        with self._lock:
+            if name in self.profiles:
+                self.profiles[name].add(profiler)
+            else:
+                self.profiles[name] = pstats.Stats(profiler)
+
+    def print_profile(self, name, sort='cumulative', limit=25):
+        """
+        Prints the accumulated cProfile statistics of a stage.
+        """
+        stats = self.profiles.get(name)
+        if stats is None:
+            print(f"No profile recorded for {name}")
+            return
+        stats.sort_stats(sort).print_stats(limit)
+
+    def snapshot(self):
+        """
+        Current counters and histogram summaries as a dict.
+        """
+        with self._lock:
+            return {'counters': dict(self.counters),
+                    'histograms': {name: h.summary() for name, h in self.histograms.items()}}
+
+    def report(self):
+        """
+        Multi-line summary of the counters and timers.
+        """
+        snapshot = self.snapshot()
+        lines = [f"{name}: {value}" for name, value in sorted(snapshot['counters'].items())]
+        for name, s in sorted(snapshot['histograms'].items()):
+            lines.append(f"{name}: n={s['count']} mean={s['mean']:.4g} p50={s['p50']:.4g} "
+                         f"p95={s['p95']:.4g} max={s['max']:.4g}")
+        return '\n'.join(lines)
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+            self.profiles.clear()
+
+#------------------------------------#
+# Sinks
+#------------------------------------#
+
+def print_sink(event):
+    """
+    Prints every event on one line.
+    """
+    tags = ' '.join(f"{k}={v}" for k, v in event['tags'].items())
+    print(f"[{event['type']}] {event['name']} {event['value']:.6g} {tags}".rstrip())
+
+class JsonlSink:
+    """
+    Appends every event as a JSON line to `path`.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def __call__(self, event):
+        with self._lock, open(self.path, 'a') as f:
+            f.write(json.dumps(event, default=str) + '\n')
+
+# Shared registry used by the pipeline modules
+metrics = Metrics()
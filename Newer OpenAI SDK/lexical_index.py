@@ -0,0 +1,173 @@
+#------------------------------------#
+# Import Libraries
+#------------------------------------#
+import os
+import re
+import json
+import numpy as np
+from scipy import sparse
+
+# Files written into the index directory by BM25Index.save
+BM25_WEIGHTS_FILE = 'bm25.npz'
+BM25_INFO_FILE = 'bm25.json'
+
+# Words, keeping hyphenated product names and error codes (e.g. "M2M-SO", "ERR-1042") whole
+TOKEN_PATTERN = re.compile(r'\w+(?:-\w+)*')
+
+def tokenize(text):
+    """
+    Lower-cased tokens of a text. Periods are removed first, as
+    `break_and_clean` removes them from the chunk texts, so the query
+    "v7.5" matches the indexed "v75" (and chunks that kept their periods,
+    `Chunker(clean=False)`, are indexed the same way).
+    """
+    return TOKEN_PATTERN.findall(text.replace('.', '').lower())
+
+#------------------------------------#
+# BM25 over a sparse term-document matrix
+#------------------------------------#
+
+class BM25Index:
+    """
+    Okapi BM25 over the chunk texts. The BM25 weight of every (term, chunk)
+    pair is computed once at build time and kept in a sparse term-major
+    matrix (CSR of shape (n_terms, n_rows), i.e. an inverted index with the
+    weights in the posting lists). Scoring a batch of queries is then one
+    sparse product, touching only the postings of the query terms.
+
+    Row ids are the store's row ids, so lexical and vector results can be
+    fused (see `hybrid_search.py`).
+
+    Parameters
+    ----------
+    k1 : float, default=1.2
+        Term-frequency saturation.
+    b : float, default=0.75
+        Length normalization.
+
+    Example
+    -------
+    >>> bm25 = build_bm25_index(store)
+    >>> bm25.save('my_index')
+    >>> indices, scores = BM25Index.load('my_index').search(['ERR-1042 on posting'], k=10)
+    """
+
+    def __init__(self, k1=1.2, b=0.75):
+        self.k1 = float(k1)
+        self.b = float(b)
+        self.vocabulary = {}
+        self.weights = sparse.csr_matrix((0, 0), dtype=np.float32)
+        self.avgdl = 0.0
+
+    def __len__(self):
+        return self.weights.shape[1]
+
+    def build(self, texts):
+        """
+        Indexes the texts (row i of the index is texts[i]). Returns self.
+        """
+        vocabulary = {}
+        term_ids, lengths = [], []
+        for text in texts:
+            tokens = tokenize(text or '')
+            lengths.append(len(tokens))
+            term_ids.extend(vocabulary.setdefault(token, len(vocabulary)) for token in tokens)
+        lengths = np.asarray(lengths, dtype=np.float32)
+        n_rows, n_terms = len(lengths), len(vocabulary)
+
+        # Term frequencies: duplicate (term, row) entries are summed on conversion
+        row_ids = np.repeat(np.arange(n_rows, dtype=np.int64), lengths.astype(np.int64))
+        tf = sparse.csr_matrix((np.ones(len(term_ids), dtype=np.float32), (np.asarray(term_ids, dtype=np.int64), row_ids)),
+                               shape=(n_terms, n_rows))
+        tf.sum_duplicates()
+
+        self.avgdl = float(lengths.mean()) if n_rows else 0.0
+        df = np.diff(tf.indptr).astype(np.float32)
+        idf = np.log1p((n_rows - df + 0.5) / (df + 0.5))
+        dl = lengths[tf.indices]
+        norm = self.k1 * (1.0 - self.b + self.b * dl / max(self.avgdl, 1e-9))
+        tf.data = (np.repeat(idf, np.diff(tf.indptr)) * tf.data * (self.k1 + 1.0) / (tf.data + norm)).astype(np.float32)
+
+        self.vocabulary = vocabulary
+        self.weights = tf
+        return self
+
+    def query_matrix(self, query_texts):
+        """
+        Sparse (n_queries, n_terms) indicator matrix of the known query terms.
+        """
+        rows, cols = [], []
+        for q, text in enumerate(query_texts):
+            terms = {self.vocabulary[t] for t in tokenize(text) if t in self.vocabulary}
+            rows.extend([q] * len(terms))
+            cols.extend(terms)
+        return sparse.csr_matrix((np.ones(len(cols), dtype=np.float32), (rows, cols)),
+                                 shape=(len(query_texts), len(self.vocabulary)))
+
+    def search(self, query_texts, k=10, rows=None):
+        """
+        BM25 top-k for a batch of query texts.
+
+        Parameters
+        ----------
+        query_texts : list of str
+        k : int, default=10
+        rows : array-like of int, optional
+            Restrict the results to these row ids (e.g. from `select_rows`).
+
+        Returns
+        -------
+        indices : numpy.ndarray of shape (n_queries, k)
+            Row ids, best first; -1 pads queries with fewer than k matching rows.
+        scores : numpy.ndarray of shape (n_queries, k)
+        """
+        scores = (self.query_matrix(query_texts) @ self.weights).tocsr()
+        allowed = None
+        if rows is not None:
+            allowed = np.zeros(len(self), dtype=bool)
+            allowed[np.asarray(rows, dtype=np.int64)] = True
+
+        indices = np.full((len(query_texts), k), -1, dtype=np.int64)
+        top_scores = np.zeros((len(query_texts), k), dtype=np.float32)
+        for q in range(len(query_texts)):
+            start, end = scores.indptr[q], scores.indptr[q + 1]
+            row_ids, values = scores.indices[start:end], scores.data[start:end]
+            if allowed is not None:
+                keep = allowed[row_ids]
+                row_ids, values = row_ids[keep], values[keep]
+            if len(row_ids) > k:
+                best = np.argpartition(-values, k - 1)[:k]
+                row_ids, values = row_ids[best], values[best]
+            order = np.lexsort((row_ids, -values)) # ties broken by the lower row id
+            indices[q, :len(order)] = row_ids[order]
+            top_scores[q, :len(order)] = values[order]
+        return indices, top_scores
+
+    def save(self, path):
+        """
+        Writes the weight matrix and vocabulary into the index directory `path`.
+        """
+        os.makedirs(path, exist_ok=True)
+        sparse.save_npz(os.path.join(path, BM25_WEIGHTS_FILE), self.weights)
+        terms = sorted(self.vocabulary, key=self.vocabulary.get)
+        with open(os.path.join(path, BM25_INFO_FILE), 'w') as f:
+            json.dump({'k1': self.k1, 'b': self.b, 'avgdl': self.avgdl, 'terms': terms}, f)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Reads an index written by `save`.
+        """
+        with open(os.path.join(path, BM25_INFO_FILE)) as f:
+            info = json.load(f)
+        index = cls(k1=info['k1'], b=info['b'])
+        index.avgdl = info['avgdl']
+        index.vocabulary = {term: i for i, term in enumerate(info['terms'])}
+        index.weights = sparse.load_npz(os.path.join(path, BM25_WEIGHTS_FILE)).tocsr()
+        return index
+
+def build_bm25_index(store, k1=1.2, b=0.75):
+    """
+    Builds a BM25Index over the 'text' of every row of an EmbeddingStore.
+    """
+    return BM25Index(k1=k1, b=b).build(store.metadata['text'].tolist())
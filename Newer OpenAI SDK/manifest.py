@@ -0,0 +1,125 @@
+#------------------------------------#
+# Import Libraries
+#------------------------------------#
+import os
+import json
+import hashlib
+from collections import namedtuple
+
+#------------------------------------#
+# File manifest for incremental scans
+#------------------------------------#
+
+class Changes(namedtuple('Changes', ['added', 'modified', 'deleted'])):
+    """
+    Result of `Manifest.scan`: lists of paths relative to the scanned folder.
+    """
+
+    @property
+    def to_process(self):
+        """Files to (re-)extract."""
+        return self.added + self.modified
+
+    @property
+    def to_remove(self):
+        """Files whose old chunks must be dropped from the index."""
+        return self.modified + self.deleted
+
+def file_hash(file_path, block_size=1 << 20):
+    """
+    SHA-256 of a file's content, read in blocks.
+    """
+    h = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            h.update(block)
+    return h.hexdigest()
+
+class Manifest:
+    """
+    Records path, size, mtime and content hash of every processed file, so a
+    scan only returns files that were added, modified or deleted since the
+    last run.
+
+    The hash is only computed when size or mtime changed, so unchanged files
+    cost one `stat` call. Scans do not touch the manifest file; call `save`
+    once the index has been updated.
+
+    Parameters
+    ----------
+    path : str
+        JSON file holding the manifest (created on first `save`).
+
+    Example
+    -------
+    >>> manifest = Manifest('Made2Manage.manifest.json')
+    >>> changes = manifest.scan('Made2Manage', extensions=('.htm',))
+    >>> extracted = process_html_files('Made2Manage', files=changes.to_process)
+    >>> store = update_embeddings(store, break_and_clean(extracted), changes)
+    >>> manifest.save()
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self._pending = None
+        if os.path.exists(path):
+            with open(path) as f:
+                self.entries = json.load(f)
+
+    def scan(self, folder_path, extensions=('.htm', '.pdf')):
+        """
+        Compares the folder against the manifest.
+
+        Parameters
+        ----------
+        folder_path : str
+        extensions : tuple of str, default=('.htm', '.pdf')
+
+        Returns
+        -------
+        changes : Changes
+        """
+        current = {}
+        added, modified = [], []
+
+        for root, dirs, files in os.walk(folder_path):
+            for file in files:
+                if not file.endswith(extensions):
+                    continue
+                file_path = os.path.join(root, file)
+                rel_path = os.path.relpath(file_path, folder_path)
+                stat = os.stat(file_path)
+                old = self.entries.get(rel_path)
+
+                # Same size and mtime: trust it without hashing
+                if old and old['size'] == stat.st_size and old['mtime'] == stat.st_mtime:
+                    current[rel_path] = old
+                    continue
+
+                entry = {'size': stat.st_size, 'mtime': stat.st_mtime, 'sha256': file_hash(file_path)}
+                current[rel_path] = entry
+                if old is None:
+                    added.append(rel_path)
+                elif old['sha256'] != entry['sha256']:
+                    modified.append(rel_path)
+
+        # Only forget deleted files that have one of the scanned extensions
+        deleted = [p for p in self.entries if p not in current and p.endswith(extensions)]
+        kept = {p: e for p, e in self.entries.items() if p not in current and not p.endswith(extensions)}
+
+        self._pending = {**kept, **current}
+        return Changes(sorted(added), sorted(modified), sorted(deleted))
+
+    def save(self):
+        """
+        Persists the state of the last scan. Call it after the index is updated,
+        so an interrupted run re-detects the same changes next time.
+        """
+        if self._pending is not None:
+            self.entries = self._pending
+            self._pending = None
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.entries, f)
+        os.replace(tmp_path, self.path)
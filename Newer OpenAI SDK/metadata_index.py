@@ -0,0 +1,165 @@
+#------------------------------------#
+# Import Libraries
+#------------------------------------#
+import os
+import numpy as np
+
+# File written next to vectors.npy by EmbeddingStore.save and IndexWriter.close
+FILTERS_FILE = 'filters.npz'
+
+# Metadata columns with an inverted index
+FIELDS = ('folder', 'file', 'title', 'headings')
+
+#------------------------------------#
+# Helpers
+#------------------------------------#
+
+def cell_values(value):
+    """
+    Index keys of one metadata cell: a list of headings gives one key per
+    heading, a plain string one key, and a missing value none.
+    """
+    if value is None:
+        return []
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return [str(v) for v in value if v is not None]
+    if isinstance(value, float) and np.isnan(value):
+        return []
+    return [str(value)]
+
+def normalize_folder(folder):
+    """
+    Folder path with forward slashes and no trailing slash ('' for the root).
+    """
+    folder = str(folder).replace('\\', '/').strip('/')
+    return '' if folder == '.' else folder
+
+#------------------------------------#
+# Inverted indexes over the chunk metadata
+#------------------------------------#
+
+class MetadataIndex:
+    """
+    Inverted indexes from metadata values to row ids, for filtering a query
+    down to a subset of the rows before anything is scored.
+
+    Each field (folder, file, title, headings) maps its distinct values to
+    the sorted row ids holding them (posting lists in CSR form: `keys`,
+    `offsets`, `rows`). Predicates are evaluated on the distinct values,
+    which are far fewer than the rows since every chunk of a document shares
+    them, and the matching posting lists are OR-ed into a boolean row mask.
+    Different predicates are AND-ed.
+
+    Saved as `filters.npz` in the index directory (plain arrays, no pickle).
+
+    Example
+    -------
+    >>> mindex = MetadataIndex.build(store.metadata)
+    >>> mask = mindex.select(folder_prefix='Made2Manage/Sales', title_contains='invoice')
+    >>> indices, scores = store.search(query_embeddings, k=3, rows=np.flatnonzero(mask))
+    """
+
+    def __init__(self, n_rows, postings):
+        self.n_rows = int(n_rows)
+        self.postings = postings # field -> (keys, offsets, rows)
+
+    def __len__(self):
+        return self.n_rows
+
+    @classmethod
+    def build(cls, metadata, fields=FIELDS):
+        """
+        Builds the posting lists of every field present in a metadata DataFrame.
+        """
+        postings = {}
+        for field in fields:
+            if field not in metadata.columns:
+                continue
+            keys, row_ids = [], []
+            for row, value in enumerate(metadata[field].tolist()):
+                for key in cell_values(value):
+                    keys.append(normalize_folder(key) if field == 'folder' else key)
+                    row_ids.append(row)
+            unique_keys, inverse = np.unique(np.array(keys, dtype=str), return_inverse=True)
+            order = np.argsort(inverse, kind='stable') # rows stay sorted within each key
+            offsets = np.zeros(len(unique_keys) + 1, dtype=np.int64)
+            np.cumsum(np.bincount(inverse, minlength=len(unique_keys)), out=offsets[1:])
+            postings[field] = (unique_keys, offsets, np.asarray(row_ids, dtype=np.int64)[order])
+        return cls(len(metadata), postings)
+
+    def rows_matching(self, field, predicate):
+        """
+        Boolean row mask of the rows with a value of `field` for which
+        `predicate(value)` is true.
+        """
+        mask = np.zeros(self.n_rows, dtype=bool)
+        if field not in self.postings:
+            return mask
+        keys, offsets, rows = self.postings[field]
+        for i, key in enumerate(keys):
+            if predicate(str(key)):
+                mask[rows[offsets[i]:offsets[i + 1]]] = True
+        return mask
+
+    def select(self, folder_prefix=None, files=None, title_contains=None, heading_contains=None):
+        """
+        Row mask of the rows matching every given predicate.
+
+        Parameters
+        ----------
+        folder_prefix : str, optional
+            Folder (relative to the corpus root) the rows must be in,
+            including its subfolders.
+        files : iterable of str, optional
+            File names, with or without extension.
+        title_contains : str, optional
+            Case-insensitive substring of the title.
+        heading_contains : str, optional
+            Case-insensitive substring of any heading.
+
+        Returns
+        -------
+        mask : numpy.ndarray of bool of shape (n_rows,), or None
+            None when no predicate is given (every row is selected).
+        """
+        masks = []
+        if folder_prefix is not None:
+            prefix = normalize_folder(folder_prefix)
+            masks.append(self.rows_matching(
+                'folder', lambda key: not prefix or key == prefix or key.startswith(prefix + '/')))
+        if files is not None:
+            names = {str(f) for f in ([files] if isinstance(files, str) else files)}
+            names |= {os.path.splitext(name)[0] for name in names}
+            masks.append(self.rows_matching(
+                'file', lambda key: key in names or os.path.splitext(key)[0] in names))
+        if title_contains is not None:
+            needle = title_contains.lower()
+            masks.append(self.rows_matching('title', lambda key: needle in key.lower()))
+        if heading_contains is not None:
+            needle = heading_contains.lower()
+            masks.append(self.rows_matching('headings', lambda key: needle in key.lower()))
+
+        if not masks:
+            return None
+        return np.logical_and.reduce(masks)
+
+    def save(self, path):
+        """
+        Writes `filters.npz` into the index directory `path`.
+        """
+        arrays = {'n_rows': np.array(self.n_rows)}
+        for field, (keys, offsets, rows) in self.postings.items():
+            arrays[f'{field}_keys'], arrays[f'{field}_offsets'], arrays[f'{field}_rows'] = keys, offsets, rows
+        tmp = os.path.join(path, 'filters.tmp.npz')
+        np.savez(tmp, **arrays)
+        os.replace(tmp, os.path.join(path, FILTERS_FILE))
+
+    @classmethod
+    def load(cls, path):
+        """
+        Reads `filters.npz` from the index directory `path`.
+        """
+        with np.load(os.path.join(path, FILTERS_FILE)) as data:
+            postings = {field: (data[f'{field}_keys'], data[f'{field}_offsets'], data[f'{field}_rows'])
+                        for field in FIELDS if f'{field}_keys' in data}
+            return cls(int(data['n_rows']), postings)
@@ -0,0 +1,186 @@
+#------------------------------------#
+# Import Libraries
+#------------------------------------#
+import json
+import time
+import base64
+import random
+import hashlib
+import threading
+import numpy as np
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+#------------------------------------#
+# Local mock of the embeddings endpoint
+#------------------------------------#
+
+def mock_embedding(text, dim):
+    """
+    Deterministic unit vector for a text (same text, same vector).
+    """
+    seed = int.from_bytes(hashlib.sha256(text.encode('utf-8')).digest()[:8], 'little')
+    vector = np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+class MockEmbeddingsServer:
+    """
+    Local HTTP server that speaks the OpenAI `/v1/embeddings` API, for
+    exercising the embedding pipeline without network access or cost.
+
+    Parameters
+    ----------
+    port : int, default=0
+        0 picks a free port (see `base_url`).
+    dim : int, default=1536
+        Dimension of the returned vectors (overridden by a `dimensions` request field).
+    latency : float, default=0.05
+        Seconds added to every response.
+    latency_jitter : float, default=0.0
+        Extra uniform random delay of up to this many seconds.
+    error_rate : float, default=0.0
+        Fraction of requests answered with HTTP 500.
+    rate_limit_rate : float, default=0.0
+        Fraction of requests answered with HTTP 429 and a Retry-After header.
+    retry_after : float, default=1.0
+        Value of the Retry-After header on 429 responses.
+    seed : int, default=0
+        Seed for the error and latency draws.
+    backend : EmbeddingBackend, optional
+        Computes the returned vectors (e.g. `LocalBackend()` for vectors that
+        reflect the text). By default every text gets a random unit vector
+        seeded by its hash.
+    scripted_statuses : list of int, optional
+        HTTP statuses to answer the first requests with, in order (e.g.
+        [429, 500, 400]), before serving normally. For deterministic tests.
+
+    Example
+    -------
+    >>> server = MockEmbeddingsServer(latency=0.1, rate_limit_rate=0.05).start()
+    >>> client = OpenAI(base_url=server.base_url, api_key='mock', max_retries=0)
+    >>> client.embeddings.create(input=['hello'], model='text-embedding-3-small')
+    >>> server.stop()
+    """
+
+    def __init__(self, port=0, dim=1536, latency=0.05, error_rate=0.0, rate_limit_rate=0.0,
+                 retry_after=1.0, seed=0, latency_jitter=0.0, backend=None, scripted_statuses=None):
+        self.dim = dim
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.backend = backend
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.scripted_statuses = list(scripted_statuses or [])
+        self.requests = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer(('127.0.0.1', port), self._make_handler())
+        self._thread = None
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self._httpd.server_address[1]}/v1"
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass # keep test output quiet
+
+            def _reply(self, status, body, headers=None):
+                payload = json.dumps(body).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_POST(self):
+                if not self.path.rstrip('/').endswith('/embeddings'):
+                    return self._reply(404, {'error': {'message': 'not found'}})
+
+                request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+                with server._lock:
+                    server.requests += 1
+                    draw = server._random.random()
+                    delay = server.latency + server._random.uniform(0, server.latency_jitter)
+                    status = server.scripted_statuses.pop(0) if server.scripted_statuses else None
+                time.sleep(delay)
+
+                if status == 429:
+                    return self._reply(429, {'error': {'message': 'Rate limit reached (mock)', 'type': 'rate_limit'}},
+                                       {'Retry-After': str(server.retry_after)})
+                if status is not None and status != 200:
+                    return self._reply(status, {'error': {'message': f'HTTP {status} (mock)', 'type': 'mock_error'}})
+                if status is None and draw < server.rate_limit_rate:
+                    return self._reply(429, {'error': {'message': 'Rate limit reached (mock)', 'type': 'rate_limit'}},
+                                       {'Retry-After': str(server.retry_after)})
+                if status is None and draw < server.rate_limit_rate + server.error_rate:
+                    return self._reply(500, {'error': {'message': 'Internal error (mock)', 'type': 'server_error'}})
+
+                texts = request['input']
+                texts = [texts] if isinstance(texts, str) else texts
+                dim = request.get('dimensions') or server.dim
+                if server.backend is not None:
+                    vectors = server.backend.embed([str(t) for t in texts], request.get('model'), dimensions=dim)
+                else:
+                    vectors = [mock_embedding(str(text), dim) for text in texts]
+                data = []
+                for i, vector in enumerate(vectors):
+                    if request.get('encoding_format') == 'base64':
+                        embedding = base64.b64encode(vector.astype('<f4').tobytes()).decode('ascii')
+                    else:
+                        embedding = vector.tolist()
+                    data.append({'object': 'embedding', 'index': i, 'embedding': embedding})
+
+                n_tokens = sum(len(str(t)) // 4 + 1 for t in texts)
+                self._reply(200, {'object': 'list', 'data': data, 'model': request.get('model'),
+                                  'usage': {'prompt_tokens': n_tokens, 'total_tokens': n_tokens}})
+
+        return Handler
+
+    def start(self):
+        """
+        Serves in a background thread. Returns self.
+        """
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Serve a mock OpenAI embeddings endpoint.')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--dim', type=int, default=1536)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--latency-jitter', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0)
+    parser.add_argument('--retry-after', type=float, default=1.0)
+    parser.add_argument('--local', action='store_true', help='Return LocalBackend vectors instead of random ones.')
+    args = parser.parse_args()
+
+    backend = None
+    if args.local:
+        from embedding_backends import LocalBackend
+        backend = LocalBackend(dim=args.dim)
+    server = MockEmbeddingsServer(port=args.port, dim=args.dim, latency=args.latency,
+                                  error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate,
+                                  retry_after=args.retry_after, latency_jitter=args.latency_jitter,
+                                  backend=backend)
+    print(f"Mock embeddings server on {server.base_url}")
+    server._httpd.serve_forever()
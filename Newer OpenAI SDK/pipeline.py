@@ -0,0 +1,259 @@
+#------------------------------------#
+# Import Libraries
+#------------------------------------#
+import os
+import threading
+from collections import deque
+import numpy as np
+from extract_text import process_files_parallel, list_files, iter_pdf_file_pages
+from preprocess_text import break_and_clean
+from create_embeddings import embed_texts, METADATA_COLUMNS
+from index_writer import IndexWriter
+from embedding_scheduler import EmbeddingScheduler, RETRY_QUEUE_FILE
+from instrumentation import metrics
+
+#------------------------------------#
+# Bounded queue between stages
+#------------------------------------#
+
+class PipelineAborted(Exception):
+    """Raised in a stage when another stage failed."""
+
+class ByteBoundedQueue:
+    """
+    Blocking FIFO limited by the (estimated) bytes of the items it holds,
+    so a fast stage cannot run ahead of a slow one and fill memory.
+    A single item larger than the limit is still accepted when the queue is empty.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._items = deque()
+        self._bytes = 0
+        self._aborted = False
+        self._cond = threading.Condition()
+
+    def put(self, item, nbytes=0):
+        with self._cond:
+            while self._items and self._bytes + nbytes > self.max_bytes and not self._aborted:
+                self._cond.wait()
+            if self._aborted:
+                raise PipelineAborted()
+            self._items.append((item, nbytes))
+            self._bytes += nbytes
+            self._cond.notify_all()
+
+    def get(self):
+        with self._cond:
+            while not self._items and not self._aborted:
+                self._cond.wait()
+            if self._aborted:
+                raise PipelineAborted()
+            item, nbytes = self._items.popleft()
+            self._bytes -= nbytes
+            self._cond.notify_all()
+            return item
+
+    def abort(self):
+        with self._cond:
+            self._aborted = True
+            self._cond.notify_all()
+
+# Marks the end of a stage's output
+DONE = object()
+
+def record_nbytes(record):
+    """
+    Rough in-memory size of a document or chunk record.
+    """
+    return 200 + sum(len(str(v)) for v in record.values())
+
+#------------------------------------#
+# Streaming pipeline
+#------------------------------------#
+
+@metrics.timed('run_pipeline')
+def run_pipeline(folder_path, index_path, embed_model='text-embedding-3-small', workers=None,
+                 max_memory_mb=1024, cache=None, scheduler=None, oversize_policy='truncate', files=None,
+                 chunker=None, dimensions=None, dedup=None, remove=None):
+    """
+    Extracts, chunks, embeds and writes a corpus as a stream, with bounded
+    memory. Each stage runs in its own thread and hands its output to the
+    next through a queue limited in bytes, so peak memory depends on
+    `max_memory_mb`, not on corpus size. Chunks are written to the on-disk
+    index as soon as they are embedded.
+
+        extract (process pool) -> chunk -> embed (concurrent requests) -> write
+
+    Parameters
+    ----------
+    folder_path : str
+        Folder with .htm and .pdf files.
+    index_path : str
+        Index directory to write, appended to if it exists (open it with
+        `EmbeddingStore.open`).
+    embed_model : str
+    workers : int, optional
+        Extraction processes. Defaults to the number of CPU cores.
+    max_memory_mb : float, default=1024
+        Memory budget for the data in flight, split between the three queues
+        and the embedding window.
+    cache : EmbeddingCache, optional
+    scheduler : EmbeddingScheduler, optional
+        Defaults to one that keeps failed requests in `failed_batches.jsonl`
+        in `index_path` (replay them with `retry_failed_embeddings`).
+    oversize_policy : {'truncate', 'split', 'error'}, default='truncate'
+    files : list of str, optional
+        Only process these paths (relative to `folder_path`). When appending
+        to an existing index, their old chunks are replaced.
+    chunker : Chunker, optional
+        Token-bounded chunker (see chunking.py). Defaults to `break_and_clean`.
+        With a chunker, PDFs are read and chunked page by page
+        (`iter_pdf_file_pages` -> `Chunker.chunk_pages`), so a large PDF is
+        never held in memory whole and its chunks record 'page_start' and
+        'page_end'.
+    dimensions : int, optional
+        Output dimension requested from the model (recorded in the index).
+    dedup : Deduplicator, optional
+        Drops exact and near-duplicate chunks before they are embedded (see
+        dedup.py). Its state is loaded from and saved to the index directory,
+        so chunks indexed by earlier runs are not embedded again.
+    remove : list of str, optional
+        Paths whose chunks are dropped from an existing index without being
+        processed again, e.g. `changes.deleted` of a Manifest scan.
+
+    Returns
+    -------
+    stats : dict
+        Counts of documents, chunks, embedded chunks and failed files (and
+        duplicates dropped, with `dedup`).
+
+    Example
+    -------
+    >>> stats = run_pipeline('Made2Manage', 'made2manage_index', workers=8, max_memory_mb=2048)
+    >>> store = EmbeddingStore.open('made2manage_index')
+
+    >>> changes = manifest.scan('Made2Manage')
+    >>> run_pipeline('Made2Manage', 'made2manage_index', files=changes.to_process, remove=changes.deleted)
+    """
+    budget = int(max_memory_mb * 1024**2) // 4
+    docs, chunks, embedded = ByteBoundedQueue(budget), ByteBoundedQueue(budget), ByteBoundedQueue(budget)
+    queues = [docs, chunks, embedded]
+    stats = {'documents': 0, 'chunks': 0, 'embedded': 0, 'failed_chunks': 0, 'failed_files': []}
+    errors = []
+
+    def stage(target):
+        def run():
+            try:
+                target()
+            except PipelineAborted:
+                pass
+            except BaseException as e:
+                errors.append(e)
+                for q in queues:
+                    q.abort()
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        return thread
+
+    def extract():
+        extensions = ('.htm', '.pdf')
+        if chunker is not None:
+            # PDFs are streamed page by page in the chunk stage
+            extensions = ('.htm',)
+            for file_path in list_files(folder_path, '.pdf', files):
+                stats['documents'] += 1
+                docs.put({'pdf': file_path})
+        for doc in process_files_parallel(folder_path, extensions=extensions, workers=workers, files=files,
+                                          errors=stats['failed_files']):
+            stats['documents'] += 1
+            docs.put(doc, record_nbytes(doc))
+        docs.put(DONE)
+
+    def pdf_chunks(file_path):
+        try:
+            yield from chunker.chunk_pages(iter_pdf_file_pages(file_path, folder_path))
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            print(f"Failed to extract {file_path}: {error}")
+            stats['failed_files'].append((file_path, error))
+
+    def chunk():
+        while (doc := docs.get()) is not DONE:
+            if 'pdf' in doc:
+                items = pdf_chunks(doc['pdf'])
+            else:
+                items = chunker.chunk_record(doc) if chunker else break_and_clean([doc])
+            for item in (dedup.filter(items) if dedup is not None else items):
+                stats['chunks'] += 1
+                chunks.put(item, record_nbytes(item))
+        chunks.put(DONE)
+
+    def embed():
+        window, window_bytes = [], 0
+        finished = False
+        while not finished:
+            item = chunks.get()
+            finished = item is DONE
+            if not finished:
+                window.append(item)
+                window_bytes += record_nbytes(item)
+            if window and (finished or window_bytes >= budget):
+                records = [{col: x.get(col) for col in METADATA_COLUMNS} for x in window]
+                with metrics.timer('run_pipeline.embed'):
+                    embeds = embed_texts([x['text'] for x in window], embed_model=embed_model, cache=cache,
+                                         scheduler=scheduler, oversize_policy=oversize_policy, show_progress=False,
+                                         dimensions=dimensions, metadata=records)
+                keep = [j for j, emb in enumerate(embeds) if emb is not None]
+                stats['failed_chunks'] += len(window) - len(keep)
+                if keep:
+                    vectors = np.array([embeds[j] for j in keep], dtype=np.float32)
+                    embedded.put((vectors, [records[j] for j in keep]), vectors.nbytes + window_bytes)
+                window, window_bytes = [], 0
+        embedded.put(DONE)
+
+    # An existing index keeps the model and dimensions it was built with, and
+    # loses the old chunks of the files processed again or removed
+    remove_paths = list(files or []) + list(remove or [])
+    if dedup is not None:
+        dedup.load(index_path).remove_sources(remove_paths)
+    writer = IndexWriter(index_path, embed_model=embed_model, dimensions=dimensions, remove_paths=remove_paths,
+                         sources=dedup.sources if dedup is not None else None)
+    dimensions = writer.dimensions
+    if scheduler is None:
+        scheduler = EmbeddingScheduler(retry_queue_path=os.path.join(index_path, RETRY_QUEUE_FILE))
+
+    threads = [stage(extract), stage(chunk), stage(embed)]
+
+    # Write in the calling thread as batches arrive
+    try:
+        while (batch := embedded.get()) is not DONE:
+            vectors, records = batch
+            with metrics.timer('run_pipeline.write'):
+                writer.append(vectors, records)
+            stats['embedded'] += len(records)
+    except PipelineAborted:
+        pass
+    finally:
+        for q in queues:
+            q.abort() # no-op on success; unblocks stages if writing failed
+        for thread in threads:
+            thread.join()
+        with metrics.timer('run_pipeline.finalize'):
+            writer.close()
+
+    if errors:
+        raise errors[0]
+
+    for name in ('documents', 'chunks', 'embedded', 'failed_chunks'):
+        metrics.count(f'run_pipeline.{name}', stats[name])
+    metrics.count('run_pipeline.failed_files', len(stats['failed_files']))
+
+    if dedup is not None:
+        dedup.save(index_path)
+        stats['duplicates'] = dedup.n_duplicates
+        print(dedup.report())
+
+    print(f"Indexed {stats['embedded']} chunks from {stats['documents']} documents "
+          f"({stats['failed_chunks']} chunks and {len(stats['failed_files'])} files failed)")
+    return stats
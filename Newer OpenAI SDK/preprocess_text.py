@@ -3,6 +3,8 @@
 #------------------------------------#
 from tqdm.auto import tqdm
 import nltk
+from chunking import get_punkt_tokenizer, chunk_documents
+from instrumentation import metrics
 
 #------------------------------------#
 # Break text into chunks and clean
@@ -21,7 +23,7 @@ def split_text_into_chunks(text, max_sentences=10):
     -------
     chunks : list of str
     """
-    sentence_tokenizer = nltk.data.load('tokenizers/punkt/english.pickle')
+    sentence_tokenizer = get_punkt_tokenizer() # loaded once, not on every call
     sentences = sentence_tokenizer.tokenize(text)
 
     total_sentences = len(sentences)
@@ -36,18 +38,29 @@ def split_text_into_chunks(text, max_sentences=10):
 
     return chunks
 
-def break_and_clean(extracted_text_data):
+@metrics.timed('break_and_clean')
+def break_and_clean(extracted_text_data, chunker=None, workers=1):
     """
     Breaks text into chunks and cleans it.
     
     Parameters
     ----------
     extracted_text_data : list of dict
+    chunker : Chunker, optional
+        Token-bounded chunker (see chunking.py). By default text is split
+        into chunks of 10 sentences.
+    workers : int, default=1
+        Processes used with `chunker`. None uses all cores.
 
     Returns
     -------
     new_data : list of dict
     """
+    if chunker is not None:
+        new_data = chunk_documents(extracted_text_data, chunker, workers=workers)
+        metrics.count('break_and_clean.chunks', len(new_data))
+        return new_data
+
     # Download the Punkt tokenizer if it's not already installed
     try:
         nltk.data.find('tokenizers/punkt')
@@ -74,4 +87,5 @@ def break_and_clean(extracted_text_data):
     for data in new_data:
         data['file'] = data['file'][:-4]
 
+    metrics.count('break_and_clean.chunks', len(new_data))
     return new_data
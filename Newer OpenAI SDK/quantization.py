@@ -0,0 +1,225 @@
+#------------------------------------#
+# Import Libraries
+#------------------------------------#
+import os
+import time
+import numpy as np
+from embedding_store import top_k_from_scores, rerank_candidates
+
+KINDS = ('float16', 'int8', 'binary')
+
+# Bits set in every byte value (for Hamming distances of packed sign codes)
+POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+def popcount(x):
+    """
+    Number of set bits of each byte of a uint8 array.
+    """
+    if hasattr(np, 'bitwise_count'): # NumPy >= 2.0
+        return np.bitwise_count(x)
+    return POPCOUNT[x]
+
+#------------------------------------#
+# Quantized index with re-ranking
+#------------------------------------#
+
+class QuantizedIndex:
+    """
+    Compressed copy of the store's vectors for a fast first pass, followed by
+    exact re-ranking of the best candidates with the full-precision rows
+    (which can stay on disk, memory-mapped, in `store.vectors`).
+
+    Kinds (memory per 1536-d vector):
+
+    - 'float16': half precision (3 KB, 2x smaller than float32).
+    - 'int8': one byte per dimension with a per-dimension scale (1.5 KB, 4x).
+    - 'binary': one sign bit per dimension, scored by Hamming distance (192 B, 32x).
+
+    Parameters
+    ----------
+    store : EmbeddingStore
+        Source of the full-precision vectors used for re-ranking.
+    kind : {'float16', 'int8', 'binary'}, default='int8'
+    oversample : int, default=4
+        Candidates re-ranked per query: `oversample * k` (at least k).
+
+    Example
+    -------
+    >>> store = EmbeddingStore.open('my_index') # vectors stay on disk
+    >>> qindex = build_quantized_index(store, kind='binary', oversample=10)
+    >>> indices, scores = qindex.search(query_embeddings, k=10)
+    >>> evaluate_quantization(store, query_embeddings, k=10)
+    """
+
+    def __init__(self, store, kind='int8', oversample=4, block_size=65536):
+        if kind not in KINDS:
+            raise ValueError(f"Unknown kind: {kind}")
+        self.store = store
+        self.kind = kind
+        self.oversample = int(oversample)
+        self.block_size = int(block_size)
+        self.codes = None
+        self.scale = None
+
+    def __len__(self):
+        return 0 if self.codes is None else len(self.codes)
+
+    def build(self):
+        """
+        Encodes every row of the store, block by block. Returns self.
+        """
+        vectors = self.store.vectors
+        if self.kind == 'int8':
+            self.scale = np.zeros(vectors.shape[1], dtype=np.float32)
+            for start in range(0, len(vectors), self.block_size):
+                block = np.abs(vectors[start:start + self.block_size]).max(axis=0)
+                np.maximum(self.scale, block, out=self.scale)
+            self.scale /= 127.0
+            self.scale[self.scale == 0] = 1.0
+
+        blocks = [self.encode(vectors[start:start + self.block_size])
+                  for start in range(0, len(vectors), self.block_size)]
+        self.codes = np.concatenate(blocks) if blocks else self.encode(vectors)
+        return self
+
+    def encode(self, vectors):
+        """
+        Codes of a block of (normalized) vectors.
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if self.kind == 'float16':
+            return vectors.astype(np.float16)
+        if self.kind == 'int8':
+            return np.clip(np.rint(vectors / self.scale), -127, 127).astype(np.int8)
+        return np.packbits(vectors > 0, axis=1)
+
+    def approximate_scores(self, queries):
+        """
+        First-pass similarity of every row for each query, computed on the codes.
+        """
+        scores = np.empty((len(queries), len(self.codes)), dtype=np.float32)
+        if self.kind == 'binary':
+            query_codes = self.encode(queries)
+            dim = queries.shape[1]
+        elif self.kind == 'int8':
+            queries = queries * self.scale # fold the scale into the query once
+
+        for start in range(0, len(self.codes), self.block_size):
+            block = self.codes[start:start + self.block_size]
+            end = start + len(block)
+            if self.kind == 'binary':
+                for q, code in enumerate(query_codes):
+                    hamming = popcount(block ^ code).sum(axis=1, dtype=np.int32)
+                    scores[q, start:end] = (dim - 2 * hamming) / dim
+            else:
+                scores[:, start:end] = queries @ block.astype(np.float32).T
+        return scores
+
+    def search(self, query_embeddings, k=3, rerank=True, oversample=None):
+        """
+        Top-k search: candidates from the codes, then exact re-ranking.
+
+        Parameters
+        ----------
+        query_embeddings : array-like of shape (n_queries, dim)
+        k : int, default=3
+        rerank : bool, default=True
+            Re-score the candidates with the full-precision vectors. Without
+            it, the approximate scores are returned.
+        oversample : int, optional
+            Overrides the index default for this call.
+
+        Returns
+        -------
+        indices : numpy.ndarray of shape (n_queries, k)
+        scores : numpy.ndarray of shape (n_queries, k)
+        """
+        queries = self.store.match_queries(query_embeddings)
+        approximate = self.approximate_scores(queries)
+        if not rerank:
+            return top_k_from_scores(approximate, k)
+
+        n_candidates = max(k, (self.oversample if oversample is None else int(oversample)) * k)
+        candidates, _ = top_k_from_scores(approximate, n_candidates)
+        return rerank_candidates(self.store.vectors, queries, candidates, k)
+
+    def memory_bytes(self):
+        """
+        Size of the codes (plus scale) held in memory.
+        """
+        return self.codes.nbytes + (self.scale.nbytes if self.scale is not None else 0)
+
+    def save(self, path):
+        """
+        Saves the codes into the index directory `path` (next to vectors.npy).
+        """
+        np.save(os.path.join(path, f'codes_{self.kind}.npy'), self.codes)
+        if self.scale is not None:
+            np.save(os.path.join(path, f'scale_{self.kind}.npy'), self.scale)
+
+    @classmethod
+    def load(cls, store, path, kind='int8', oversample=4):
+        """
+        Loads codes written by `save`.
+        """
+        index = cls(store, kind=kind, oversample=oversample)
+        index.codes = np.load(os.path.join(path, f'codes_{kind}.npy'))
+        scale_path = os.path.join(path, f'scale_{kind}.npy')
+        if os.path.exists(scale_path):
+            index.scale = np.load(scale_path)
+        return index
+
+#------------------------------------#
+# Build and evaluate
+#------------------------------------#
+
+def build_quantized_index(store, kind='int8', oversample=4):
+    """
+    Builds a QuantizedIndex over all rows of an EmbeddingStore.
+    """
+    return QuantizedIndex(store, kind=kind, oversample=oversample).build()
+
+def evaluate_quantization(store, query_embeddings, k=10, kinds=KINDS, oversamples=(1, 4, 10)):
+    """
+    Memory and recall@k of each kind of code, with and without re-ranking,
+    against the exact float32 search. Prints a table and returns its rows.
+
+    Parameters
+    ----------
+    store : EmbeddingStore
+    query_embeddings : array-like of shape (n_queries, dim)
+        A sample of real queries (or held-out rows).
+    k : int, default=10
+    kinds : tuple of str
+    oversamples : tuple of int
+        Candidate multipliers to try for re-ranking.
+
+    Returns
+    -------
+    rows : list of dict
+        kind, oversample (None without re-ranking), memory_mb,
+        compression (float32 size / code size), recall and
+        ms_per_query.
+    """
+    exact, _ = store.search(query_embeddings, k=k)
+    full_bytes = len(store) * store.dim * 4
+    rows = []
+
+    def recall(indices):
+        return sum(len(np.intersect1d(e, a)) for e, a in zip(exact, indices)) / exact.size
+
+    print(f"{'kind':<8} {'rerank':>7} {'MB':>9} {'x smaller':>10} {'recall@' + str(k):>10} {'ms/query':>9}")
+    print(f"{'float32':<8} {'-':>7} {full_bytes / 1024**2:9.1f} {1.0:10.1f} {1.0:10.3f} {'-':>9}")
+    for kind in kinds:
+        index = build_quantized_index(store, kind=kind)
+        memory = index.memory_bytes()
+        for oversample in (None, *oversamples):
+            start = time.perf_counter()
+            indices, _ = index.search(query_embeddings, k=k, rerank=oversample is not None, oversample=oversample)
+            ms = (time.perf_counter() - start) * 1000 / len(indices)
+            row = {'kind': kind, 'oversample': oversample, 'memory_mb': memory / 1024**2,
+                   'compression': full_bytes / memory, 'recall': recall(indices), 'ms_per_query': ms}
+            rows.append(row)
+            print(f"{kind:<8} {('x' + str(oversample)) if oversample else 'no':>7} {row['memory_mb']:9.1f} "
+                  f"{row['compression']:10.1f} {row['recall']:10.3f} {ms:9.2f}")
+    return rows
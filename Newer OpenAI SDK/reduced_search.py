@@ -0,0 +1,188 @@
+#------------------------------------#
+# Import Libraries
+#------------------------------------#
+import os
+import time
+import numpy as np
+from embedding_store import truncate_embeddings, top_k_from_scores, rerank_candidates
+
+METHODS = ('prefix', 'pca')
+
+#------------------------------------#
+# Projections
+#------------------------------------#
+
+def fit_pca(vectors, n_components, max_samples=20000, seed=0):
+    """
+    Top principal directions of (a sample of) the rows, without centering,
+    so that inner products are preserved as well as possible.
+
+    Returns
+    -------
+    components : numpy.ndarray of shape (n_components, dim)
+        Orthonormal rows.
+    """
+    rng = np.random.default_rng(seed)
+    if len(vectors) > max_samples:
+        sample = np.asarray(vectors[np.sort(rng.choice(len(vectors), max_samples, replace=False))])
+    else:
+        sample = np.asarray(vectors)
+    # Eigenvectors of the (dim x dim) second-moment matrix: cheaper than an SVD of the sample
+    eigenvalues, eigenvectors = np.linalg.eigh(sample.T.astype(np.float64) @ sample)
+    order = np.argsort(eigenvalues)[::-1][:n_components]
+    return np.ascontiguousarray(eigenvectors[:, order].T, dtype=np.float32)
+
+#------------------------------------#
+# Two-stage reduced-dimension index
+#------------------------------------#
+
+class ReducedIndex:
+    """
+    Two-stage search: every row is scanned at a reduced dimension, and the
+    best `oversample * k` candidates are re-scored with the full-dimension
+    vectors of the store.
+
+    - 'prefix': the first `dim` coordinates, renormalized. Models trained with
+      nested (Matryoshka) representations, such as text-embedding-3-*, keep
+      most of their quality in a prefix.
+    - 'pca': projection on the top `dim` principal directions of the rows,
+      for models whose prefixes are not meaningful.
+
+    Parameters
+    ----------
+    store : EmbeddingStore
+    method : {'prefix', 'pca'}, default='prefix'
+    dim : int, default=256
+        Dimension of the first pass.
+    oversample : int, default=8
+
+    Example
+    -------
+    >>> rindex = build_reduced_index(store, method='prefix', dim=256)
+    >>> prompt = retrieve('How do I post an invoice?', store, index=rindex)
+    """
+
+    def __init__(self, store, method='prefix', dim=256, oversample=8, block_size=65536, seed=0):
+        if method not in METHODS:
+            raise ValueError(f"Unknown method: {method}")
+        if dim >= store.dim:
+            raise ValueError(f"Reduced dimension {dim} must be smaller than the store's {store.dim}")
+        self.store = store
+        self.method = method
+        self.dim = int(dim)
+        self.oversample = int(oversample)
+        self.block_size = int(block_size)
+        self.seed = seed
+        self.components = None
+        self.reduced = None
+
+    def __len__(self):
+        return 0 if self.reduced is None else len(self.reduced)
+
+    def project(self, vectors):
+        """
+        Reduced vectors for (normalized, full-dimension) vectors.
+        """
+        if self.method == 'prefix':
+            return truncate_embeddings(vectors, self.dim)
+        return np.asarray(vectors, dtype=np.float32) @ self.components.T
+
+    def build(self):
+        """
+        Fits the projection (PCA only) and projects every row. Returns self.
+        """
+        vectors = self.store.vectors
+        if self.method == 'pca':
+            self.components = fit_pca(vectors, self.dim, seed=self.seed)
+        self.reduced = np.empty((len(vectors), self.dim), dtype=np.float32)
+        for start in range(0, len(vectors), self.block_size):
+            self.reduced[start:start + self.block_size] = self.project(vectors[start:start + self.block_size])
+        return self
+
+    def search(self, query_embeddings, k=3, rerank=True, oversample=None):
+        """
+        Top-k search: candidates at the reduced dimension, then exact
+        re-scoring at the full dimension.
+
+        Parameters
+        ----------
+        query_embeddings : array-like of shape (n_queries, store.dim)
+        k : int, default=3
+        rerank : bool, default=True
+        oversample : int, optional
+            Overrides the index default for this call.
+
+        Returns
+        -------
+        indices : numpy.ndarray of shape (n_queries, k)
+        scores : numpy.ndarray of shape (n_queries, k)
+        """
+        queries = self.store.match_queries(query_embeddings)
+        approximate = self.project(queries) @ self.reduced.T
+        if not rerank:
+            return top_k_from_scores(approximate, k)
+
+        n_candidates = max(k, (self.oversample if oversample is None else int(oversample)) * k)
+        candidates, _ = top_k_from_scores(approximate, n_candidates)
+        return rerank_candidates(self.store.vectors, queries, candidates, k)
+
+    def memory_bytes(self):
+        return self.reduced.nbytes + (self.components.nbytes if self.components is not None else 0)
+
+    def save(self, path):
+        """
+        Saves the reduced rows (and PCA components) into the index directory `path`.
+        """
+        np.save(os.path.join(path, f'reduced_{self.method}_{self.dim}.npy'), self.reduced)
+        if self.components is not None:
+            np.save(os.path.join(path, f'components_{self.method}_{self.dim}.npy'), self.components)
+
+    @classmethod
+    def load(cls, store, path, method='prefix', dim=256, oversample=8):
+        """
+        Loads an index written by `save`.
+        """
+        index = cls(store, method=method, dim=dim, oversample=oversample)
+        index.reduced = np.load(os.path.join(path, f'reduced_{method}_{dim}.npy'))
+        components_path = os.path.join(path, f'components_{method}_{dim}.npy')
+        if os.path.exists(components_path):
+            index.components = np.load(components_path)
+        return index
+
+#------------------------------------#
+# Build and evaluate
+#------------------------------------#
+
+def build_reduced_index(store, method='prefix', dim=256, oversample=8):
+    """
+    Builds a ReducedIndex over all rows of an EmbeddingStore.
+    """
+    return ReducedIndex(store, method=method, dim=dim, oversample=oversample).build()
+
+def evaluate_reduced_search(store, query_embeddings, k=10, methods=METHODS, dims=(64, 128, 256),
+                            oversamples=(1, 4, 8)):
+    """
+    Recall@k and query time of each method, reduced dimension and
+    oversampling factor, against the exact full-dimension search. Prints a
+    table and returns its rows.
+    """
+    exact, _ = store.search(query_embeddings, k=k)
+    rows = []
+
+    print(f"{'method':<7} {'dim':>5} {'rerank':>7} {'recall@' + str(k):>10} {'ms/query':>9}")
+    for method in methods:
+        for dim in dims:
+            if dim >= store.dim:
+                continue
+            index = build_reduced_index(store, method=method, dim=dim)
+            for oversample in (None, *oversamples):
+                start = time.perf_counter()
+                indices, _ = index.search(query_embeddings, k=k, rerank=oversample is not None,
+                                          oversample=oversample)
+                ms = (time.perf_counter() - start) * 1000 / len(indices)
+                recall = sum(len(np.intersect1d(e, a)) for e, a in zip(exact, indices)) / exact.size
+                rows.append({'method': method, 'dim': dim, 'oversample': oversample, 'recall': recall,
+                             'ms_per_query': ms})
+                print(f"{method:<7} {dim:>5} {('x' + str(oversample)) if oversample else 'no':>7} "
+                      f"{recall:10.3f} {ms:9.2f}")
+    return rows
@@ -0,0 +1,136 @@
+#------------------------------------#
+# Import Libraries
+#------------------------------------#
+import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from embedding_store import top_k_from_scores
+
+#------------------------------------#
+# Merging per-shard results
+#------------------------------------#
+
+def merge_top_k(indices, scores, k):
+    """
+    Merges per-shard top-k lists into the global top-k of each query.
+
+    Parameters
+    ----------
+    indices : list of numpy.ndarray of shape (n_queries, k_shard)
+        Global row ids of each shard's best rows.
+    scores : list of numpy.ndarray of shape (n_queries, k_shard)
+    k : int
+
+    Returns
+    -------
+    indices, scores : numpy.ndarray of shape (n_queries, k)
+        Highest score first, ties broken by the lower row id (as in
+        `top_k_from_scores`).
+    """
+    indices = np.concatenate(indices, axis=1)
+    scores = np.concatenate(scores, axis=1)
+    order = np.lexsort((indices, -scores), axis=1)[:, :k]
+    return np.take_along_axis(indices, order, axis=1), np.take_along_axis(scores, order, axis=1)
+
+#------------------------------------#
+# Sharded exact search
+#------------------------------------#
+
+class ShardedSearch:
+    """
+    Exact search split across cores. The store's matrix is cut into row
+    shards (views, so a memory-mapped index is shared, never copied), each
+    shard is scored and reduced to its own top-k on a thread pool, and the
+    per-shard lists are merged. NumPy's matrix products release the GIL, so
+    the shards run in parallel. Results are the same rows and scores as
+    `store.search`.
+
+    BLAS may already use several threads for one large product. To measure
+    or run the sharded search alone, set OPENBLAS_NUM_THREADS=1 (or
+    OMP_NUM_THREADS / MKL_NUM_THREADS) before starting Python.
+
+    Parameters
+    ----------
+    store : EmbeddingStore
+    workers : int, optional
+        Threads (default: os.cpu_count()). With 1, shards are scored in turn
+        on the calling thread.
+    shard_rows : int, optional
+        Rows per shard. By default the rows are split evenly across workers,
+        capped at `max_shard_rows` to bound the score block of each shard.
+    max_shard_rows : int, default=262144
+
+    Example
+    -------
+    >>> store = EmbeddingStore.open('my_index')
+    >>> sharded = ShardedSearch(store, workers=8)
+    >>> prompt = retrieve('How do I post an invoice?', store, index=sharded)
+    """
+
+    def __init__(self, store, workers=None, shard_rows=None, max_shard_rows=262144):
+        self.store = store
+        self.workers = int(workers or os.cpu_count() or 1)
+        self.shard_rows = shard_rows
+        self.max_shard_rows = int(max_shard_rows)
+        self._executor = None
+
+    def shards(self):
+        """
+        (start, end) row ranges of the shards.
+        """
+        n_rows = len(self.store)
+        rows = self.shard_rows or min(-(-n_rows // self.workers), self.max_shard_rows)
+        rows = max(int(rows), 1)
+        return [(start, min(start + rows, n_rows)) for start in range(0, n_rows, rows)]
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='shard')
+        return self._executor
+
+    def close(self):
+        """
+        Shuts down the thread pool.
+        """
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _search_shard(self, queries, start, end, k):
+        indices, scores = top_k_from_scores(queries @ self.store.vectors[start:end].T, k)
+        return indices + start, scores
+
+    def search(self, query_embeddings, k=3):
+        """
+        Finds the `k` most similar rows for each query.
+
+        Parameters
+        ----------
+        query_embeddings : array-like of shape (n_queries, dim)
+        k : int, default=3
+
+        Returns
+        -------
+        indices : numpy.ndarray of shape (n_queries, k)
+            Row ids, most similar first.
+        scores : numpy.ndarray of shape (n_queries, k)
+        """
+        queries = self.store.match_queries(query_embeddings)
+        shards = self.shards()
+        if not shards:
+            return top_k_from_scores(np.empty((len(queries), 0), dtype=np.float32), k)
+
+        if self.workers == 1 or len(shards) == 1:
+            results = [self._search_shard(queries, start, end, k) for start, end in shards]
+        else:
+            futures = [self.executor.submit(self._search_shard, queries, start, end, k) for start, end in shards]
+            results = [future.result() for future in futures]
+        indices, scores = zip(*results)
+        return merge_top_k(indices, scores, k)
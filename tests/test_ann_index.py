@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+from ann_index import IVFIndex, build_ivf_index, recall_at_k
+from embedding_store import EmbeddingStore
+
+DIM = 16
+
+def clustered_store(n_clusters=20, per_cluster=50, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(n_clusters, DIM))
+    vectors = np.repeat(centers, per_cluster, axis=0) + 0.3 * rng.normal(size=(n_clusters * per_cluster, DIM))
+    store = EmbeddingStore(dim=DIM)
+    store.add(vectors, [{'text': str(i)} for i in range(len(vectors))])
+    return store, rng
+
+def test_recall_against_exact_search():
+    store, rng = clustered_store()
+    queries = store.vectors[rng.choice(len(store), size=30, replace=False)] + 0.05 * rng.normal(size=(30, DIM))
+    index = build_ivf_index(store, n_probe=4)
+
+    assert len(index) == len(store)
+    assert recall_at_k(index, store, queries, k=10) >= 0.9
+    assert recall_at_k(index, store, queries, k=10, n_probe=index.n_lists) == 1.0
+
+def test_small_and_empty_stores():
+    store = EmbeddingStore(dim=DIM)
+    with pytest.raises(ValueError, match='empty'):
+        build_ivf_index(store)
+
+    store.add(np.eye(DIM)[:3], [{'text': str(i)} for i in range(3)])
+    index = build_ivf_index(store, n_lists=10)
+    assert index.n_lists == 3
+    indices, _ = index.search(np.eye(DIM)[:1], k=5, n_probe=3)
+    assert indices[0, 0] == 0 and list(indices[0, 3:]) == [-1, -1]
+
+    with pytest.raises(ValueError, match='3 vectors'):
+        IVFIndex(4).train(store.vectors)
+
+def test_save_and_load(tmp_path):
+    store, rng = clustered_store(n_clusters=5, per_cluster=20)
+    index = build_ivf_index(store)
+    index.save(str(tmp_path / 'ivf.npz'))
+    loaded = IVFIndex.load(str(tmp_path / 'ivf.npz'))
+
+    queries = rng.normal(size=(5, DIM))
+    for a, b in zip(index.search(queries, k=5), loaded.search(queries, k=5)):
+        np.testing.assert_array_equal(a, b)
@@ -0,0 +1,32 @@
+import numpy as np
+
+import batching
+from batching import count_tokens, split_by_tokens, merge_pieces, prepare_inputs
+
+def test_fallback_estimate_never_undercounts(monkeypatch):
+    monkeypatch.setattr(batching, 'get_encoding', lambda embed_model: None)
+    cjk = '数据' * 5000
+    [n_tokens] = count_tokens([cjk])
+    assert n_tokens >= len(cjk)
+
+    pieces, sources, _ = prepare_inputs([cjk], max_tokens_per_item=8191, oversize_policy='split')
+    assert len(pieces) > 1 and set(sources) == {0}
+    assert ''.join(pieces) == cjk
+    assert all(len(p.encode('utf-8')) <= 8191 for p in pieces)
+
+def test_split_by_tokens_fallback_keeps_characters(monkeypatch):
+    monkeypatch.setattr(batching, 'get_encoding', lambda embed_model: None)
+    text = 'aé数' * 100
+    pieces = split_by_tokens(text, 7)
+    assert ''.join(pieces) == text
+    assert all(0 < len(p.encode('utf-8')) <= 7 for p in pieces)
+
+def test_merge_keeps_unsplit_empty_chunk():
+    v = np.array([0.6, 0.8], dtype=np.float32)
+    [merged] = merge_pieces([v], [0], [0], 1)
+    np.testing.assert_array_equal(merged, v)
+
+def test_merge_weights_split_pieces():
+    a, b = np.array([1.0, 0.0]), np.array([0.0, 1.0])
+    [merged] = merge_pieces([a, b], [0, 0], [3, 1], 1)
+    np.testing.assert_allclose(merged, [0.75, 0.25])
@@ -0,0 +1,39 @@
+import pytest
+
+from batching import count_tokens
+from chunking import Chunker
+
+def sentences(n):
+    return ' '.join(f"Sentence {i} explains step {i} of posting an invoice batch." for i in range(n))
+
+@pytest.mark.parametrize('max_tokens, overlap_tokens', [(64, 0), (128, 32), (300, 100)])
+def test_chunks_stay_within_the_token_limit(max_tokens, overlap_tokens):
+    long_sentence = ' '.join(['a', 'invoice', 'reconciliation'] * 100) + '.'
+    text = sentences(40) + ' ' + long_sentence + ' ' + sentences(5)
+    chunker = Chunker(max_tokens=max_tokens, overlap_tokens=overlap_tokens, clean=False)
+    chunks = chunker.chunk_text(text)
+
+    assert len(chunks) > 1
+    assert max(count_tokens(chunks)) <= max_tokens
+    # Nothing is lost: every word of the text is in some chunk
+    assert set(text.split()) == set(' '.join(chunks).split())
+
+def test_consecutive_chunks_overlap():
+    chunks = Chunker(max_tokens=200, overlap_tokens=60, clean=False).chunk_text(sentences(20))
+    for previous, chunk in zip(chunks, chunks[1:]):
+        last_sentence = previous.rsplit('. ', 1)[-1]
+        assert chunk.startswith(last_sentence)
+
+def test_pages_are_recorded():
+    chunker = Chunker(max_tokens=150, overlap_tokens=0)
+    pages = [{'file': 'manual.pdf', 'path': 'manual.pdf', 'page': p, 'text': sentences(3), 'images': []}
+             for p in range(1, 5)]
+    chunks = list(chunker.chunk_pages(pages))
+
+    assert chunks[0]['page_start'] == 1 and chunks[-1]['page_end'] == 4
+    assert all(c['page_start'] <= c['page_end'] for c in chunks)
+    assert all(c['file'] == 'manual' and 'images' not in c for c in chunks)
+
+def test_overlap_must_be_smaller_than_the_limit():
+    with pytest.raises(ValueError):
+        Chunker(max_tokens=32, overlap_tokens=32)
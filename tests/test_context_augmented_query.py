@@ -0,0 +1,39 @@
+import importlib.util
+import os
+
+import numpy as np
+
+from embedding_backends import LocalBackend
+from embedding_store import EmbeddingStore
+
+spec = importlib.util.spec_from_file_location(
+    'context_augmented_query',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Newer OpenAI SDK',
+                 'context-augmented-query.py'))
+query = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(query)
+
+DIM = 32
+TEXTS = ['post an invoice in sales', 'create a bill of materials', 'receive a purchase order']
+
+class RecordingIndex:
+    """Stands in for an IVFIndex and records that it was searched."""
+
+    def __init__(self, store):
+        self.store = store
+        self.calls = 0
+
+    def search(self, query_embeddings, k):
+        self.calls += 1
+        return self.store.search(query_embeddings, k)
+
+def test_top_k_text_uses_the_given_backend_and_index():
+    backend = LocalBackend(dim=DIM)
+    store = EmbeddingStore(DIM, embed_model='local')
+    store.add(np.array(backend.embed(TEXTS, 'local')), [{'text': t} for t in TEXTS])
+    index = RecordingIndex(store)
+
+    text = query.get_top_k_results_text(store, 'bill of materials', n=1, index=index, backend=backend)
+
+    assert text == 'create a bill of materials'
+    assert index.calls == 1
@@ -0,0 +1,45 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import embedding_backends
+from create_embeddings import create_and_append_embeddings, retry_failed_embeddings, update_embeddings
+from embedding_scheduler import EmbeddingScheduler, RETRY_QUEUE_FILE
+from embedding_store import EmbeddingStore
+from manifest import Changes
+
+def test_update_without_path_column_raises():
+    legacy = pd.DataFrame({'file': ['a'], 'text': ['old text'], 'embedding': [[1.0, 0.0, 0.0]]})
+    store = EmbeddingStore.from_dataframe(legacy)
+    changes = Changes(added=[], modified=['a.htm'], deleted=[])
+
+    with pytest.raises(ValueError, match="'path'"):
+        update_embeddings(store, [{'file': 'a', 'text': 'new text'}], changes)
+    assert len(store) == 1
+
+def test_failed_chunks_are_queued_in_the_index_and_added_back(tmp_path, monkeypatch):
+    openai = pytest.importorskip('openai')
+    from mock_embeddings_server import MockEmbeddingsServer, mock_embedding
+
+    index = str(tmp_path / 'index')
+    chunks = [{'text': f"chunk {i}", 'path': f"p{i}.htm", 'headings': ['Intro']} for i in range(3)]
+    with MockEmbeddingsServer(dim=8, latency=0.0, scripted_statuses=[200, 400]) as server:
+        client = openai.OpenAI(base_url=server.base_url, api_key='mock', max_retries=0)
+        monkeypatch.setattr(embedding_backends, '_default_backend', embedding_backends.as_backend(client))
+        create_and_append_embeddings(chunks[:1], index_path=index)
+        create_and_append_embeddings(chunks[1:], index_path=index) # default scheduler, request fails
+
+        queue = os.path.join(index, RETRY_QUEUE_FILE)
+        assert os.path.exists(queue)
+        assert len(EmbeddingStore.open(index)) == 1
+
+        store = retry_failed_embeddings(EmbeddingScheduler(retry_queue_path=queue), index_path=index)
+
+    assert not os.path.exists(queue)
+    assert list(store.metadata['path']) == ['p0.htm', 'p1.htm', 'p2.htm']
+    assert [list(h) for h in store.metadata['headings']] == [['Intro']] * 3
+    expected = np.array([mock_embedding(c['text'], 8) for c in chunks])
+    expected /= np.linalg.norm(expected, axis=1, keepdims=True)
+    np.testing.assert_allclose(store.vectors, expected, rtol=1e-5)
@@ -0,0 +1,38 @@
+from dedup import Deduplicator, normalize_text
+
+FOOTER = 'Copyright 2023 Consona Corporation. All rights reserved. Send feedback on this topic to the docs team.'
+BODY = ('Sales orders are entered from the order entry screen, where the customer, ship-to address, '
+        'items and quantities are selected before the order is released to the warehouse for picking.')
+
+def chunk(text, path):
+    return {'text': text, 'path': path}
+
+def test_exact_and_near_duplicates_are_dropped():
+    dedup = Deduplicator(threshold=0.8)
+    kept = list(dedup.filter([chunk(FOOTER, 'a.htm'), chunk(FOOTER.upper(), 'b.htm'),
+                              chunk(BODY, 'a.htm'), chunk(BODY.replace('picking.', 'picking today.'), 'c.htm')]))
+
+    assert [c['text'] for c in kept] == [FOOTER, BODY]
+    assert (dedup.exact_duplicates, dedup.near_duplicates) == (1, 1)
+    assert [c['sources'] for c in kept] == [['a.htm', 'b.htm'], ['a.htm', 'c.htm']]
+    assert normalize_text('A  b, C!') == 'a b c'
+
+def test_state_is_reloaded_by_a_new_deduplicator(tmp_path):
+    first = Deduplicator(threshold=0.8)
+    list(first.filter([chunk(FOOTER, 'a.htm'), chunk(BODY, 'a.htm')]))
+    first.save(str(tmp_path))
+
+    second = Deduplicator(threshold=0.8).load(str(tmp_path))
+    kept = list(second.filter([chunk(FOOTER, 'b.htm'), chunk(BODY.replace('picking.', 'picking today.'), 'b.htm')]))
+
+    assert kept == []
+    assert sorted(second.sources.values()) == [['a.htm', 'b.htm'], ['a.htm', 'b.htm']]
+
+def test_remove_sources_forgets_chunks_without_sources():
+    dedup = Deduplicator()
+    list(dedup.filter([chunk(FOOTER, 'a.htm'), chunk(FOOTER, 'b.htm'), chunk(BODY, 'a.htm')]))
+
+    assert dedup.remove_sources(['a.htm']) == 1
+    assert list(dedup.sources.values()) == [['b.htm']]
+    # The forgotten chunk is new again, exactly and as a near copy
+    assert [c['text'] for c in dedup.filter([chunk(BODY, 'c.htm')])] == [BODY]
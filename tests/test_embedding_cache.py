@@ -0,0 +1,36 @@
+import time
+
+import numpy as np
+
+from embedding_cache import QueryCache
+
+MODEL = 'text-embedding-3-small'
+
+def test_least_recently_used_entries_are_evicted():
+    cache = QueryCache(max_entries=2)
+    cache.put_many(['a', 'b'], [[1.0, 0.0], [0.0, 1.0]], MODEL)
+    cache.get_many(['a'], MODEL) # 'a' is now the most recent
+    cache.put_many(['c'], [[1.0, 1.0]], MODEL)
+
+    a, b, c = cache.get_many(['a', 'b', 'c'], MODEL)
+    assert b is None and len(cache) == 2
+    np.testing.assert_allclose(a, [1.0, 0.0])
+    np.testing.assert_allclose(c, [2 ** -0.5, 2 ** -0.5], rtol=1e-6) # stored normalized
+
+def test_entries_expire_after_the_ttl():
+    cache = QueryCache(ttl=0.05)
+    cache.put_many(['a'], [[1.0, 0.0]], MODEL)
+    assert cache.get_many(['a'], MODEL)[0] is not None
+    time.sleep(0.1)
+
+    assert cache.get_many(['a'], MODEL) == [None]
+    assert (cache.hits, cache.misses, cache.expired, len(cache)) == (1, 1, 1, 0)
+
+def test_keys_include_model_dimensions_and_normalized_text():
+    cache = QueryCache(ignore_case=True)
+    cache.put_many(['How do I  post an invoice? '], [[1.0, 0.0]], MODEL, dimensions=256)
+
+    assert cache.get_many(['how do i post an invoice?'], MODEL, dimensions=256)[0] is not None
+    assert cache.get_many(['how do i post an invoice?'], MODEL) == [None]
+    assert cache.get_many(['how do i post an invoice?'], 'text-embedding-3-large', dimensions=256) == [None]
+    assert QueryCache().get_many(['anything'], MODEL) == [None]
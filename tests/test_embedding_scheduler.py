@@ -0,0 +1,72 @@
+import json
+import time
+
+import numpy as np
+import pytest
+
+openai = pytest.importorskip('openai')
+
+from embedding_scheduler import EmbeddingScheduler
+from mock_embeddings_server import MockEmbeddingsServer, mock_embedding
+
+DIM = 8
+
+def make_scheduler(server, **kwargs):
+    client = openai.OpenAI(base_url=server.base_url, api_key='mock', max_retries=0)
+    kwargs.setdefault('base_delay', 0.01)
+    return EmbeddingScheduler(client, **kwargs)
+
+def test_results_keep_input_order_under_concurrency():
+    batches = [[f"batch {b} text {i}" for i in range(3)] for b in range(20)]
+    with MockEmbeddingsServer(dim=DIM, latency=0.0, latency_jitter=0.05, seed=1) as server:
+        scheduler = make_scheduler(server, max_in_flight=8)
+        results = scheduler.embed_batches(batches, 'text-embedding-3-small', show_progress=False)
+
+    assert server.requests == len(batches)
+    for texts, embeds in zip(batches, results):
+        expected = np.array([mock_embedding(t, DIM) for t in texts])
+        np.testing.assert_allclose(np.array(embeds), expected, rtol=1e-6)
+
+def test_429_waits_for_retry_after():
+    with MockEmbeddingsServer(dim=DIM, latency=0.0, retry_after=0.3, scripted_statuses=[429]) as server:
+        scheduler = make_scheduler(server)
+        start = time.monotonic()
+        [embeds] = scheduler.embed_batches([['hello']], 'text-embedding-3-small', show_progress=False)
+        elapsed = time.monotonic() - start
+
+    assert elapsed >= 0.3
+    assert server.requests == 2
+    assert scheduler.retries == 1
+    np.testing.assert_allclose(embeds[0], mock_embedding('hello', DIM), rtol=1e-6)
+
+def test_client_errors_are_not_retried(tmp_path):
+    queue = tmp_path / 'failed.jsonl'
+    with MockEmbeddingsServer(dim=DIM, latency=0.0, scripted_statuses=[400]) as server:
+        scheduler = make_scheduler(server, retry_queue_path=str(queue))
+        results = scheduler.embed_batches([['bad input']], 'text-embedding-3-small', show_progress=False)
+
+    assert results == [None]
+    assert server.requests == 1
+    assert scheduler.retries == 0
+    assert scheduler.failures == 1
+    assert len(queue.read_text().splitlines()) == 1
+
+def test_exhausted_batches_are_queued_and_replayed(tmp_path):
+    queue = tmp_path / 'failed.jsonl'
+    with MockEmbeddingsServer(dim=DIM, latency=0.0, scripted_statuses=[500, 500]) as server:
+        scheduler = make_scheduler(server, max_retries=1, retry_queue_path=str(queue))
+        results = scheduler.embed_batches([['a', 'b']], 'text-embedding-3-small', show_progress=False,
+                                          metadata=[[{'path': 'a.htm'}, {'path': 'b.htm'}]], dimensions=DIM)
+        assert results == [None]
+
+        entries = [json.loads(line) for line in queue.read_text().splitlines()]
+        assert [(e['texts'], e['model'], e['kwargs'], e['metadata']) for e in entries] == \
+            [(['a', 'b'], 'text-embedding-3-small', {'dimensions': DIM}, [{'path': 'a.htm'}, {'path': 'b.htm'}])]
+
+        recovered = scheduler.retry_failed()
+
+    assert not queue.exists()
+    [(texts, embeds, metadata)] = recovered
+    assert texts == ['a', 'b']
+    assert metadata == [{'path': 'a.htm'}, {'path': 'b.htm'}]
+    np.testing.assert_allclose(np.array(embeds), [mock_embedding('a', DIM), mock_embedding('b', DIM)], rtol=1e-6)
@@ -0,0 +1,35 @@
+import numpy as np
+
+from create_embeddings import update_embeddings
+from embedding_store import EmbeddingStore
+from manifest import Changes
+
+DIM = 4
+
+def make_store(n=250, seed=0):
+    store = EmbeddingStore(DIM)
+    store.add(np.random.default_rng(seed).normal(size=(n, DIM)), [{'text': f"t{i}", 'path': f"p{i}.htm"}
+                                                                   for i in range(n)])
+    return store
+
+def test_opened_store_can_be_saved_in_place(tmp_path):
+    make_store().save(str(tmp_path))
+    opened = EmbeddingStore.open(str(tmp_path))
+    expected = np.array(opened.vectors)
+
+    opened.save(str(tmp_path))
+    np.testing.assert_array_equal(opened.vectors, expected) # the old map is still readable
+
+    reopened = EmbeddingStore.open(str(tmp_path))
+    np.testing.assert_array_equal(reopened.vectors, expected)
+    assert list(reopened.metadata['text']) == [f"t{i}" for i in range(250)]
+
+def test_update_saved_back_to_the_opened_index(tmp_path):
+    make_store().save(str(tmp_path))
+    opened = EmbeddingStore.open(str(tmp_path))
+
+    update_embeddings(opened, [], Changes([], [], ['p0.htm']), save_path=str(tmp_path))
+
+    reopened = EmbeddingStore.open(str(tmp_path))
+    assert len(reopened) == 249
+    assert 'p0.htm' not in set(reopened.metadata['path'])
@@ -0,0 +1,53 @@
+import os
+
+import pytest
+
+import extract_text
+from extract_text import decode_html, parse_html
+
+PAGES = [
+    '<html><head><title>T</title></head><body><h3>x<style>.a{}</style>y</h3><p>body</p></body></html>',
+    '<html><body><h1>a<!-- note -->b<script>var s;</script> c <b>d</b></h1><h2>  e  </h2></body></html>',
+]
+
+@pytest.mark.parametrize('page', PAGES)
+def test_lxml_matches_beautifulsoup(page):
+    pytest.importorskip('lxml')
+    assert parse_html(page, parser='lxml') == parse_html(page, parser='bs4')
+
+def test_heading_text_skips_styles():
+    pytest.importorskip('lxml')
+    assert parse_html(PAGES[0], parser='lxml')['headings'] == ['xy']
+
+@pytest.fixture(autouse=True)
+def fresh_encoding_cache(monkeypatch):
+    monkeypatch.setattr(extract_text, '_directory_encodings', {})
+
+def test_cp1252_after_a_long_ascii_prefix():
+    raw = b'<html><body><p>' + b'plain text ' * 10000 + 'café résumé'.encode('cp1252') + b'</p></body></html>'
+    text, encoding = decode_html(raw, 'docs')
+    assert encoding == 'cp1252'
+    assert 'café résumé' in text and '\ufffd' not in text
+
+def test_small_cp1252_file_after_an_ascii_detection():
+    decode_html(b'<p>' + b'ascii only ' * 10000 + 'naïve'.encode('cp1252') + b'</p>', 'docs')
+    text, _ = decode_html('<p>Hé café</p>'.encode('cp1252'), 'docs')
+    assert text == '<p>Hé café</p>'
+    assert 'ascii' not in {e.lower() for e in extract_text._directory_encodings.values()}
+
+def test_confident_detection_is_kept():
+    text = 'Привет мир, это тест ' * 20
+    decoded, encoding = decode_html(text.encode('cp1251'))
+    assert encoding.lower() in ('windows-1251', 'cp1251')
+    assert decoded == text
+
+def test_unsupported_files_fail_alone(tmp_path):
+    (tmp_path / 'page.htm').write_text('<html><head><title>Page</title></head><body><p>text</p></body></html>')
+    (tmp_path / 'notes.txt').write_text('not extracted')
+
+    failed = []
+    records = list(extract_text.process_files_parallel(str(tmp_path), extensions=('.htm', '.txt'), workers=1,
+                                                       errors=failed))
+    assert [r['title'] for r in records] == ['Page']
+    assert [(os.path.basename(path), message) for path, message in failed] == \
+        [('notes.txt', 'ValueError: No extractor for .txt')]
@@ -0,0 +1,28 @@
+import numpy as np
+
+from hybrid_search import hybrid_search, reciprocal_rank_fusion
+from lexical_index import BM25Index
+
+def test_reciprocal_rank_fusion_scores():
+    lexical = np.array([[3, 1, -1]])
+    vector = np.array([[1, 2, 3]])
+    indices, scores = reciprocal_rank_fusion([lexical, vector], k=4, rrf_k=60)
+
+    expected = {3: 1 / 61 + 1 / 63, 1: 1 / 62 + 1 / 61, 2: 1 / 62}
+    assert list(indices[0]) == [1, 3, 2, -1]
+    np.testing.assert_allclose(scores[0][:3], [expected[1], expected[3], expected[2]], rtol=1e-6)
+
+def test_ties_go_to_the_lower_row_id_and_weights_apply():
+    indices, _ = reciprocal_rank_fusion([np.array([[5]]), np.array([[2]])], k=2)
+    assert list(indices[0]) == [2, 5]
+    indices, _ = reciprocal_rank_fusion([np.array([[5]]), np.array([[2]])], k=2, weights=[2.0, 1.0])
+    assert list(indices[0]) == [5, 2]
+
+def test_hybrid_search_fuses_both_rankings():
+    bm25 = BM25Index().build(['alpha', 'beta', 'gamma'])
+    def vector_search(queries, k):
+        return np.tile(np.array([[2, 1, 0]])[:, :k], (len(queries), 1)), None
+
+    indices, _ = hybrid_search(vector_search, bm25, ['alpha'], np.zeros((1, 2)), k=3)
+    # row 0 is first lexically and last by vector; row 2 is first by vector only
+    assert list(indices[0]) == [0, 2, 1]
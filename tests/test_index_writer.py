@@ -0,0 +1,62 @@
+import numpy as np
+
+from embedding_store import EmbeddingStore
+from index_writer import IndexWriter
+
+DIM = 4
+
+def pdf_rows(n, start=0):
+    return [{'text': f"pdf page {i}", 'path': f"doc{i}.pdf", 'headings': f"Title {i}", 'page_start': 1, 'page_end': 1}
+            for i in range(start, start + n)]
+
+def html_rows(n, start=0):
+    return [{'text': f"html chunk {i}", 'path': f"page{i}.htm", 'headings': ['Intro', f"Part {i}"],
+             'heading_levels': [1, 2], 'images': ['a.png']} for i in range(start, start + n)]
+
+def vectors(n, seed):
+    return np.random.default_rng(seed).normal(size=(n, DIM)).astype(np.float32)
+
+def test_pdf_and_html_shards_are_finalized_together(tmp_path):
+    with IndexWriter(str(tmp_path), shard_rows=2) as writer:
+        writer.append(vectors(2, 0), pdf_rows(2))  # a shard of PDF rows only
+        writer.append(vectors(3, 1), html_rows(3)) # shards of HTML rows only
+
+    # Appending to the finalized index mixes them again
+    with IndexWriter(str(tmp_path), shard_rows=2) as writer:
+        writer.append(vectors(2, 2), pdf_rows(2, start=2))
+
+    metadata = EmbeddingStore.open(str(tmp_path)).metadata
+    assert len(metadata) == 7
+    assert [list(h) for h in metadata['headings']] == [
+        ['Title 0'], ['Title 1'], ['Intro', 'Part 0'], ['Intro', 'Part 1'], ['Intro', 'Part 2'],
+        ['Title 2'], ['Title 3']]
+    assert [len(images) for images in metadata['images']] == [0, 0, 1, 1, 1, 0, 0]
+    assert [list(levels) for levels in metadata['heading_levels']] == [[], [], [1, 2], [1, 2], [1, 2], [], []]
+
+def test_sources_are_rewritten_when_finalizing(tmp_path):
+    sources = {'c0': ['a.htm'], 'c1': ['b.htm']}
+    with IndexWriter(str(tmp_path), shard_rows=1, sources=sources) as writer:
+        writer.append(vectors(2, 0), [{'text': 'x', 'chunk_id': 'c0', 'sources': list(sources['c0'])},
+                                      {'text': 'y', 'chunk_id': 'c1', 'sources': list(sources['c1'])}])
+        sources['c0'].append('c.htm') # a duplicate found after the shard was written
+
+    metadata = EmbeddingStore.open(str(tmp_path)).metadata
+    assert [list(s) for s in metadata['sources']] == [['a.htm', 'c.htm'], ['b.htm']]
+
+def test_rerun_after_an_interrupted_update_indexes_each_file_once(tmp_path):
+    with IndexWriter(str(tmp_path)) as writer:
+        writer.append(vectors(4, 0), [{'text': f"v1 {i}", 'path': f"p{i}.htm"} for i in range(4)])
+
+    # Update of p0 and p1 interrupted after a shard was written, before close
+    update = [{'text': f"v2 {i}", 'path': f"p{i}.htm"} for i in range(2)]
+    writer = IndexWriter(str(tmp_path), shard_rows=1, remove_paths=['p0.htm', 'p1.htm'])
+    writer.append(vectors(2, 1), update)
+    del writer
+
+    with IndexWriter(str(tmp_path), shard_rows=1, remove_paths=['p0.htm', 'p1.htm']) as writer:
+        writer.append(vectors(2, 1), update)
+
+    store = EmbeddingStore.open(str(tmp_path))
+    assert len(store) == 4
+    assert sorted(zip(store.metadata['path'], store.metadata['text'])) == [
+        ('p0.htm', 'v2 0'), ('p1.htm', 'v2 1'), ('p2.htm', 'v1 2'), ('p3.htm', 'v1 3')]
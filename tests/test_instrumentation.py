@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+openai = pytest.importorskip('openai')
+
+from embedding_cache import EmbeddingCache, QueryCache
+from embedding_scheduler import EmbeddingScheduler
+from instrumentation import metrics
+from mock_embeddings_server import MockEmbeddingsServer
+
+DIM = 8
+
+@pytest.fixture
+def enabled_metrics():
+    metrics.reset()
+    metrics.enable()
+    yield metrics
+    metrics.disable()
+    metrics.reset()
+
+def test_scheduler_records_requests_retries_and_tokens(enabled_metrics):
+    with MockEmbeddingsServer(dim=DIM, latency=0.0, retry_after=0.0, scripted_statuses=[429]) as server:
+        client = openai.OpenAI(base_url=server.base_url, api_key='mock', max_retries=0)
+        scheduler = EmbeddingScheduler(client, base_delay=0.01)
+        scheduler.embed_batches([['a', 'b']], 'text-embedding-3-small', token_counts=[7], show_progress=False)
+
+    snapshot = enabled_metrics.snapshot()
+    assert snapshot['counters']['embedding_scheduler.retries'] == 1
+    assert snapshot['counters']['embedding_scheduler.tokens'] == 7
+    assert snapshot['counters']['embedding_scheduler.texts'] == 2
+    assert snapshot['histograms']['embedding_scheduler.request.seconds']['count'] == 2
+
+def test_caches_record_hits_and_misses(enabled_metrics):
+    cache = EmbeddingCache(':memory:')
+    cache.put_many(['a'], [np.ones(DIM)], 'model')
+    cache.get_many(['a', 'b'], 'model')
+    cache.close()
+
+    query_cache = QueryCache()
+    query_cache.put_many(['q'], [np.ones(DIM)], 'model')
+    query_cache.get_many(['q', 'q', 'r'], 'model')
+
+    counters = enabled_metrics.snapshot()['counters']
+    assert (counters['embedding_cache.hits'], counters['embedding_cache.misses']) == (1, 1)
+    assert (counters['query_cache.hits'], counters['query_cache.misses']) == (2, 1)
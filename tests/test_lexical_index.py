@@ -0,0 +1,49 @@
+import math
+
+import numpy as np
+
+from chunking import clean_chunk_text
+from lexical_index import BM25Index, tokenize
+
+TEXTS = [
+    'post an invoice in sales',
+    'upgrade the server to v7.5 before posting',
+    'error ERR-1042 when posting an invoice',
+    'sales order entry',
+]
+
+def test_query_versions_match_cleaned_chunks():
+    bm25 = BM25Index().build([clean_chunk_text(t) for t in TEXTS])
+    indices, _ = bm25.search(['v7.5'], k=2)
+    assert list(indices[0]) == [1, -1]
+    assert tokenize('ERR-1042 on M2M-SO') == ['err-1042', 'on', 'm2m-so']
+
+def test_scores_follow_the_bm25_formula():
+    bm25 = BM25Index(k1=1.2, b=0.75).build(TEXTS)
+    lengths = [len(tokenize(t)) for t in TEXTS]
+    avgdl = sum(lengths) / len(lengths)
+
+    def weight(term, row):
+        n = sum(term in tokenize(t) for t in TEXTS)
+        tf = tokenize(TEXTS[row]).count(term)
+        idf = math.log1p((len(TEXTS) - n + 0.5) / (n + 0.5))
+        return idf * tf * 2.2 / (tf + 1.2 * (0.25 + 0.75 * lengths[row] / avgdl))
+
+    indices, scores = bm25.search(['invoice sales'], k=4)
+    expected = {row: weight('invoice', row) + weight('sales', row) for row in range(4)}
+    expected = {row: s for row, s in expected.items() if s > 0}
+    assert list(indices[0][:len(expected)]) == sorted(expected, key=lambda r: (-expected[r], r))
+    np.testing.assert_allclose(scores[0][:len(expected)], sorted(expected.values(), reverse=True), rtol=1e-5)
+    assert list(indices[0][len(expected):]) == [-1] * (4 - len(expected))
+
+def test_rows_restrict_the_results():
+    bm25 = BM25Index().build(TEXTS)
+    indices, _ = bm25.search(['invoice'], k=3, rows=[2, 3])
+    assert list(indices[0]) == [2, -1, -1]
+
+def test_save_and_load(tmp_path):
+    bm25 = BM25Index().build(TEXTS)
+    bm25.save(str(tmp_path))
+    loaded = BM25Index.load(str(tmp_path))
+    for a, b in zip(bm25.search(['posting an invoice'], k=4), loaded.search(['posting an invoice'], k=4)):
+        np.testing.assert_array_equal(a, b)
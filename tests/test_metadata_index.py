@@ -0,0 +1,46 @@
+import numpy as np
+
+from embedding_store import EmbeddingStore
+from metadata_index import MetadataIndex
+
+ROWS = [
+    {'text': 'a', 'folder': 'Sales', 'file': 'invoices.htm', 'title': 'Posting Invoices', 'headings': ['Sales', 'Post']},
+    {'text': 'b', 'folder': 'Sales/Orders', 'file': 'orders.htm', 'title': 'Sales Orders', 'headings': ['Orders']},
+    {'text': 'c', 'folder': 'SalesOld', 'file': 'invoices.htm', 'title': 'Old invoices', 'headings': []},
+    {'text': 'd', 'folder': '.', 'file': 'index.htm', 'title': None, 'headings': None},
+]
+
+def make_store():
+    store = EmbeddingStore(dim=4)
+    store.add(np.eye(4), ROWS)
+    return store
+
+def test_predicates():
+    store = make_store()
+    assert list(store.select_rows(folder_prefix='Sales')) == [0, 1]
+    assert list(store.select_rows(folder_prefix='Sales\\Orders\\')) == [1]
+    assert list(store.select_rows(folder_prefix='')) == [0, 1, 2, 3]
+    assert list(store.select_rows(files='invoices')) == [0, 2]
+    assert list(store.select_rows(files=['orders.htm', 'index'])) == [1, 3]
+    assert list(store.select_rows(title_contains='INVOICE')) == [0, 2]
+    assert list(store.select_rows(heading_contains='post')) == [0]
+    assert store.select_rows() is None
+
+def test_predicates_are_combined_with_and():
+    store = make_store()
+    assert list(store.select_rows(folder_prefix='Sales', title_contains='invoice')) == [0]
+    assert list(store.select_rows(files='orders', heading_contains='post')) == []
+
+def test_search_is_restricted_to_the_selected_rows():
+    store = make_store()
+    rows = store.select_rows(files='invoices')
+    indices, _ = store.search(np.eye(4)[1:2], k=2, rows=rows)
+    assert sorted(indices[0]) == [0, 2]
+
+def test_saved_index_gives_the_same_rows(tmp_path):
+    store = make_store()
+    store.save(str(tmp_path))
+    loaded = MetadataIndex.load(str(tmp_path))
+    built = MetadataIndex.build(store.metadata)
+    for kwargs in ({'folder_prefix': 'Sales'}, {'files': 'invoices'}, {'heading_contains': 'orders'}):
+        np.testing.assert_array_equal(loaded.select(**kwargs), built.select(**kwargs))
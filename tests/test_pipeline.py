@@ -0,0 +1,104 @@
+import numpy as np
+import pytest
+
+openai = pytest.importorskip('openai')
+
+from benchmarks import write_simple_pdf
+from chunking import Chunker
+from dedup import Deduplicator
+from embedding_cache import EmbeddingCache
+from embedding_scheduler import EmbeddingScheduler
+from embedding_store import EmbeddingStore
+from mock_embeddings_server import MockEmbeddingsServer
+from pipeline import run_pipeline
+
+DIM = 8
+
+def write_page(folder, name, body):
+    (folder / name).write_text(f"<html><head><title>{name}</title></head><body><h1>{name}</h1><p>{body}</p></body></html>")
+
+def run(server, folder, index, **kwargs):
+    client = openai.OpenAI(base_url=server.base_url, api_key='mock', max_retries=0)
+    kwargs.setdefault('chunker', Chunker())
+    return run_pipeline(str(folder), str(index), workers=1, scheduler=EmbeddingScheduler(client, base_delay=0.01),
+                        **kwargs)
+
+def test_cache_is_used_from_the_embedding_thread(tmp_path):
+    corpus = tmp_path / 'corpus'
+    corpus.mkdir()
+    for i in range(3):
+        write_page(corpus, f"p{i}.htm", f"page number {i} about invoices")
+
+    cache = EmbeddingCache(str(tmp_path / 'cache.sqlite'))
+    with MockEmbeddingsServer(dim=DIM, latency=0.0) as server:
+        run(server, corpus, tmp_path / 'first', cache=cache)
+        requests = server.requests
+        cache.reset_stats()
+        stats = run(server, corpus, tmp_path / 'second', cache=cache)
+
+    assert stats['embedded'] == 3
+    assert server.requests == requests # everything came from the cache
+    assert (cache.hits, cache.misses) == (3, 0)
+    cache.close()
+
+def test_files_replace_their_old_chunks(tmp_path):
+    corpus, index = tmp_path / 'corpus', tmp_path / 'index'
+    corpus.mkdir()
+    for i in range(3):
+        write_page(corpus, f"p{i}.htm", f"page number {i} about invoices")
+
+    with MockEmbeddingsServer(dim=DIM, latency=0.0) as server:
+        run(server, corpus, index)
+        write_page(corpus, 'p1.htm', 'rewritten page about purchase orders')
+        (corpus / 'p2.htm').unlink()
+        run(server, corpus, index, files=['p1.htm'], remove=['p2.htm'])
+
+    store = EmbeddingStore.open(str(index))
+    assert sorted(store.metadata['path']) == ['p0.htm', 'p1.htm']
+    [text] = store.metadata.loc[store.metadata['path'] == 'p1.htm', 'text']
+    assert 'purchase orders' in text
+    assert np.allclose(np.linalg.norm(store.vectors, axis=1), 1.0)
+
+def test_pdf_chunks_record_their_pages(tmp_path):
+    corpus = tmp_path / 'corpus'
+    corpus.mkdir()
+    write_simple_pdf(str(corpus / 'manual.pdf'), [f"Page {i} explains how to post invoice batch {i}." for i in range(6)])
+
+    with MockEmbeddingsServer(dim=DIM, latency=0.0) as server:
+        stats = run(server, corpus, tmp_path / 'index', chunker=Chunker(max_tokens=20, overlap_tokens=0))
+
+    metadata = EmbeddingStore.open(str(tmp_path / 'index')).metadata
+    assert stats['documents'] == 1 and len(metadata) > 1
+    assert metadata['page_start'].iloc[0] == 1 and metadata['page_end'].iloc[-1] == 6
+    assert (metadata['page_start'] <= metadata['page_end']).all()
+
+def test_dedup_keeps_chunks_that_still_have_a_source(tmp_path):
+    corpus, index = tmp_path / 'corpus', tmp_path / 'index'
+    corpus.mkdir()
+    for name in ('a.htm', 'b.htm'):
+        (corpus / name).write_text('<html><body><p>Copyright notice shared by every page.</p></body></html>')
+    write_page(corpus, 'c.htm', 'posting invoices')
+
+    def paths_and_sources():
+        metadata = EmbeddingStore.open(str(index)).metadata
+        return sorted((p, sorted(s)) for p, s in zip(metadata['path'], metadata['sources']))
+
+    with MockEmbeddingsServer(dim=DIM, latency=0.0) as server:
+        run(server, corpus, index, dedup=Deduplicator())
+        assert paths_and_sources() == [('a.htm', ['a.htm', 'b.htm']), ('c.htm', ['c.htm'])]
+
+        # Re-processing an unchanged file with a fresh deduplicator adds nothing
+        run(server, corpus, index, dedup=Deduplicator(), files=['b.htm'])
+        assert paths_and_sources() == [('a.htm', ['a.htm', 'b.htm']), ('c.htm', ['c.htm'])]
+
+        # Deleting the first source keeps the chunk for the other one
+        (corpus / 'a.htm').unlink()
+        run(server, corpus, index, dedup=Deduplicator(), remove=['a.htm'])
+        assert paths_and_sources() == [('b.htm', ['b.htm']), ('c.htm', ['c.htm'])]
+
+        # Changing the last source drops it
+        write_page(corpus, 'b.htm', 'receiving purchase orders')
+        run(server, corpus, index, dedup=Deduplicator(), files=['b.htm'])
+        assert paths_and_sources() == [('b.htm', ['b.htm']), ('c.htm', ['c.htm'])]
+        texts = EmbeddingStore.open(str(index)).metadata['text']
+        assert not any('Copyright' in t for t in texts)
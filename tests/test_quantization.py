@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+from embedding_store import EmbeddingStore
+from quantization import QuantizedIndex, build_quantized_index, popcount
+
+DIM = 64
+
+def random_store(n=500, seed=0):
+    rng = np.random.default_rng(seed)
+    store = EmbeddingStore(dim=DIM)
+    store.add(rng.normal(size=(n, DIM)), [{'text': str(i)} for i in range(n)])
+    # Queries close to some rows, as a question is to the chunks answering it
+    return store, store.vectors[:10] + 0.1 * rng.normal(size=(10, DIM))
+
+def test_popcount():
+    x = np.array([0, 1, 3, 255, 128], dtype=np.uint8)
+    np.testing.assert_array_equal(popcount(x), [0, 1, 2, 8, 1])
+
+@pytest.mark.parametrize('kind', ['float16', 'int8', 'binary'])
+def test_reranked_scores_are_exact(kind):
+    store, queries = random_store()
+    index = build_quantized_index(store, kind=kind, oversample=10)
+    indices, scores = index.search(queries, k=5)
+
+    exact = store.match_queries(queries) @ store.vectors.T
+    np.testing.assert_allclose(scores, np.take_along_axis(exact, indices, axis=1), rtol=1e-5)
+    # Every kind finds the row each query was drawn near; the finer ones the exact top 5
+    np.testing.assert_array_equal(indices[:, 0], np.arange(10))
+    if kind != 'binary':
+        np.testing.assert_array_equal(indices, store.search(queries, k=5)[0])
+
+@pytest.mark.parametrize('kind, tolerance', [('float16', 1e-3), ('int8', 0.05)])
+def test_approximate_scores_are_close(kind, tolerance):
+    store, queries = random_store()
+    index = build_quantized_index(store, kind=kind)
+    queries = store.match_queries(queries)
+    np.testing.assert_allclose(index.approximate_scores(queries), queries @ store.vectors.T, atol=tolerance)
+
+def test_binary_scores_follow_hamming_distance():
+    store = EmbeddingStore(dim=8)
+    store.add(np.array([[1.0] * 8, [1.0] * 4 + [-1.0] * 4, [-1.0] * 8]), [{'text': str(i)} for i in range(3)])
+    index = build_quantized_index(store, kind='binary')
+    np.testing.assert_allclose(index.approximate_scores(np.ones((1, 8), dtype=np.float32)), [[1.0, 0.0, -1.0]])
+
+def test_save_and_load(tmp_path):
+    store, queries = random_store()
+    index = build_quantized_index(store, kind='int8')
+    index.save(str(tmp_path))
+    loaded = QuantizedIndex.load(store, str(tmp_path), kind='int8')
+    for a, b in zip(index.search(queries, k=5), loaded.search(queries, k=5)):
+        np.testing.assert_array_equal(a, b)
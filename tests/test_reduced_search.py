@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+from embedding_store import EmbeddingStore
+from reduced_search import ReducedIndex, build_reduced_index
+
+DIM = 64
+
+def low_rank_store(n=400, rank=8, seed=0):
+    # Rows that live (almost) in a low-dimensional subspace, so a reduced
+    # first pass keeps the ranking
+    rng = np.random.default_rng(seed)
+    basis = rng.normal(size=(rank, DIM))
+    vectors = rng.normal(size=(n, rank)) @ basis + 0.01 * rng.normal(size=(n, DIM))
+    store = EmbeddingStore(dim=DIM)
+    store.add(vectors, [{'text': str(i)} for i in range(n)])
+    return store, rng.normal(size=(10, rank)) @ basis
+
+@pytest.mark.parametrize('method', ['prefix', 'pca'])
+def test_reranked_results_match_exact_search(method):
+    store, queries = low_rank_store()
+    index = build_reduced_index(store, method=method, dim=16, oversample=8)
+    indices, scores = index.search(queries, k=5)
+
+    exact = store.match_queries(queries) @ store.vectors.T
+    np.testing.assert_allclose(scores, np.take_along_axis(exact, indices, axis=1), rtol=1e-5)
+    exact_indices, _ = store.search(queries, k=5)
+    recall = sum(len(np.intersect1d(e, a)) for e, a in zip(exact_indices, indices)) / exact_indices.size
+    assert recall >= 0.95
+
+def test_unreranked_scores_use_the_reduced_vectors():
+    store, queries = low_rank_store()
+    index = build_reduced_index(store, method='prefix', dim=16)
+    _, scores = index.search(queries, k=3, rerank=False)
+
+    reduced = index.project(store.vectors)
+    np.testing.assert_allclose(reduced, store.vectors[:, :16] / np.linalg.norm(store.vectors[:, :16], axis=1,
+                                                                                 keepdims=True), rtol=1e-5)
+    expected = np.sort(index.project(store.match_queries(queries)) @ reduced.T, axis=1)[:, ::-1][:, :3]
+    np.testing.assert_allclose(scores, expected, rtol=1e-5)
+
+def test_dimension_must_be_reduced():
+    store, _ = low_rank_store()
+    with pytest.raises(ValueError, match='smaller'):
+        ReducedIndex(store, dim=DIM)
@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+
+from embedding_store import EmbeddingStore
+from sharded_search import ShardedSearch, merge_top_k
+
+DIM = 16
+
+def random_store(n, seed=0):
+    rng = np.random.default_rng(seed)
+    store = EmbeddingStore(dim=DIM)
+    if n:
+        store.add(rng.normal(size=(n, DIM)), [{'text': str(i)} for i in range(n)])
+    return store, rng.normal(size=(7, DIM))
+
+@pytest.mark.parametrize('workers, shard_rows', [(1, 10), (4, None), (4, 7), (3, 1000)])
+def test_sharded_results_equal_serial_results(workers, shard_rows):
+    store, queries = random_store(103)
+    with ShardedSearch(store, workers=workers, shard_rows=shard_rows) as sharded:
+        indices, scores = sharded.search(queries, k=5)
+
+    expected_indices, expected_scores = store.search(queries, k=5)
+    np.testing.assert_array_equal(indices, expected_indices)
+    np.testing.assert_allclose(scores, expected_scores, rtol=1e-6)
+
+def test_shards_cover_every_row_once():
+    store, _ = random_store(10)
+    assert ShardedSearch(store, workers=3).shards() == [(0, 4), (4, 8), (8, 10)]
+    assert ShardedSearch(store, workers=2, max_shard_rows=3).shards() == [(0, 3), (3, 6), (6, 9), (9, 10)]
+
+def test_merge_top_k():
+    indices = [np.array([[0, 1]]), np.array([[10, 11]])]
+    scores = [np.array([[0.9, 0.1]]), np.array([[0.5, 0.4]])]
+    merged_indices, merged_scores = merge_top_k(indices, scores, 3)
+    np.testing.assert_array_equal(merged_indices, [[0, 10, 11]])
+    np.testing.assert_allclose(merged_scores, [[0.9, 0.5, 0.4]])